@@ -8,6 +8,12 @@ from django.template.response import TemplateResponse
 from django.utils.html import format_html
 
 from .models import RequestLog, IpAddress
+from .paginator import EstimatedCountPaginator, count_rows
+from .retention import keep_latest, purge_older_than
+from .settings import REQUEST_TRACK_SETTINGS
+from .tasks import keep_last_logs, purge_logs_before
+
+MAINTENANCE_TASK_SESSION_KEY = "request_track_maintenance_task"
 
 
 class UserLoggedInFilter(admin.SimpleListFilter):
@@ -76,6 +82,7 @@ class RequestLogAdmin(admin.ModelAdmin):
         "method",
         "truncated_route",
         "status_code",
+        "duration",
         "requested_at",
     )
     list_filter = (
@@ -84,25 +91,37 @@ class RequestLogAdmin(admin.ModelAdmin):
         "requested_at",
         UserLoggedInFilter,
         "app_name",
+        "pattern",
     )
     readonly_fields = (
         "ip",
         "ip_address",
         "user",
         "user_agent",
+        "agent",
         "route",
+        "pattern",
         "method",
         "query_params",
         "status_code",
         "requested_at",
         "app_name",
         "headers",
+        "header_set",
+        "duration",
+        "response_size",
+        "request_size",
     )
     search_fields = ("route", "user__username", "ip__ip", "ip_address")
     date_hierarchy = "requested_at"
     list_per_page = 50
+    list_select_related = ("user",)
     ordering = ("-requested_at",)
 
+    # Large log tables are not counted exactly (see paginator.py)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
     # Custom template with maintenance buttons
     change_list_template = "request_track/admin/requestlog_change_list.html"
 
@@ -164,34 +183,71 @@ class RequestLogAdmin(admin.ModelAdmin):
         context = {
             **self.admin_site.each_context(request),
             "title": "Request Log Maintenance",
-            "log_count": RequestLog.objects.count(),
+            "log_count": count_rows(RequestLog.objects.all()),
             "opts": self.model._meta,
+            "task": self.maintenance_task(request),
         }
         return TemplateResponse(
             request, "request_track/admin/requestlog_maintenance.html", context
         )
 
-    def remove_older_than_week(self, request: HttpRequest) -> HttpResponseRedirect:
-        """Remove request logs older than a week."""
-        cutoff = now() - timedelta(weeks=1)
-        deleted, _ = RequestLog.objects.filter(requested_at__lt=cutoff).delete()
+    def maintenance_task(self, request: HttpRequest) -> dict | None:
+        """Describe the maintenance task started from this session, if any."""
+        task_id = request.session.get(MAINTENANCE_TASK_SESSION_KEY)
+        if task_id is None:
+            return None
+        result = keep_last_logs.AsyncResult(task_id)
+        if result.ready():
+            del request.session[MAINTENANCE_TASK_SESSION_KEY]
+        info = result.info if isinstance(result.info, dict) else {}
+        return {
+            "state": result.state,
+            "running": not result.ready(),
+            "deleted": info.get("deleted"),
+        }
+
+    def dropped_message(self, dropped: list[str]) -> str:
+        """Describe the partitions dropped by a purge."""
+        if not dropped:
+            return ""
+        return f" {len(dropped)} partitions were dropped: {', '.join(dropped)}."
+
+    def start_maintenance_task(
+        self, request: HttpRequest, result, message: str
+    ) -> HttpResponseRedirect:
+        """Remember a started maintenance task and show its progress page."""
+        request.session[MAINTENANCE_TASK_SESSION_KEY] = result.id
+        self.message_user(request, message, messages.INFO)
+        return HttpResponseRedirect("../maintenance/")
+
+    def remove_older_than(
+        self, request: HttpRequest, age: timedelta, label: str
+    ) -> HttpResponseRedirect:
+        """Remove request logs older than ``age``."""
+        cutoff = now() - age
+        if REQUEST_TRACK_SETTINGS.get("MAINTENANCE_ASYNC", False):
+            return self.start_maintenance_task(
+                request,
+                purge_logs_before.delay(cutoff.isoformat()),
+                f"Deleting logs older than {label} in the background.",
+            )
+
+        deleted, dropped = purge_older_than(cutoff)
         self.message_user(
             request,
-            f"{deleted} logs older than one week were deleted.",
+            f"{deleted} logs older than {label} were deleted."
+            + self.dropped_message(dropped),
             messages.SUCCESS,
         )
         return HttpResponseRedirect("../")
 
+    def remove_older_than_week(self, request: HttpRequest) -> HttpResponseRedirect:
+        """Remove request logs older than a week."""
+        return self.remove_older_than(request, timedelta(weeks=1), "one week")
+
     def remove_older_than_month(self, request: HttpRequest) -> HttpResponseRedirect:
         """Remove request logs older than a month."""
-        cutoff = now() - timedelta(days=30)
-        deleted, _ = RequestLog.objects.filter(requested_at__lt=cutoff).delete()
-        self.message_user(
-            request,
-            f"{deleted} logs older than one month were deleted.",
-            messages.SUCCESS,
-        )
-        return HttpResponseRedirect("../")
+        return self.remove_older_than(request, timedelta(days=30), "one month")
 
     def keep_last_n(self, request: HttpRequest) -> HttpResponseRedirect:
         """Keep only the most recent N logs."""
@@ -207,14 +263,18 @@ class RequestLogAdmin(admin.ModelAdmin):
             )
             n = 1000
 
-        ids_to_keep = RequestLog.objects.order_by("-requested_at").values_list(
-            "id", flat=True
-        )[:n]
-        deleted, _ = RequestLog.objects.exclude(id__in=list(ids_to_keep)).delete()
+        if REQUEST_TRACK_SETTINGS.get("MAINTENANCE_ASYNC", False):
+            return self.start_maintenance_task(
+                request,
+                keep_last_logs.delay(n),
+                f"Deleting all but the {n} most recent logs in the background.",
+            )
 
+        deleted, dropped = keep_latest(n)
         self.message_user(
             request,
-            f"{deleted} logs were deleted. Only the {n} most recent logs were kept.",
+            f"{deleted} logs were deleted. Only the {n} most recent logs were kept."
+            + self.dropped_message(dropped),
             messages.SUCCESS,
         )
         return HttpResponseRedirect("../")
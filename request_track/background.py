@@ -0,0 +1,263 @@
+"""
+Background writers that take request logging off the response path.
+
+The middleware only enqueues log dicts; a background worker drains the queue
+and hands batches to a sink function that does the actual writing. The sync
+middleware uses a daemon thread, the async middleware an asyncio task per
+event loop.
+"""
+
+import asyncio
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+import weakref
+from typing import Any, Awaitable, Callable
+
+from django.db import close_old_connections
+
+__all__ = ["BackgroundLogWriter", "AsyncLogFlusher", "stop_all_writers"]
+
+logger = logging.getLogger(__name__)
+
+# Marker put on the queue to stop the worker thread
+_STOP = object()
+
+# Every live writer, so queued logs can be drained at interpreter shutdown
+_writers: "weakref.WeakSet[BackgroundLogWriter]" = weakref.WeakSet()
+
+
+class BackgroundLogWriter:
+    """
+    Bounded queue of log dicts drained by a daemon thread.
+
+    The thread is started lazily on the first ``put`` (so it lives in the
+    process that serves requests, not in a pre-fork parent) and writes logs
+    in batches of up to ``batch_size``, waiting at most ``flush_interval``
+    seconds for a batch to fill.
+
+    Args:
+        sink: Callable receiving a list of log dicts to write
+        queue_size: Maximum number of queued logs
+        batch_size: Maximum number of logs handed to the sink at once
+        flush_interval: Seconds to wait for a batch to fill before writing it
+        drop_on_full: Drop logs when the queue is full instead of blocking
+        drain_timeout: Seconds ``stop`` waits for queued logs to be written
+    """
+
+    def __init__(
+        self,
+        sink: Callable[[list[dict[str, Any]]], Any],
+        queue_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        drop_on_full: bool = True,
+        drain_timeout: float = 5.0,
+    ):
+        self.sink = sink
+        self.batch_size = max(int(batch_size), 1)
+        self.flush_interval = flush_interval
+        self.drop_on_full = drop_on_full
+        self.drain_timeout = drain_timeout
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread: threading.Thread | None = None
+        self._pid: int | None = None
+        self._lock = threading.Lock()
+        _writers.add(self)
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._run, name="request-track-writer", daemon=True
+                )
+                self._thread.start()
+
+    def put(self, log: dict[str, Any]) -> bool:
+        """
+        Enqueue a log dict for writing.
+
+        Returns:
+            False if the log was dropped because the queue is full
+        """
+        self._ensure_started()
+        try:
+            if self.drop_on_full:
+                self._queue.put_nowait(log)
+            else:
+                self._queue.put(log)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def stop(self, timeout: float | None = None) -> None:
+        """Write everything queued so far and stop the worker thread."""
+        if timeout is None:
+            timeout = self.drain_timeout
+        thread = self._thread
+        if thread is None or not thread.is_alive() or self._pid != os.getpid():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        thread.join(timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        running = True
+        while running:
+            batch = []
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch.append(item)
+
+            # Collect more logs until the batch is full or the interval expires
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        item = self._queue.get(timeout=remaining)
+                    else:
+                        item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    running = False
+                    break
+                batch.append(item)
+
+            self._write(batch)
+
+    def _write(self, batch: list[dict[str, Any]]) -> None:
+        close_old_connections()
+        try:
+            self.sink(batch)
+        except Exception:
+            logger.exception("Failed to write %d request logs", len(batch))
+
+
+class AsyncLogFlusher:
+    """
+    Bounded ``asyncio.Queue`` of log dicts drained by a task on the event loop.
+
+    A queue and a long-lived flusher task are created for each event loop the
+    flusher is used from. Batches of up to ``batch_size`` logs are passed to
+    the async ``sink``. When the task is cancelled at loop shutdown, the logs
+    still queued are written before it exits.
+
+    Args:
+        sink: Coroutine function receiving a list of log dicts to write
+        queue_size: Maximum number of queued logs per event loop
+        batch_size: Maximum number of logs handed to the sink at once
+        flush_interval: Seconds to wait for a batch to fill before writing it
+        drop_on_full: Drop logs when the queue is full instead of waiting
+    """
+
+    def __init__(
+        self,
+        sink: Callable[[list[dict[str, Any]]], Awaitable[Any]],
+        queue_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        drop_on_full: bool = True,
+    ):
+        self.sink = sink
+        self.queue_size = queue_size
+        self.batch_size = max(int(batch_size), 1)
+        self.flush_interval = flush_interval
+        self.drop_on_full = drop_on_full
+        self.dropped = 0
+        self._loops: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    def _get_queue(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        state = self._loops.get(loop)
+        if state is None or state[1].done():
+            log_queue = asyncio.Queue(maxsize=self.queue_size)
+            task = loop.create_task(self._run(log_queue))
+            state = self._loops[loop] = (log_queue, task)
+        return state[0]
+
+    async def put(self, log: dict[str, Any]) -> bool:
+        """
+        Enqueue a log dict for writing.
+
+        Returns:
+            False if the log was dropped because the queue is full
+        """
+        log_queue = self._get_queue()
+        if not self.drop_on_full:
+            await log_queue.put(log)
+            return True
+        try:
+            log_queue.put_nowait(log)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        return True
+
+    async def join(self) -> None:
+        """Wait until every log queued on the current loop has been written."""
+        await self._get_queue().join()
+
+    async def _run(self, log_queue: asyncio.Queue) -> None:
+        batch = []
+        try:
+            while True:
+                batch.append(await log_queue.get())
+
+                # Collect more logs until the batch is full or the interval expires
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    try:
+                        if remaining > 0:
+                            item = await asyncio.wait_for(log_queue.get(), remaining)
+                        else:
+                            item = log_queue.get_nowait()
+                    except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                        break
+                    batch.append(item)
+
+                pending, batch = batch, []
+                await self._write(log_queue, pending)
+        except asyncio.CancelledError:
+            # Drain what is left before the loop shuts down
+            while True:
+                try:
+                    batch.append(log_queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            await self._write(log_queue, batch)
+            raise
+
+    async def _write(
+        self, log_queue: asyncio.Queue, batch: list[dict[str, Any]]
+    ) -> None:
+        if not batch:
+            return
+        try:
+            await self.sink(batch)
+        except Exception:
+            logger.exception("Failed to write %d request logs", len(batch))
+        finally:
+            for _ in batch:
+                log_queue.task_done()
+
+
+@atexit.register
+def stop_all_writers() -> None:
+    """Drain and stop every live writer; registered to run at shutdown."""
+    for writer in list(_writers):
+        writer.stop()
@@ -0,0 +1,588 @@
+"""
+Redis buffer for request logs.
+
+This module provides the Redis data structures logs can be buffered in
+(``REDIS_BUFFER_TYPE``) and a per-process buffer that collects packed log
+entries and writes them to Redis in batches instead of one round-trip per
+request.
+"""
+
+import asyncio
+import atexit
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+import weakref
+from dataclasses import dataclass, field
+
+import redis
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import REQUEST_TRACK_SETTINGS
+from .wire import pack_frame
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "Batch",
+    "SetBackend",
+    "ListBackend",
+    "StreamBackend",
+    "ReliableBackend",
+    "get_buffer_backend",
+    "shard_keys",
+    "RedisLogBuffer",
+    "flush_all_buffers",
+]
+
+
+@dataclass
+class Batch:
+    """
+    Entries taken from the buffer by a consumer.
+
+    Attributes:
+        items: Packed log entries
+        ids: Backend specific identifiers needed to acknowledge the batch
+        redelivered: Whether the entries were taken over from another consumer
+        token: Processing key holding the entries until they are acknowledged
+    """
+
+    items: list[bytes]
+    ids: list = field(default_factory=list)
+    redelivered: bool = False
+    token: str | None = None
+
+    def __len__(self) -> int:
+        return len(self.ids) if self.ids else len(self.items)
+
+
+class SetBackend:
+    """
+    Redis SET buffer (SADD / SPOP).
+
+    Byte-identical entries collapse into one and entries are popped in no
+    particular order. Kept as the default for compatibility.
+    """
+
+    name = "set"
+
+    def push(self, client, key: str, entries: list[bytes]) -> None:
+        client.sadd(key, *entries)
+
+    async def apush(self, aclient, key: str, entries: list[bytes]) -> None:
+        await aclient.sadd(key, *entries)
+
+    def pop(self, client, key: str, count: int) -> Batch:
+        return Batch(client.spop(key, count) or [])
+
+    def ack(self, client, key: str, batch: Batch) -> None:
+        pass
+
+    def recover(self, client, key: str) -> int:
+        return 0
+
+
+class ListBackend:
+    """
+    Redis LIST buffer (RPUSH / LPOP).
+
+    Keeps duplicates and hands entries to the consumer in arrival order,
+    which keeps inserts close to ``requested_at`` order. Needs Redis 6.2+.
+    """
+
+    name = "list"
+
+    def push(self, client, key: str, entries: list[bytes]) -> None:
+        client.rpush(key, *entries)
+
+    async def apush(self, aclient, key: str, entries: list[bytes]) -> None:
+        await aclient.rpush(key, *entries)
+
+    def pop(self, client, key: str, count: int) -> Batch:
+        return Batch(client.lpop(key, count) or [])
+
+    def ack(self, client, key: str, batch: Batch) -> None:
+        pass
+
+    def recover(self, client, key: str) -> int:
+        return 0
+
+
+class StreamBackend:
+    """
+    Redis Stream buffer read through a consumer group.
+
+    Entries are added with XADD and read with XREADGROUP. They stay pending
+    until the consumer acknowledges them after the database write, so the
+    batch of a worker that crashed is claimed again (XAUTOCLAIM) once it has
+    been idle for ``claim_idle`` seconds.
+
+    Args:
+        group: Consumer group name
+        claim_idle: Seconds a pending entry must be idle before it is redelivered
+        consumer: Consumer name, unique per worker process by default
+    """
+
+    name = "stream"
+    data_field = b"d"
+
+    def __init__(
+        self,
+        group: str = "request_track",
+        claim_idle: float = 300,
+        consumer: str | None = None,
+    ):
+        self.group = group
+        self.claim_idle = claim_idle
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self._groups: set[str] = set()
+
+    def push(self, client, key: str, entries: list[bytes]) -> None:
+        pipe = client.pipeline(transaction=False)
+        for entry in entries:
+            pipe.xadd(key, {self.data_field: entry})
+        pipe.execute()
+
+    async def apush(self, aclient, key: str, entries: list[bytes]) -> None:
+        pipe = aclient.pipeline(transaction=False)
+        for entry in entries:
+            pipe.xadd(key, {self.data_field: entry})
+        await pipe.execute()
+
+    def _ensure_group(self, client, key: str) -> None:
+        if key in self._groups:
+            return
+        try:
+            client.xgroup_create(key, self.group, id="0", mkstream=True)
+        except redis.exceptions.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._groups.add(key)
+
+    def _to_batch(self, messages) -> Batch:
+        batch = Batch([])
+        for message_id, fields in messages:
+            # Entries deleted while pending come back without fields
+            if fields:
+                batch.items.append(fields[self.data_field])
+            batch.ids.append(message_id)
+        return batch
+
+    def pop(self, client, key: str, count: int) -> Batch:
+        self._ensure_group(client, key)
+
+        # Redeliver entries left pending by a consumer that died
+        claimed = client.xautoclaim(
+            key,
+            self.group,
+            self.consumer,
+            min_idle_time=int(self.claim_idle * 1000),
+            start_id="0-0",
+            count=count,
+        )
+        if claimed and claimed[1]:
+            batch = self._to_batch(claimed[1])
+            batch.redelivered = True
+            return batch
+
+        response = client.xreadgroup(
+            self.group, self.consumer, {key: ">"}, count=count
+        )
+        if not response:
+            return Batch([])
+        return self._to_batch(response[0][1])
+
+    def ack(self, client, key: str, batch: Batch) -> None:
+        if not batch.ids:
+            return
+        pipe = client.pipeline(transaction=False)
+        pipe.xack(key, self.group, *batch.ids)
+        pipe.xdel(key, *batch.ids)
+        pipe.execute()
+
+    def recover(self, client, key: str) -> int:
+        # Idle pending entries are claimed by ``pop``
+        return 0
+
+
+# Moves up to ARGV[1] entries from the buffer into a processing list and
+# records it in the processing index with score ARGV[2]
+_CLAIM_SCRIPT = """
+local items
+if ARGV[3] == 'set' then
+    items = redis.call('SPOP', KEYS[1], ARGV[1])
+else
+    items = redis.call('LPOP', KEYS[1], ARGV[1])
+end
+if not items or #items == 0 then
+    return {}
+end
+for i = 1, #items, 1000 do
+    redis.call('RPUSH', KEYS[2], unpack(items, i, math.min(i + 999, #items)))
+end
+redis.call('ZADD', KEYS[3], ARGV[2], KEYS[2])
+return items
+"""
+
+# Puts the entries of processing list KEYS[3] back into buffer KEYS[1] and
+# removes it from index KEYS[2], unless it was acknowledged, requeued by
+# another worker or recorded after ARGV[1] in the meantime
+_RECOVER_SCRIPT = """
+local score = redis.call('ZSCORE', KEYS[2], KEYS[3])
+if not score or tonumber(score) > tonumber(ARGV[1]) then
+    return 0
+end
+local items = redis.call('LRANGE', KEYS[3], 0, -1)
+if ARGV[2] == 'set' then
+    for i = 1, #items, 1000 do
+        redis.call('SADD', KEYS[1], unpack(items, i, math.min(i + 999, #items)))
+    end
+else
+    -- Push back to the head in reverse so the original order is kept
+    local i = #items
+    while i >= 1 do
+        local chunk = {}
+        for j = i, math.max(i - 999, 1), -1 do
+            chunk[#chunk + 1] = items[j]
+        end
+        redis.call('LPUSH', KEYS[1], unpack(chunk))
+        i = i - 1000
+    end
+end
+redis.call('DEL', KEYS[3])
+redis.call('ZREM', KEYS[2], KEYS[3])
+return #items
+"""
+
+
+class ReliableBackend:
+    """
+    At-least-once wrapper around the set and list backends.
+
+    ``pop`` atomically moves a batch from the buffer into its own processing
+    list (a Lua script), and ``ack`` deletes that list once the logs are in
+    the database. If the worker dies or the write fails, the processing list
+    stays behind and ``recover`` puts its entries back into the buffer once
+    it is older than ``timeout`` seconds. A worker that is still writing a
+    batch after ``timeout`` seconds gets it requeued too, so its logs are
+    written twice.
+
+    Processing keys share the buffer key as hash tag (``{key}:processing``)
+    so they live in the same Redis Cluster slot as the buffer they belong to.
+
+    Args:
+        backend: The set or list backend being wrapped
+        timeout: Seconds after which an unacknowledged batch is requeued
+    """
+
+    def __init__(self, backend, timeout: float = 300):
+        self.backend = backend
+        self.name = backend.name
+        self.timeout = timeout
+
+    def push(self, client, key: str, entries: list[bytes]) -> None:
+        self.backend.push(client, key, entries)
+
+    async def apush(self, aclient, key: str, entries: list[bytes]) -> None:
+        await self.backend.apush(aclient, key, entries)
+
+    @staticmethod
+    def processing_index(key: str) -> str:
+        return f"{{{key}}}:processing"
+
+    def pop(self, client, key: str, count: int) -> Batch:
+        token = f"{self.processing_index(key)}:{uuid.uuid4().hex}"
+        claim = client.register_script(_CLAIM_SCRIPT)
+        items = claim(
+            keys=[key, token, self.processing_index(key)],
+            args=[count, time.time(), self.name],
+        )
+        if not items:
+            return Batch([])
+        return Batch(items, token=token)
+
+    def ack(self, client, key: str, batch: Batch) -> None:
+        if batch.token is None:
+            return
+        pipe = client.pipeline()
+        pipe.delete(batch.token)
+        pipe.zrem(self.processing_index(key), batch.token)
+        pipe.execute()
+
+    def recover(self, client, key: str) -> int:
+        """Requeue batches that were not acknowledged within the timeout."""
+        index = self.processing_index(key)
+        cutoff = time.time() - self.timeout
+        requeue = client.register_script(_RECOVER_SCRIPT)
+        count = 0
+        for token in client.zrangebyscore(index, "-inf", cutoff):
+            count += requeue(keys=[key, index, token], args=[cutoff, self.name])
+        return count
+
+
+BUFFER_BACKENDS = {
+    SetBackend.name: SetBackend,
+    ListBackend.name: ListBackend,
+    StreamBackend.name: StreamBackend,
+}
+
+
+def get_buffer_backend():
+    """Return the buffer backend selected by ``REDIS_BUFFER_TYPE``."""
+    name = REQUEST_TRACK_SETTINGS.get("REDIS_BUFFER_TYPE", "set")
+    if name == StreamBackend.name:
+        # Streams are always acknowledged after the write
+        return StreamBackend(
+            group=REQUEST_TRACK_SETTINGS.get("REDIS_STREAM_GROUP", "request_track"),
+            claim_idle=REQUEST_TRACK_SETTINGS.get("REDIS_STREAM_CLAIM_IDLE", 300),
+        )
+    try:
+        backend = BUFFER_BACKENDS[name]()
+    except KeyError:
+        raise ImproperlyConfigured(
+            f"Unknown REDIS_BUFFER_TYPE '{name}' in REQUEST_TRACK_SETTINGS. "
+            f"Choose one of: {', '.join(BUFFER_BACKENDS)}."
+        )
+    if REQUEST_TRACK_SETTINGS.get("REDIS_RELIABLE_FLUSH", False):
+        backend = ReliableBackend(
+            backend, timeout=REQUEST_TRACK_SETTINGS.get("REDIS_RELIABLE_TIMEOUT", 300)
+        )
+    return backend
+
+
+def shard_keys(key: str, shards: int | None = None) -> list[str]:
+    """
+    Return the Redis keys the buffer is partitioned across.
+
+    With a single shard this is just ``key``; otherwise ``key:0`` to
+    ``key:N-1``, which hash to different Redis Cluster slots.
+
+    Args:
+        key: The configured ``REDIS_KEY``
+        shards: Number of shards, defaults to the ``REDIS_SHARDS`` setting
+    """
+    if shards is None:
+        shards = REQUEST_TRACK_SETTINGS.get("REDIS_SHARDS", 1)
+    if shards <= 1:
+        return [key]
+    return [f"{key}:{i}" for i in range(shards)]
+
+
+# Every live buffer, so pending entries can be flushed at interpreter shutdown
+_buffers: "weakref.WeakSet[RedisLogBuffer]" = weakref.WeakSet()
+
+
+class RedisLogBuffer:
+    """
+    Accumulates packed log entries and pushes them to Redis in batches.
+
+    A batch is written in one round-trip once ``batch_size`` entries are
+    pending, or once the oldest pending entry is ``max_age`` seconds old: a
+    timer armed with the first pending entry (a daemon thread for ``add``, the
+    event loop for ``aadd``) flushes the buffer even if no other entry comes.
+    Pending entries are also flushed when the process exits. When the buffer
+    is sharded, each process writes to the shard picked by its process id.
+    With ``compression``, batches of several entries are pushed as a single
+    compressed frame.
+
+    A batch that fails to be pushed is put back in front of the pending
+    entries and retried by the timer, keeping at most ``max_pending`` entries
+    while Redis is unreachable; older ones are dropped.
+
+    Args:
+        client: Sync Redis client
+        aclient: Async Redis client, used by ``aadd`` and ``aflush``
+        key: Redis key the entries are written to
+        batch_size: Number of pending entries that triggers a flush
+        max_age: Age in seconds of the oldest pending entry that triggers a flush
+        backend: Buffer backend, defaults to the one selected in the settings
+        shards: Number of shard keys, defaults to the ``REDIS_SHARDS`` setting
+        compression: ``"zlib"`` or ``"zstd"`` to compress batches, None to disable
+        max_pending: Maximum number of entries kept when pushes fail
+    """
+
+    def __init__(
+        self,
+        client,
+        aclient,
+        key: str,
+        batch_size: int = 1,
+        max_age: float = 1.0,
+        backend=None,
+        shards: int | None = None,
+        compression: str | None = None,
+        max_pending: int = 10000,
+    ):
+        self.client = client
+        self.aclient = aclient
+        self.key = key
+        self.keys = shard_keys(key, shards)
+        self.batch_size = max(int(batch_size), 1)
+        self.max_age = max_age
+        self.backend = backend or get_buffer_backend()
+        self.compression = compression
+        self.max_pending = max(max_pending, self.batch_size)
+        self._pending: list[bytes] = []
+        self._oldest = 0.0
+        self._lock = threading.Lock()
+        # threading.Timer or asyncio.TimerHandle flushing the pending entries
+        self._timer = None
+        self._flush_task: asyncio.Task | None = None
+        _buffers.add(self)
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    @property
+    def shard_key(self) -> str:
+        """The key this process writes to."""
+        return self.keys[os.getpid() % len(self.keys)]
+
+    def _append(self, packed: bytes) -> list[bytes] | None:
+        """Add an entry and return the batch to write if a threshold is hit."""
+        with self._lock:
+            now = time.monotonic()
+            if not self._pending:
+                self._oldest = now
+            self._pending.append(packed)
+            if (
+                len(self._pending) < self.batch_size
+                and now - self._oldest < self.max_age
+            ):
+                return None
+            return self._take()
+
+    def _take(self) -> list[bytes]:
+        # Called with the lock held
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        return batch
+
+    def _take_all(self) -> list[bytes]:
+        with self._lock:
+            return self._take()
+
+    def _restore(self, batch: list[bytes]) -> None:
+        """Put back a batch that could not be pushed, oldest entries first."""
+        with self._lock:
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending[:0] = batch
+            del self._pending[: -self.max_pending]
+
+    def _arm_timer(self) -> None:
+        """Flush from a daemon thread once the oldest pending entry is too old."""
+        with self._lock:
+            if self._timer is not None or not self._pending:
+                return
+            delay = self._oldest + self.max_age - time.monotonic()
+            self._timer = threading.Timer(max(delay, 0), self._flush_expired)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_expired(self) -> None:
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Failed to push request logs to Redis")
+            self._arm_timer()
+
+    def _aarm_timer(self) -> None:
+        """Flush from the event loop once the oldest pending entry is too old."""
+        with self._lock:
+            if self._timer is not None or not self._pending:
+                return
+            delay = self._oldest + self.max_age - time.monotonic()
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(max(delay, 0), self._start_aflush)
+
+    def _start_aflush(self) -> None:
+        with self._lock:
+            self._timer = None
+        # Keep a reference so the task is not garbage collected while running
+        self._flush_task = asyncio.ensure_future(self._aflush_expired())
+
+    async def _aflush_expired(self) -> None:
+        try:
+            await self.aflush()
+        except Exception:
+            logger.exception("Failed to push request logs to Redis")
+            self._aarm_timer()
+
+    def _frame(self, batch: list[bytes]) -> list[bytes]:
+        if self.compression and len(batch) > 1:
+            return [pack_frame(batch, self.compression)]
+        return batch
+
+    def write(self, batch: list[bytes]) -> None:
+        """
+        Write a batch of packed entries right away, bypassing the buffer.
+
+        If the push fails, the batch is kept as pending and the error raised.
+        """
+        if not batch:
+            return
+        try:
+            self.backend.push(self.client, self.shard_key, self._frame(batch))
+        except Exception:
+            self._restore(batch)
+            self._arm_timer()
+            raise
+
+    async def awrite(self, batch: list[bytes]) -> None:
+        """Async version of ``write``."""
+        if not batch:
+            return
+        try:
+            await self.backend.apush(self.aclient, self.shard_key, self._frame(batch))
+        except Exception:
+            self._restore(batch)
+            self._aarm_timer()
+            raise
+
+    def add(self, packed: bytes) -> None:
+        """Buffer a packed entry, flushing synchronously if a threshold is hit."""
+        batch = self._append(packed)
+        if batch:
+            self.write(batch)
+        elif self._timer is None:
+            self._arm_timer()
+
+    async def aadd(self, packed: bytes) -> None:
+        """Buffer a packed entry, flushing asynchronously if a threshold is hit."""
+        batch = self._append(packed)
+        if batch:
+            await self.awrite(batch)
+        elif self._timer is None:
+            self._aarm_timer()
+
+    def flush(self) -> int:
+        """Write all pending entries with the sync client and return their count."""
+        batch = self._take_all()
+        self.write(batch)
+        return len(batch)
+
+    async def aflush(self) -> int:
+        """Write all pending entries with the async client and return their count."""
+        batch = self._take_all()
+        await self.awrite(batch)
+        return len(batch)
+
+
+@atexit.register
+def flush_all_buffers() -> None:
+    """Flush every live buffer; registered to run at interpreter shutdown."""
+    for buffer in list(_buffers):
+        try:
+            buffer.flush()
+        except Exception:
+            # Redis may already be unreachable while the process is exiting
+            pass
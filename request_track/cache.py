@@ -0,0 +1,239 @@
+"""
+Per-process caches used when writing request logs.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Iterable
+
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import HeaderSet, IpAddress, RoutePattern, UserAgent
+from .settings import REQUEST_TRACK_SETTINGS
+
+
+class KnownValueCache:
+    """
+    Bounded LRU set of values known to exist in the database.
+
+    Lookups that miss the in-process LRU can fall back to a shared Django
+    cache, so processes benefit from each other's inserts.
+
+    Args:
+        maxsize: Maximum number of values kept in process
+        cache_alias: Optional Django cache alias used as a shared second level
+        prefix: Key prefix used in the shared cache
+        timeout: Lifetime in seconds of entries in the shared cache
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 10000,
+        cache_alias: str | None = None,
+        prefix: str = "request_track",
+        timeout: int | None = 86400,
+    ):
+        self.maxsize = maxsize
+        self.cache_alias = cache_alias
+        self.prefix = prefix
+        self.timeout = timeout
+        self._values: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __contains__(self, value) -> bool:
+        return value in self._values
+
+    def _key(self, value) -> str:
+        return f"{self.prefix}:{value}"
+
+    def missing(self, values: Iterable) -> set:
+        """Return the values that are not known to exist."""
+        missing = set()
+        with self._lock:
+            for value in values:
+                if value in self._values:
+                    self._values.move_to_end(value)
+                else:
+                    missing.add(value)
+
+        if missing and self.cache_alias:
+            keys = {self._key(value): value for value in missing}
+            found = caches[self.cache_alias].get_many(list(keys))
+            shared = {keys[key] for key in found}
+            self._remember(shared)
+            missing -= shared
+        return missing
+
+    def _remember(self, values: Iterable) -> None:
+        self._store((value, True) for value in values)
+
+    def _store(self, items: Iterable[tuple]) -> None:
+        with self._lock:
+            for value, payload in items:
+                self._values[value] = payload
+                self._values.move_to_end(value)
+            while len(self._values) > self.maxsize:
+                self._values.popitem(last=False)
+
+    def add(self, values: Iterable) -> None:
+        """Record values as existing in the database."""
+        values = set(values)
+        if not values or self.maxsize <= 0:
+            return
+        self._remember(values)
+        if self.cache_alias:
+            caches[self.cache_alias].set_many(
+                {self._key(value): True for value in values}, self.timeout
+            )
+
+    def discard(self, value) -> None:
+        """Forget a value, e.g. after its row was deleted."""
+        with self._lock:
+            self._values.pop(value, None)
+        if self.cache_alias:
+            caches[self.cache_alias].delete(self._key(value))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class KnownIdCache(KnownValueCache):
+    """
+    Bounded LRU map from values to the id of their row in the database.
+
+    Used for interned lookup tables, where logs reference a value by the
+    integer key of its row.
+    """
+
+    def lookup(self, values: Iterable) -> tuple[dict, set]:
+        """
+        Split values into known ones, with their ids, and unknown ones.
+
+        Returns:
+            Dict of the known values and their ids, and the set of unknown values
+        """
+        found = {}
+        missing = set()
+        with self._lock:
+            for value in values:
+                if value in self._values:
+                    self._values.move_to_end(value)
+                    found[value] = self._values[value]
+                else:
+                    missing.add(value)
+
+        if missing and self.cache_alias:
+            keys = {self._key(value): value for value in missing}
+            shared = {
+                keys[key]: pk
+                for key, pk in caches[self.cache_alias].get_many(list(keys)).items()
+            }
+            self._store(shared.items())
+            found.update(shared)
+            missing -= shared.keys()
+        return found, missing
+
+    def add_ids(self, ids: dict) -> None:
+        """Record the ids of values existing in the database."""
+        if not ids or self.maxsize <= 0:
+            return
+        self._store(ids.items())
+        if self.cache_alias:
+            caches[self.cache_alias].set_many(
+                {self._key(value): pk for value, pk in ids.items()}, self.timeout
+            )
+
+
+_ip_cache: KnownValueCache | None = None
+_id_caches: dict[str, KnownIdCache] = {}
+
+
+def get_ip_cache() -> KnownValueCache:
+    """Return the per-process cache of IPs known to exist in ``IpAddress``."""
+    global _ip_cache
+    if _ip_cache is None:
+        _ip_cache = KnownValueCache(
+            maxsize=REQUEST_TRACK_SETTINGS.get("IP_CACHE_SIZE", 10000),
+            cache_alias=REQUEST_TRACK_SETTINGS.get("IP_CACHE_ALIAS", None),
+            prefix="request_track:ip",
+        )
+    return _ip_cache
+
+
+def get_id_cache(name: str) -> KnownIdCache:
+    """
+    Return the per-process cache of ids of an interned lookup table.
+
+    Args:
+        name: Name of the table's values (``"pattern"``, ``"user_agent"``...);
+            the size comes from the ``<NAME>_CACHE_SIZE`` setting
+    """
+    cache = _id_caches.get(name)
+    if cache is None:
+        cache = _id_caches[name] = KnownIdCache(
+            maxsize=REQUEST_TRACK_SETTINGS.get(f"{name.upper()}_CACHE_SIZE", 1000),
+            prefix=f"request_track:{name}",
+        )
+    return cache
+
+
+def get_pattern_cache() -> KnownIdCache:
+    """Return the per-process cache of ``RoutePattern`` ids by pattern."""
+    return get_id_cache("pattern")
+
+
+def forget_known_rows() -> None:
+    """
+    Empty the per-process caches of IPs and interned ids.
+
+    Called when an insert hits a foreign key violation, as rows deleted by
+    another process are only dropped from that process' caches.
+    """
+    if _ip_cache is not None:
+        _ip_cache.clear()
+    for cache in _id_caches.values():
+        cache.clear()
+
+
+@receiver(setting_changed)
+def reset_caches(setting: str, **kwargs) -> None:
+    """Rebuild the caches when ``REQUEST_TRACK_SETTINGS`` changes."""
+    global _ip_cache
+    if setting == "REQUEST_TRACK_SETTINGS":
+        _ip_cache = None
+        _id_caches.clear()
+
+
+@receiver(post_delete, sender=IpAddress)
+def forget_deleted_ip(sender, instance: IpAddress, **kwargs) -> None:
+    """Keep deleted IPs out of the cache so they are created again when seen."""
+    if _ip_cache is not None:
+        _ip_cache.discard(instance.ip)
+
+
+@receiver(post_delete, sender=RoutePattern)
+def forget_deleted_pattern(sender, instance: RoutePattern, **kwargs) -> None:
+    """Keep deleted patterns out of the cache so logs never reference their ids."""
+    if "pattern" in _id_caches:
+        _id_caches["pattern"].discard(instance.pattern)
+
+
+@receiver(post_delete, sender=UserAgent)
+def forget_deleted_user_agent(sender, instance: UserAgent, **kwargs) -> None:
+    """Keep deleted user agents out of the cache so logs never reference their ids."""
+    if "user_agent" in _id_caches:
+        _id_caches["user_agent"].discard(instance.agent)
+
+
+@receiver(post_delete, sender=HeaderSet)
+def forget_deleted_header_set(sender, instance: HeaderSet, **kwargs) -> None:
+    """Keep deleted header sets out of the cache so logs never reference their ids."""
+    if "header_set" in _id_caches:
+        _id_caches["header_set"].discard(instance.digest)
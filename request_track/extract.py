@@ -0,0 +1,107 @@
+"""
+Compiled extraction of the log dict of a request.
+
+The settings that shape a log (``HEADERS_TO_LOG``, ``USE_IP_ADDRESS_MODEL``)
+are snapshotted once, with the ``META`` keys of the logged headers built up
+front, so building a log costs a handful of dict lookups. Each
+``LoggingRequestMiddleware`` builds its own extractor from the settings it is
+created with; the shared one behind ``get_log_extractor`` is rebuilt when
+``REQUEST_TRACK_SETTINGS`` changes.
+"""
+
+from typing import Any
+
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import HttpRequest, HttpResponse
+from django.utils import timezone
+
+from .settings import REQUEST_TRACK_SETTINGS
+from .utils import get_ip_address, get_request_size, get_response_size, get_route_pattern
+
+
+class LogExtractor:
+    """
+    Snapshot of the logging settings that builds log dicts.
+
+    Args:
+        config: The ``REQUEST_TRACK_SETTINGS`` dict to compile
+    """
+
+    def __init__(self, config: dict[str, Any]):
+        self.header_keys = tuple(
+            (header, f"HTTP_{header.upper().replace('-', '_')}")
+            for header in config.get("HEADERS_TO_LOG", [])
+        )
+        # IPs go to a separate table or are written in the same table
+        use_ip_model = config.get("USE_IP_ADDRESS_MODEL", True)
+        self.ip_field = "ip_id" if use_ip_model else "ip_address"
+
+    def headers(self, request: HttpRequest) -> dict[str, str]:
+        """Return the configured headers present in the request."""
+        meta = request.META
+        headers = {}
+        for header, key in self.header_keys:
+            value = meta.get(key)
+            if value:
+                headers[header] = value
+        return headers
+
+    def extract(
+        self,
+        request: HttpRequest,
+        response: HttpResponse,
+        user,
+        duration: int | None = None,
+    ) -> dict[str, Any]:
+        """
+        Build the log dict of a request.
+
+        The query string is taken raw from ``META`` instead of re-encoding
+        ``request.GET``, which would parse it first.
+
+        Args:
+            request: The Django HttpRequest object
+            response: The Django HttpResponse object
+            user: The user making the request
+            duration: Time spent producing the response, in microseconds
+
+        Returns:
+            Dict containing all parameters needed for the RequestLog model
+        """
+        meta = request.META
+        return {
+            "user_id": user.pk if user.is_authenticated else None,
+            "method": request.method,
+            "route": request.path,
+            "pattern": get_route_pattern(request),
+            "status_code": response.status_code,
+            "user_agent": meta.get("HTTP_USER_AGENT", "")[:300],
+            "query_params": meta.get("QUERY_STRING", ""),
+            "headers": self.headers(request),
+            "app_name": getattr(request, "current_app", None),
+            "requested_at": timezone.now(),
+            "duration": duration,
+            "response_size": get_response_size(response),
+            "request_size": get_request_size(request),
+            self.ip_field: get_ip_address(request),
+        }
+
+
+_log_extractor: LogExtractor | None = None
+
+
+def get_log_extractor() -> LogExtractor:
+    """Return the compiled extractor, compiling it on first use."""
+    global _log_extractor
+    if _log_extractor is None:
+        _log_extractor = LogExtractor(dict(REQUEST_TRACK_SETTINGS.items()))
+    return _log_extractor
+
+
+@receiver(setting_changed)
+def reset_log_extractor(setting: str, **kwargs) -> None:
+    """Drop the compiled extractor when ``REQUEST_TRACK_SETTINGS`` changes."""
+    global _log_extractor
+    if setting == "REQUEST_TRACK_SETTINGS":
+        _log_extractor = None
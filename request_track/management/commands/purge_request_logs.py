@@ -0,0 +1,67 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+
+from request_track.retention import parse_age, purge_older_than
+from request_track.settings import REQUEST_TRACK_SETTINGS
+
+
+class Command(BaseCommand):
+    help = "Delete request logs older than a given age in small batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than",
+            default=None,
+            help="Age of the logs to delete, e.g. 30d, 12h or 2w "
+            "(default: RETENTION_DAYS days)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Width of each id range deleted at once "
+            "(default: RETENTION_BATCH_SIZE or 10000)",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=None,
+            help="Seconds to pause between batches "
+            "(default: RETENTION_BATCH_SLEEP or 0)",
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="Database alias to use (default: %(default)s)",
+        )
+
+    def handle(self, *args, **options):
+        if options["older_than"] is not None:
+            try:
+                age = parse_age(options["older_than"])
+            except ValueError as e:
+                raise CommandError(str(e))
+        elif REQUEST_TRACK_SETTINGS.get("RETENTION_DAYS", None) is not None:
+            age = timedelta(days=REQUEST_TRACK_SETTINGS["RETENTION_DAYS"])
+        else:
+            raise CommandError(
+                "Pass --older-than or set RETENTION_DAYS in REQUEST_TRACK_SETTINGS."
+            )
+
+        def progress(deleted):
+            if options["verbosity"] > 1:
+                self.stdout.write(f"{deleted} logs deleted so far")
+
+        deleted, dropped = purge_older_than(
+            timezone.now() - age,
+            using=options["database"],
+            batch_size=options["batch_size"],
+            sleep=options["sleep"],
+            progress=progress,
+        )
+        for name in dropped:
+            self.stdout.write(f"Dropped partition {name}")
+        self.stdout.write(self.style.SUCCESS(f"{deleted} logs deleted."))
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from request_track.partitions import (
+    convert_to_partitioned,
+    ensure_partitions,
+    get_partition_interval,
+    is_partitioned,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Create upcoming partitions of the request log table on PostgreSQL. "
+        "Run it regularly (e.g. daily from cron) so new rows always have a partition."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ahead",
+            type=int,
+            default=None,
+            help="Number of future periods to create (default: PARTITION_PREMAKE or 3)",
+        )
+        parser.add_argument(
+            "--convert",
+            action="store_true",
+            help=(
+                "Convert the existing table to a partitioned table first. This holds "
+                "an ACCESS EXCLUSIVE lock on the table while the existing rows are "
+                "scanned, so logging and the admin wait until it finishes."
+            ),
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="Database alias to use (default: %(default)s)",
+        )
+
+    def handle(self, *args, **options):
+        using = options["database"]
+        if get_partition_interval() is None:
+            raise CommandError(
+                "Set PARTITION_INTERVAL ('day' or 'month') in REQUEST_TRACK_SETTINGS."
+            )
+        if connections[using].vendor != "postgresql":
+            raise CommandError("Partitioning is only supported on PostgreSQL.")
+
+        if is_partitioned(using):
+            created = ensure_partitions(using, ahead=options["ahead"])
+        elif options["convert"]:
+            created = convert_to_partitioned(using)
+            if options["ahead"] is not None:
+                created += ensure_partitions(using, ahead=options["ahead"])
+        else:
+            raise CommandError(
+                "The request log table is not partitioned. Run with --convert first."
+            )
+
+        for name in created:
+            self.stdout.write(f"Created partition {name}")
+        self.stdout.write(self.style.SUCCESS(f"{len(created)} partitions created."))
@@ -5,26 +5,29 @@ This module provides middleware for logging HTTP requests in both synchronous
 and asynchronous Django applications.
 """
 
-import random
 import asyncio
+import time
 from typing import Any, Callable, TypeVar
 
 from django.http import HttpRequest, HttpResponse
 from django.utils.decorators import sync_and_async_middleware
-from django.utils import timezone
 
 import msgpack
 
-from .models import RequestLog, IpAddress
+from .background import AsyncLogFlusher, BackgroundLogWriter
+from .buffer import RedisLogBuffer
+from .extract import LogExtractor, get_log_extractor
+from .rules import Decision, get_request_filter
 from .settings import REQUEST_TRACK_SETTINGS, redis_client, aredis_client, redis_key
-from .utils import get_ip_address
+from .wire import encode_log, get_compression
+from .writers import awrite_logs, write_logs
 
 # Type variable for request handler
 T = TypeVar("T")
 
 
 def params_request(
-    request: HttpRequest, response: HttpResponse, user
+    request: HttpRequest, response: HttpResponse, user, duration: int | None = None
 ) -> dict[str, Any]:
     """
     Extract and prepare parameters from request for logging.
@@ -32,32 +35,13 @@ def params_request(
     Args:
         request: The Django HttpRequest object
         response: The Django HttpResponse object
+        user: The user making the request
+        duration: Time spent producing the response, in microseconds
 
     Returns:
         Dict containing all parameters needed for the RequestLog model
     """
-
-    log_params = {
-        "user_id": user.pk if user.is_authenticated else None,
-        "method": request.method,
-        "route": request.path,
-        "status_code": response.status_code,
-        "user_agent": request.META.get("HTTP_USER_AGENT", "")[:300],
-        "query_params": request.GET.urlencode(),
-        "headers": get_logged_headers(request),
-        "app_name": getattr(request, "current_app", None),
-        "requested_at": timezone.now().isoformat(),
-    }
-
-    # Handle IP address based on configuration
-    ip = get_ip_address(request)
-    use_ip_model = REQUEST_TRACK_SETTINGS.get("USE_IP_ADDRESS_MODEL", True)
-    if use_ip_model:
-        log_params["ip_id"] = ip  # For a separate table
-    else:
-        log_params["ip_address"] = ip  # It is written in the same table.
-
-    return log_params
+    return get_log_extractor().extract(request, response, user, duration)
 
 
 def get_logged_headers(request: HttpRequest) -> dict[str, str]:
@@ -70,14 +54,7 @@ def get_logged_headers(request: HttpRequest) -> dict[str, str]:
     Returns:
         Dict containing headers configured to be logged
     """
-    raw_headers = REQUEST_TRACK_SETTINGS.get("HEADERS_TO_LOG", [])
-    headers = {}
-    for header in raw_headers:
-        key = f"HTTP_{header.upper().replace('-', '_')}"
-        value = request.META.get(key)
-        if value:
-            headers[header] = value
-    return headers
+    return get_log_extractor().headers(request)
 
 
 def should_log_request(request: HttpRequest, user) -> bool:
@@ -86,40 +63,12 @@ def should_log_request(request: HttpRequest, user) -> bool:
 
     Args:
         request: The Django HttpRequest object
-        force_log_paths: List of paths that should always be logged
+        user: The user making the request
 
     Returns:
         Boolean indicating whether this request should be logged
     """
-    sampling_rate = REQUEST_TRACK_SETTINGS.get("SAMPLING_RATE", 1.0)
-
-    # Check if path is in force log paths
-    force_log_paths = REQUEST_TRACK_SETTINGS.get("FORCE_PATHS", [])
-    if force_log_paths and any(request.path.startswith(p) for p in force_log_paths):
-        if REQUEST_TRACK_SETTINGS.get("FORCE_PATHS_SAMPLING", False):
-            # Apply sampling rate if FORCE_PATHS_SAMPLING is enable
-            return random.random() < sampling_rate
-        else:
-            return True
-
-    # Check user logging mode
-    user_logging_mode = REQUEST_TRACK_SETTINGS.get("USER_LOGGING_MODE", "all")
-    user_authenticated = user.is_authenticated
-    if user_logging_mode == "authenticated" and not user_authenticated:
-        return False
-    elif user_logging_mode == "anonymous" and user_authenticated:
-        return False
-
-    # Check exclude paths
-    exclude_paths = REQUEST_TRACK_SETTINGS.get("EXCLUDE_PATHS", [])
-    if "*" in exclude_paths or any(request.path.startswith(p) for p in exclude_paths):
-        return False
-
-    # Apply sampling rate
-    if 0 <= sampling_rate < 1 and random.random() > sampling_rate:
-        return False
-
-    return True
+    return get_request_filter().should_log(request, user)
 
 
 @sync_and_async_middleware
@@ -137,51 +86,122 @@ def LoggingRequestMiddleware(
     Returns:
         Middleware function to process requests and responses
     """
-    # TODO Using a buffer class to add logs to Redis in batches (with a pipeline)
+    # Compile the filtering rules up front instead of on the first request
+    get_request_filter()
+    extractor = LogExtractor(dict(REQUEST_TRACK_SETTINGS.items()))
+
+    # Per-process buffer that writes packed logs to Redis in batches
+    buffer = None
+    if redis_client:
+        buffer = RedisLogBuffer(
+            redis_client,
+            aredis_client,
+            redis_key,
+            batch_size=REQUEST_TRACK_SETTINGS.get("REDIS_BATCH_SIZE", 1),
+            max_age=REQUEST_TRACK_SETTINGS.get("REDIS_BATCH_MAX_AGE", 1.0),
+            compression=get_compression(),
+        )
 
     # Async middleware implementation
     if asyncio.iscoroutinefunction(get_response):
 
+        async def asave_logs(logs: list[dict[str, Any]]) -> None:
+            if buffer is not None:
+                await buffer.awrite([msgpack.dumps(encode_log(log)) for log in logs])
+            else:
+                await awrite_logs(logs)
+
+        # Optional event-loop task that takes writes off the response path
+        flusher = None
+        if REQUEST_TRACK_SETTINGS.get("BACKGROUND_WRITER", False):
+            flusher = AsyncLogFlusher(
+                asave_logs,
+                queue_size=REQUEST_TRACK_SETTINGS.get("BACKGROUND_QUEUE_SIZE", 10000),
+                batch_size=REQUEST_TRACK_SETTINGS.get("BACKGROUND_BATCH_SIZE", 500),
+                flush_interval=REQUEST_TRACK_SETTINGS.get(
+                    "BACKGROUND_FLUSH_INTERVAL", 1.0
+                ),
+                drop_on_full=REQUEST_TRACK_SETTINGS.get(
+                    "BACKGROUND_DROP_ON_FULL", True
+                ),
+            )
+
         async def middleware(request: HttpRequest) -> HttpResponse:
+            # Decide what we can before the view so skipped requests cost nothing
+            request_filter = get_request_filter()
+            decision = request_filter.check_request(request)
+            start = time.monotonic_ns()
             response = await get_response(request)
+            duration = (time.monotonic_ns() - start) // 1000
+            if decision == Decision.SKIP:
+                return response
+
             user = await request.auser()
-            if not should_log_request(request, user):
+            if decision == Decision.CHECK_USER and not request_filter.check_user(user):
                 return response
 
-            log_params = params_request(request, response, user)
+            log_params = extractor.extract(request, response, user, duration)
 
             # Choose saving method based on configuration
-            if redis_client:
-                packed = msgpack.dumps(log_params)
-                await aredis_client.sadd(redis_key, packed)
+            if flusher is not None:
+                await flusher.put(log_params)
+            elif buffer is not None:
+                await buffer.aadd(msgpack.dumps(encode_log(log_params)))
             else:
-                ip = log_params.get("ip_id")
-                if ip:
-                    await IpAddress.objects.aget_or_create(ip=ip)
-                await RequestLog.objects.acreate(**log_params)
+                await awrite_logs([log_params])
 
             return response
 
     # Sync middleware implementation
     else:
 
+        def save_logs(logs: list[dict[str, Any]]) -> None:
+            if buffer is not None:
+                buffer.write([msgpack.dumps(encode_log(log)) for log in logs])
+            else:
+                write_logs(logs)
+
+        # Optional background thread that takes writes off the response path
+        writer = None
+        if REQUEST_TRACK_SETTINGS.get("BACKGROUND_WRITER", False):
+            writer = BackgroundLogWriter(
+                save_logs,
+                queue_size=REQUEST_TRACK_SETTINGS.get("BACKGROUND_QUEUE_SIZE", 10000),
+                batch_size=REQUEST_TRACK_SETTINGS.get("BACKGROUND_BATCH_SIZE", 500),
+                flush_interval=REQUEST_TRACK_SETTINGS.get(
+                    "BACKGROUND_FLUSH_INTERVAL", 1.0
+                ),
+                drop_on_full=REQUEST_TRACK_SETTINGS.get(
+                    "BACKGROUND_DROP_ON_FULL", True
+                ),
+                drain_timeout=REQUEST_TRACK_SETTINGS.get(
+                    "BACKGROUND_DRAIN_TIMEOUT", 5.0
+                ),
+            )
+
         def middleware(request: HttpRequest) -> HttpResponse:
+            # Decide what we can before the view so skipped requests cost nothing
+            request_filter = get_request_filter()
+            decision = request_filter.check_request(request)
+            start = time.monotonic_ns()
             response = get_response(request)
+            duration = (time.monotonic_ns() - start) // 1000
+            if decision == Decision.SKIP:
+                return response
+
             user = request.user
-            if not should_log_request(request, user):
+            if decision == Decision.CHECK_USER and not request_filter.check_user(user):
                 return response
 
-            log_params = params_request(request, response, user)
+            log_params = extractor.extract(request, response, user, duration)
 
             # Choose saving method based on configuration
-            if redis_client:
-                packed = msgpack.dumps(log_params)
-                redis_client.sadd(redis_key, packed)
+            if writer is not None:
+                writer.put(log_params)
+            elif buffer is not None:
+                buffer.add(msgpack.dumps(encode_log(log_params)))
             else:
-                ip = log_params.get("ip_id")
-                if ip:
-                    IpAddress.objects.get_or_create(ip=ip)
-                RequestLog.objects.create(**log_params)
+                write_logs([log_params])
 
             return response
 
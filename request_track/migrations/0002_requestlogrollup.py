@@ -0,0 +1,30 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('request_track', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestLogRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(help_text='Start of the minute of the requests', verbose_name='Bucket')),
+                ('route', models.CharField(help_text='URL path that was requested', max_length=1000, verbose_name='Route')),
+                ('method', models.CharField(help_text='HTTP method (GET, POST, etc.)', max_length=10, verbose_name='Method')),
+                ('status_class', models.PositiveSmallIntegerField(help_text='First digit of the status code', verbose_name='Status Class')),
+                ('app_name', models.CharField(blank=True, default='', help_text='Django application name if available', max_length=100, verbose_name='App Name')),
+                ('count', models.PositiveIntegerField(default=0, help_text='Number of requests', verbose_name='Count')),
+                ('users', models.PositiveIntegerField(default=0, help_text='Distinct authenticated users per flush, summed over flushes', verbose_name='Users')),
+            ],
+            options={
+                'verbose_name': 'Request Log Rollup',
+                'verbose_name_plural': 'Request Log Rollups',
+                'ordering': ['-bucket'],
+                'constraints': [models.UniqueConstraint(fields=('bucket', 'route', 'method', 'status_class', 'app_name'), name='request_track_rollup_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('request_track', '0002_requestlogrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='requestlog',
+            name='duration',
+            field=models.PositiveBigIntegerField(blank=True, db_index=True, help_text='Time spent producing the response, in microseconds', null=True, verbose_name='Duration (µs)'),
+        ),
+        migrations.AddField(
+            model_name='requestlog',
+            name='request_size',
+            field=models.PositiveBigIntegerField(blank=True, db_index=True, help_text='Size of the request body in bytes', null=True, verbose_name='Request Size'),
+        ),
+        migrations.AddField(
+            model_name='requestlog',
+            name='response_size',
+            field=models.PositiveBigIntegerField(blank=True, db_index=True, help_text='Size of the response body in bytes (unknown for streaming responses)', null=True, verbose_name='Response Size'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('request_track', '0003_requestlog_duration_sizes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteLatencySketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(help_text='Start of the time bucket of the requests', verbose_name='Bucket')),
+                ('route', models.CharField(help_text='URL path that was requested', max_length=1000, verbose_name='Route')),
+                ('method', models.CharField(help_text='HTTP method (GET, POST, etc.)', max_length=10, verbose_name='Method')),
+                ('count', models.PositiveIntegerField(default=0, help_text='Number of durations in the sketch', verbose_name='Count')),
+                ('sketch', models.BinaryField(default=b'', help_text='Serialized latency sketch', verbose_name='Sketch')),
+            ],
+            options={
+                'verbose_name': 'Route Latency Sketch',
+                'verbose_name_plural': 'Route Latency Sketches',
+                'ordering': ['-bucket'],
+                'constraints': [models.UniqueConstraint(fields=('bucket', 'route', 'method'), name='request_track_latency_sketch_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('request_track', '0004_routelatencysketch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoutePattern',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pattern', models.CharField(help_text='URL pattern or view name the request was resolved to', max_length=1000, unique=True, verbose_name='Pattern')),
+            ],
+            options={
+                'verbose_name': 'Route Pattern',
+                'verbose_name_plural': 'Route Patterns',
+            },
+        ),
+        migrations.AddField(
+            model_name='requestlog',
+            name='pattern',
+            field=models.ForeignKey(blank=True, help_text='URL pattern the route was resolved to', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='log', to='request_track.routepattern', verbose_name='Pattern'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('request_track', '0005_routepattern'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HeaderSet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(help_text='SHA-1 of the canonical JSON of the headers', max_length=40, unique=True, verbose_name='Digest')),
+                ('headers', models.JSONField(help_text='Selected HTTP headers from the request', verbose_name='Headers')),
+            ],
+            options={
+                'verbose_name': 'Header Set',
+                'verbose_name_plural': 'Header Sets',
+            },
+        ),
+        migrations.CreateModel(
+            name='UserAgent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('agent', models.CharField(help_text='Browser or client information', max_length=300, unique=True, verbose_name='User Agent')),
+            ],
+            options={
+                'verbose_name': 'User Agent',
+                'verbose_name_plural': 'User Agents',
+            },
+        ),
+        migrations.AddField(
+            model_name='requestlog',
+            name='header_set',
+            field=models.ForeignKey(blank=True, help_text='Reference to header set object', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='log', to='request_track.headerset', verbose_name='Header Set'),
+        ),
+        migrations.AddField(
+            model_name='requestlog',
+            name='agent',
+            field=models.ForeignKey(blank=True, help_text='Reference to user agent object', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='log', to='request_track.useragent', verbose_name='User Agent Reference'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('request_track', '0006_useragent_headerset'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='requestlogrollup',
+            name='users_sketch',
+            field=models.BinaryField(default=b'', help_text='Serialized sketch of the distinct users', verbose_name='Users Sketch'),
+        ),
+        migrations.AlterField(
+            model_name='requestlogrollup',
+            name='users',
+            field=models.PositiveIntegerField(default=0, help_text='Estimated number of distinct authenticated users', verbose_name='Users'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('request_track', '0007_requestlogrollup_users_sketch'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='requestlogrollup',
+            name='route',
+            field=models.CharField(help_text='URL pattern of the requests, or their path if unresolved', max_length=1000, verbose_name='Route'),
+        ),
+        migrations.AlterField(
+            model_name='routelatencysketch',
+            name='route',
+            field=models.CharField(help_text='URL pattern of the requests, or their path if unresolved', max_length=1000, verbose_name='Route'),
+        ),
+    ]
@@ -26,6 +26,89 @@ class IpAddress(models.Model):
         return str(self.ip)
 
 
+class RoutePattern(models.Model):
+    """
+    Represents a URL pattern requests were resolved to.
+
+    Each pattern is stored once, so request logs reference it by a small
+    integer key and can be grouped by view instead of by raw path.
+
+    Attributes:
+        pattern: The URL pattern (e.g. ``orders/<int:pk>/``) or view name
+    """
+
+    pattern = models.CharField(
+        max_length=1000,
+        unique=True,
+        verbose_name="Pattern",
+        help_text="URL pattern or view name the request was resolved to",
+    )
+
+    class Meta:
+        verbose_name = "Route Pattern"
+        verbose_name_plural = "Route Patterns"
+
+    def __str__(self) -> str:
+        return self.pattern
+
+
+class UserAgent(models.Model):
+    """
+    Represents a user agent string from HTTP requests.
+
+    Used when ``USE_USER_AGENT_MODEL`` is enabled, so each distinct user agent
+    is stored once and request logs reference it by a small integer key.
+
+    Attributes:
+        agent: The user agent string
+    """
+
+    agent = models.CharField(
+        max_length=300,
+        unique=True,
+        verbose_name="User Agent",
+        help_text="Browser or client information",
+    )
+
+    class Meta:
+        verbose_name = "User Agent"
+        verbose_name_plural = "User Agents"
+
+    def __str__(self) -> str:
+        return self.agent
+
+
+class HeaderSet(models.Model):
+    """
+    Represents a distinct set of logged header values.
+
+    Used when ``USE_HEADER_SET_MODEL`` is enabled, so each distinct set of
+    logged headers is stored once and request logs reference it by a small
+    integer key.
+
+    Attributes:
+        digest: SHA-1 of the canonical JSON of the headers, unique per set
+        headers: The logged headers
+    """
+
+    digest = models.CharField(
+        max_length=40,
+        unique=True,
+        verbose_name="Digest",
+        help_text="SHA-1 of the canonical JSON of the headers",
+    )
+    headers = models.JSONField(
+        verbose_name="Headers", help_text="Selected HTTP headers from the request"
+    )
+
+    class Meta:
+        verbose_name = "Header Set"
+        verbose_name_plural = "Header Sets"
+
+    def __str__(self) -> str:
+        return ", ".join(f"{key}: {value}" for key, value in self.headers.items())
+
+
 class RequestLog(models.Model):
     """
     Stores detailed information about HTTP requests.
@@ -37,14 +120,21 @@ class RequestLog(models.Model):
         ip: Foreign key to IpAddress model (used when USE_IP_ADDRESS_MODEL=True)
         ip_address: Direct IP address string (used when USE_IP_ADDRESS_MODEL=False)
         user: The authenticated user who made the request (null for anonymous)
-        user_agent: Browser/client user agent string
+        user_agent: Browser/client user agent (used when USE_USER_AGENT_MODEL=False)
+        agent: Foreign key to UserAgent model (used when USE_USER_AGENT_MODEL=True)
         route: The requested URL path
+        pattern: URL pattern the route was resolved to (null if unresolved)
         method: The HTTP method (GET, POST, etc.)
         query_params: URL query parameters
         status_code: HTTP response status code
         requested_at: Timestamp when the request was made
         app_name: Django application name if available
         headers: JSON field for storing logged request headers
+            (used when USE_HEADER_SET_MODEL=False)
+        header_set: Foreign key to HeaderSet model (used when USE_HEADER_SET_MODEL=True)
+        duration: Time spent producing the response, in microseconds
+        response_size: Size of the response body in bytes
+        request_size: Size of the request body in bytes
     """
 
     ip = models.ForeignKey(
@@ -77,12 +167,30 @@ class RequestLog(models.Model):
         verbose_name="User Agent",
         help_text="Browser or client information",
     )
+    agent = models.ForeignKey(
+        UserAgent,
+        on_delete=models.SET_NULL,
+        related_name="log",
+        null=True,
+        blank=True,
+        verbose_name="User Agent Reference",
+        help_text="Reference to user agent object",
+    )
     route = models.CharField(
         max_length=1000,
         db_index=True,
         verbose_name="Route",
         help_text="URL path that was requested",
     )
+    pattern = models.ForeignKey(
+        RoutePattern,
+        on_delete=models.SET_NULL,
+        related_name="log",
+        null=True,
+        blank=True,
+        verbose_name="Pattern",
+        help_text="URL pattern the route was resolved to",
+    )
     method = models.CharField(
         max_length=10, verbose_name="Method", help_text="HTTP method (GET, POST, etc.)"
     )
@@ -111,6 +219,36 @@ class RequestLog(models.Model):
         verbose_name="Headers",
         help_text="Selected HTTP headers from the request",
     )
+    header_set = models.ForeignKey(
+        HeaderSet,
+        on_delete=models.SET_NULL,
+        related_name="log",
+        null=True,
+        blank=True,
+        verbose_name="Header Set",
+        help_text="Reference to header set object",
+    )
+    duration = models.PositiveBigIntegerField(
+        null=True,
+        blank=True,
+        db_index=True,
+        verbose_name="Duration (µs)",
+        help_text="Time spent producing the response, in microseconds",
+    )
+    response_size = models.PositiveBigIntegerField(
+        null=True,
+        blank=True,
+        db_index=True,
+        verbose_name="Response Size",
+        help_text="Size of the response body in bytes (unknown for streaming responses)",
+    )
+    request_size = models.PositiveBigIntegerField(
+        null=True,
+        blank=True,
+        db_index=True,
+        verbose_name="Request Size",
+        help_text="Size of the request body in bytes",
+    )
 
     class Meta:
         verbose_name = "Request Log"
@@ -129,9 +267,140 @@ class RequestLog(models.Model):
     @cached_property
     def effective_ip(self) -> str:
         """Return the effective IP address regardless of storage method."""
-        if self.ip:
-            return str(self.ip.ip)
+        # The foreign key holds the address itself, no need to fetch the row
+        if self.ip_id:
+            return str(self.ip_id)
         elif self.ip_address:
             return str(self.ip_address)
         else:
             return "Unknown"
+
+    @cached_property
+    def effective_user_agent(self) -> str:
+        """Return the user agent regardless of storage method."""
+        if self.agent_id:
+            return self.agent.agent
+        return self.user_agent
+
+    @cached_property
+    def effective_headers(self) -> dict | None:
+        """Return the logged headers regardless of storage method."""
+        if self.header_set_id:
+            return self.header_set.headers
+        return self.headers
+
+
+class RequestLogRollup(models.Model):
+    """
+    Per-minute request counts, aggregated from request logs as they are flushed.
+
+    Rollups are kept when raw logs are removed, and reading them is much
+    cheaper than scanning ``RequestLog`` for traffic statistics.
+
+    Attributes:
+        bucket: Start of the minute the requests were made in
+        route: URL pattern of the requests, or their path if unresolved
+        method: The HTTP method
+        status_class: First digit of the status code (2 for 2xx, 5 for 5xx...)
+        app_name: Django application name, empty if unknown
+        count: Number of requests
+        users: Estimated number of distinct authenticated users
+        users_sketch: Serialized ``rollups.UserSketch`` the estimate comes from
+    """
+
+    bucket = models.DateTimeField(
+        verbose_name="Bucket", help_text="Start of the minute of the requests"
+    )
+    route = models.CharField(
+        max_length=1000,
+        verbose_name="Route",
+        help_text="URL pattern of the requests, or their path if unresolved",
+    )
+    method = models.CharField(
+        max_length=10, verbose_name="Method", help_text="HTTP method (GET, POST, etc.)"
+    )
+    status_class = models.PositiveSmallIntegerField(
+        verbose_name="Status Class", help_text="First digit of the status code"
+    )
+    app_name = models.CharField(
+        max_length=100,
+        blank=True,
+        default="",
+        verbose_name="App Name",
+        help_text="Django application name if available",
+    )
+    count = models.PositiveIntegerField(
+        default=0, verbose_name="Count", help_text="Number of requests"
+    )
+    users = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Users",
+        help_text="Estimated number of distinct authenticated users",
+    )
+    users_sketch = models.BinaryField(
+        default=b"",
+        verbose_name="Users Sketch",
+        help_text="Serialized sketch of the distinct users",
+    )
+
+    class Meta:
+        verbose_name = "Request Log Rollup"
+        verbose_name_plural = "Request Log Rollups"
+        ordering = ["-bucket"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["bucket", "route", "method", "status_class", "app_name"],
+                name="request_track_rollup_unique",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.bucket} - {self.method} {self.route} - {self.status_class}xx"
+
+
+class RouteLatencySketch(models.Model):
+    """
+    Mergeable summary of the response times of one route over a time bucket.
+
+    Built from request logs as they are flushed, so latency percentiles can be
+    computed over any time range without reading ``RequestLog`` rows.
+
+    Attributes:
+        bucket: Start of the time bucket the requests were made in
+        route: URL pattern of the requests, or their path if unresolved
+        method: The HTTP method
+        count: Number of durations in the sketch
+        sketch: Serialized ``sketches.LatencySketch``
+    """
+
+    bucket = models.DateTimeField(
+        verbose_name="Bucket", help_text="Start of the time bucket of the requests"
+    )
+    route = models.CharField(
+        max_length=1000,
+        verbose_name="Route",
+        help_text="URL pattern of the requests, or their path if unresolved",
+    )
+    method = models.CharField(
+        max_length=10, verbose_name="Method", help_text="HTTP method (GET, POST, etc.)"
+    )
+    count = models.PositiveIntegerField(
+        default=0, verbose_name="Count", help_text="Number of durations in the sketch"
+    )
+    sketch = models.BinaryField(
+        default=b"", verbose_name="Sketch", help_text="Serialized latency sketch"
+    )
+
+    class Meta:
+        verbose_name = "Route Latency Sketch"
+        verbose_name_plural = "Route Latency Sketches"
+        ordering = ["-bucket"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["bucket", "route", "method"],
+                name="request_track_latency_sketch_unique",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.bucket} - {self.method} {self.route} - {self.count}"
@@ -0,0 +1,93 @@
+"""
+Admin pagination that does not count large tables.
+
+Counting every row of a large log table takes a full scan. When the changelist
+is not filtered, ``EstimatedCountPaginator`` uses the row estimate kept by the
+database instead, as soon as it reaches ``ADMIN_COUNT_ESTIMATE_THRESHOLD``.
+Smaller tables, filtered querysets and databases without an estimate are
+counted exactly.
+"""
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Model, QuerySet
+from django.utils.functional import cached_property
+
+from .settings import REQUEST_TRACK_SETTINGS
+
+
+def estimate_row_count(model: type[Model], using: str) -> int | None:
+    """
+    Return the database's estimate of the number of rows of a model's table.
+
+    On PostgreSQL this is ``pg_class.reltuples``, summed over the partitions of
+    a partitioned table; on MySQL it is ``information_schema.TABLES.TABLE_ROWS``.
+
+    Args:
+        model: The model whose table is estimated
+        using: Database alias
+
+    Returns:
+        The estimated row count, or None when the database has no estimate
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == "postgresql":
+        sql = (
+            "SELECT CASE WHEN t.relkind = 'p' THEN ("
+            "SELECT SUM(GREATEST(c.reltuples, 0)) FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = t.oid"
+            ") ELSE t.reltuples END "
+            "FROM pg_class t WHERE t.oid = to_regclass(%s)"
+        )
+    elif connection.vendor == "mysql":
+        sql = (
+            "SELECT TABLE_ROWS FROM information_schema.TABLES "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s"
+        )
+    else:
+        return None
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [table])
+        row = cursor.fetchone()
+    # reltuples is -1 for tables never vacuumed or analyzed
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+def count_rows(queryset: QuerySet) -> int:
+    """
+    Count a queryset, using the table's row estimate for large unfiltered ones.
+
+    The estimate is used once it reaches ``ADMIN_COUNT_ESTIMATE_THRESHOLD``;
+    smaller tables and filtered querysets are counted exactly.
+
+    Args:
+        queryset: The queryset to count
+
+    Returns:
+        The estimated or exact number of rows
+    """
+    threshold = REQUEST_TRACK_SETTINGS.get("ADMIN_COUNT_ESTIMATE_THRESHOLD", 100000)
+    if (
+        threshold is not None
+        and not queryset.query.where
+        and not queryset.query.is_sliced
+        and not queryset.query.distinct
+    ):
+        estimate = estimate_row_count(queryset.model, queryset.db)
+        if estimate is not None and estimate >= threshold:
+            return estimate
+    return queryset.count()
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that uses the table's row estimate for unfiltered querysets."""
+
+    @cached_property
+    def count(self) -> int:
+        if isinstance(self.object_list, QuerySet):
+            return count_rows(self.object_list)
+        return super().count
@@ -0,0 +1,320 @@
+"""
+Time partitioning of the ``RequestLog`` table.
+
+With ``PARTITION_INTERVAL`` set to ``"day"`` or ``"month"``, the table can be
+converted on PostgreSQL into a table partitioned by range on ``requested_at``
+with the ``request_log_partitions --convert`` command. Retention then drops
+whole partitions instead of deleting their rows one by one (see
+``retention.purge_older_than``).
+"""
+
+import re
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import RequestLog
+from .settings import REQUEST_TRACK_SETTINGS
+
+PARTITION_INTERVALS = ("day", "month")
+
+# Upper bound in the output of pg_get_expr(relpartbound), e.g.
+# FOR VALUES FROM ('2024-01-01 00:00:00+00') TO ('2024-02-01 00:00:00+00')
+_UPPER_BOUND_RE = re.compile(r"TO \('([^']+)'\)")
+
+
+def get_partition_interval() -> str | None:
+    """Return the configured ``PARTITION_INTERVAL``, or None when disabled."""
+    interval = REQUEST_TRACK_SETTINGS.get("PARTITION_INTERVAL", None)
+    if interval is not None and interval not in PARTITION_INTERVALS:
+        raise ImproperlyConfigured(
+            f"Unknown PARTITION_INTERVAL {interval!r} in REQUEST_TRACK_SETTINGS. "
+            f"Choose one of: {', '.join(PARTITION_INTERVALS)}."
+        )
+    return interval
+
+
+def period_start(moment: datetime, interval: str) -> datetime:
+    """Return the start, in UTC, of the period containing ``moment``."""
+    start = moment.astimezone(dt_timezone.utc).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    if interval == "month":
+        start = start.replace(day=1)
+    return start
+
+
+def next_period(start: datetime, interval: str) -> datetime:
+    """Return the start of the period following the one starting at ``start``."""
+    if interval == "day":
+        return start + timedelta(days=1)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def partition_name(start: datetime, interval: str) -> str:
+    """Return the table name of the partition starting at ``start``."""
+    suffix = start.strftime("%Y%m%d" if interval == "day" else "%Y%m")
+    return f"{RequestLog._meta.db_table}_{suffix}"
+
+
+def is_partitioned(using: str) -> bool:
+    """Return True if the ``RequestLog`` table is a partitioned table."""
+    connection = connections[using]
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)",
+            [RequestLog._meta.db_table],
+        )
+        row = cursor.fetchone()
+    return row is not None and row[0] == "p"
+
+
+def parse_upper_bound(bound: str) -> datetime | None:
+    """
+    Return the upper bound of a partition from its ``pg_get_expr`` expression.
+
+    The bound is parsed with ``parse_datetime`` as it carries an offset like
+    ``+00``, which ``datetime.fromisoformat`` rejects before Python 3.11.
+
+    Args:
+        bound: The partition bound expression
+
+    Returns:
+        The upper bound, or None for the default partition
+    """
+    match = _UPPER_BOUND_RE.search(bound)
+    return parse_datetime(match[1]) if match else None
+
+
+def list_partitions(using: str) -> list[tuple[str, datetime | None]]:
+    """
+    List the partitions of the ``RequestLog`` table.
+
+    Args:
+        using: Database alias
+
+    Returns:
+        ``(name, upper bound)`` pairs; the bound is None for the default partition
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+            "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(%s) ORDER BY c.relname",
+            [RequestLog._meta.db_table],
+        )
+        rows = cursor.fetchall()
+
+    return [(name, parse_upper_bound(bound)) for name, bound in rows]
+
+
+def ensure_partitions(
+    using: str, ahead: int | None = None, now: datetime | None = None
+) -> list[str]:
+    """
+    Create the partitions for the current period and ``ahead`` following ones.
+
+    Partitions are only added after the newest existing one, so the ranges
+    never overlap. Rows arriving for a period without a partition land in the
+    default partition; when a partition is created for them later, they are
+    moved out of the default partition into it, under a lock on the default
+    partition that blocks inserts of rows without a partition.
+
+    Args:
+        using: Database alias
+        ahead: Number of future periods, defaults to ``PARTITION_PREMAKE``
+        now: Current time, defaults to ``timezone.now()``
+
+    Returns:
+        Names of the partitions created
+    """
+    interval = get_partition_interval()
+    if ahead is None:
+        ahead = REQUEST_TRACK_SETTINGS.get("PARTITION_PREMAKE", 3)
+    current = period_start(now or timezone.now(), interval)
+
+    end = current
+    for _ in range(ahead + 1):
+        end = next_period(end, interval)
+
+    start = current
+    partitions = list_partitions(using)
+    bounds = [upper for _, upper in partitions if upper is not None]
+    if bounds:
+        start = max(start, max(bounds))
+    default = next((name for name, upper in partitions if upper is None), None)
+
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    table = RequestLog._meta.db_table
+    created = []
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        while start < end:
+            stop = next_period(start, interval)
+            name = partition_name(start, interval)
+            values = (
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{stop.isoformat()}')"
+            )
+            if default is not None and _default_has_rows(cursor, default, start, stop):
+                # PostgreSQL refuses a partition for rows already in the default
+                # partition, so they are moved into the new table before it is
+                # attached
+                cursor.execute(
+                    f"CREATE TABLE {quote(name)} (LIKE {quote(table)} "
+                    f"INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE)"
+                )
+                cursor.execute(
+                    f"WITH moved AS (DELETE FROM {quote(default)} "
+                    f"WHERE requested_at >= %s AND requested_at < %s RETURNING *) "
+                    f"INSERT INTO {quote(name)} SELECT * FROM moved",
+                    [start, stop],
+                )
+                cursor.execute(
+                    f"ALTER TABLE {quote(table)} "
+                    f"ATTACH PARTITION {quote(name)} {values}"
+                )
+            else:
+                cursor.execute(
+                    f"CREATE TABLE IF NOT EXISTS {quote(name)} "
+                    f"PARTITION OF {quote(table)} {values}"
+                )
+            created.append(name)
+            start = stop
+    return created
+
+
+def _default_has_rows(cursor, default: str, start: datetime, stop: datetime) -> bool:
+    """Return True if the default partition holds rows between start and stop."""
+    quote = cursor.db.ops.quote_name
+    cursor.execute(
+        f"SELECT 1 FROM {quote(default)} "
+        f"WHERE requested_at >= %s AND requested_at < %s LIMIT 1",
+        [start, stop],
+    )
+    return cursor.fetchone() is not None
+
+
+def convert_to_partitioned(using: str, now: datetime | None = None) -> list[str]:
+    """
+    Turn the ``RequestLog`` table into a table partitioned on ``requested_at``.
+
+    The existing table is kept as the first partition, covering everything up
+    to the end of the current period, so no rows are copied. The primary key
+    becomes ``(id, requested_at)`` as PostgreSQL requires the partition key in
+    it, and ids come from a sequence instead of an identity column. Indexes and
+    foreign keys are recreated on the partitioned table under their names.
+
+    Everything runs in one transaction holding an ACCESS EXCLUSIVE lock on the
+    table: the recreated indexes are built and ``ATTACH PARTITION`` scans every
+    existing row to validate the partition bound, so reads and writes of the
+    table block for a time proportional to its size.
+
+    Args:
+        using: Database alias, which must be PostgreSQL
+        now: Current time, defaults to ``timezone.now()``
+
+    Returns:
+        Names of the partitions created
+    """
+    interval = get_partition_interval()
+    now = now or timezone.now()
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    table = RequestLog._meta.db_table
+    legacy = f"{table}_legacy"
+    sequence = f"{table}_partitioned_id_seq"
+
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {quote(table)} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(f"SELECT max(requested_at), max(id) FROM {quote(table)}")
+        newest, max_id = cursor.fetchone()
+        bound = next_period(period_start(max(newest or now, now), interval), interval)
+
+        cursor.execute(
+            "SELECT i.relname, pg_get_indexdef(i.oid) "
+            "FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid "
+            "WHERE x.indrelid = %s::regclass AND NOT x.indisprimary",
+            [table],
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'f'",
+            [table],
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(
+            "SELECT attidentity FROM pg_attribute "
+            "WHERE attrelid = %s::regclass AND attname = 'id'",
+            [table],
+        )
+        (identity,) = cursor.fetchone()
+
+        # Move the current table and its index names out of the way
+        cursor.execute(f"ALTER TABLE {quote(table)} RENAME TO {quote(legacy)}")
+        for i, (name, _) in enumerate(indexes):
+            cursor.execute(
+                f"ALTER INDEX {quote(name)} RENAME TO {quote(f'{legacy}_{i}')}"
+            )
+        if identity:
+            cursor.execute(f"ALTER TABLE {quote(legacy)} ALTER COLUMN id DROP IDENTITY")
+        else:
+            cursor.execute(f"ALTER TABLE {quote(legacy)} ALTER COLUMN id DROP DEFAULT")
+
+        cursor.execute(
+            f"CREATE TABLE {quote(table)} (LIKE {quote(legacy)} "
+            f"INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE) "
+            f"PARTITION BY RANGE (requested_at)"
+        )
+        cursor.execute(f"CREATE SEQUENCE {quote(sequence)} OWNED BY {quote(table)}.id")
+        if max_id:
+            cursor.execute("SELECT setval(%s, %s)", [sequence, max_id])
+        cursor.execute(
+            f"ALTER TABLE {quote(table)} ALTER COLUMN id "
+            f"SET DEFAULT nextval('{sequence}'::regclass)"
+        )
+        cursor.execute(f"ALTER TABLE {quote(table)} ADD PRIMARY KEY (id, requested_at)")
+        for name, definition in foreign_keys:
+            cursor.execute(
+                f"ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} {definition}"
+            )
+        for _, definition in indexes:
+            cursor.execute(definition)
+
+        cursor.execute(
+            f"ALTER TABLE {quote(table)} ATTACH PARTITION {quote(legacy)} "
+            f"FOR VALUES FROM (MINVALUE) TO ('{bound.isoformat()}')"
+        )
+        cursor.execute(
+            f"CREATE TABLE {quote(table + '_default')} "
+            f"PARTITION OF {quote(table)} DEFAULT"
+        )
+        return ensure_partitions(using, now=now)
+
+
+def drop_partitions_before(cutoff: datetime, using: str) -> list[str]:
+    """
+    Drop the partitions holding only rows older than ``cutoff``.
+
+    Args:
+        cutoff: Partitions whose upper bound is at or before this are dropped
+        using: Database alias
+
+    Returns:
+        Names of the partitions dropped
+    """
+    quote = connections[using].ops.quote_name
+    dropped = []
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        for name, upper in list_partitions(using):
+            if upper is not None and upper <= cutoff:
+                cursor.execute(f"DROP TABLE {quote(name)}")
+                dropped.append(name)
+    return dropped
@@ -0,0 +1,211 @@
+"""
+Removal of old request logs.
+
+Rows are deleted with raw ``DELETE`` statements over bounded primary key
+ranges, each committed on its own. Nothing cascades from ``RequestLog``, so
+the ORM's collector is not needed, and short batches keep locks, undo logs
+and replication lag small even when millions of rows go.
+"""
+
+import re
+import time
+from datetime import datetime, timedelta
+from typing import Callable
+
+from django.db import connections, router, transaction
+from django.db.models import Min
+
+from .models import RequestLog
+from .partitions import drop_partitions_before, is_partitioned
+from .settings import REQUEST_TRACK_SETTINGS
+
+_AGE_RE = re.compile(r"^(\d+)([mhdw]?)$")
+_AGE_UNITS = {"m": "minutes", "h": "hours", "d": "days", "w": "weeks", "": "days"}
+
+
+def parse_age(value: str) -> timedelta:
+    """
+    Parse an age such as ``"30d"``, ``"12h"``, ``"2w"`` or ``"90m"``.
+
+    Args:
+        value: Number followed by an optional unit (days when omitted)
+
+    Returns:
+        The age as a timedelta
+    """
+    match = _AGE_RE.match(value.strip())
+    if match is None:
+        raise ValueError(
+            f"Invalid age {value!r}. Use a number followed by m, h, d or w (e.g. 30d)."
+        )
+    return timedelta(**{_AGE_UNITS[match[2]]: int(match[1])})
+
+
+def delete_older_than(
+    cutoff: datetime,
+    using: str | None = None,
+    batch_size: int | None = None,
+    sleep: float | None = None,
+    progress: Callable[[int], None] | None = None,
+) -> int:
+    """
+    Delete request logs older than ``cutoff`` in primary key range batches.
+
+    The upper id is taken from the newest old row through the ``requested_at``
+    index, then ``[start, start + batch_size)`` id ranges are deleted up to it.
+    Old rows with higher ids, written late from a buffer, are then looked up
+    ``batch_size`` at a time through the same index and deleted by id, so no
+    statement scans the recent rows.
+
+    Args:
+        cutoff: Logs requested before this moment are deleted
+        using: Database alias, defaults to the router's choice for ``RequestLog``
+        batch_size: Width of each id range (defaults to RETENTION_BATCH_SIZE)
+        sleep: Seconds to pause between batches (defaults to RETENTION_BATCH_SLEEP)
+        progress: Called with the running total of deleted rows after each batch
+
+    Returns:
+        Number of rows deleted
+    """
+    if using is None:
+        using = router.db_for_write(RequestLog)
+    if batch_size is None:
+        batch_size = REQUEST_TRACK_SETTINGS.get("RETENTION_BATCH_SIZE", 10000)
+    if sleep is None:
+        sleep = REQUEST_TRACK_SETTINGS.get("RETENTION_BATCH_SLEEP", 0)
+
+    logs = RequestLog.objects.using(using)
+    high = (
+        logs.filter(requested_at__lt=cutoff)
+        .order_by("-requested_at")
+        .values_list("id", flat=True)
+        .first()
+    )
+    if high is None:
+        return 0
+    low = logs.aggregate(low=Min("id"))["low"]
+    late = logs.filter(requested_at__lt=cutoff, id__gt=high).values_list(
+        "id", flat=True
+    )
+
+    connection = connections[using]
+    table = connection.ops.quote_name(RequestLog._meta.db_table)
+    cutoff = RequestLog._meta.get_field("requested_at").get_db_prep_value(
+        cutoff, connection
+    )
+
+    def delete(where: str, params: list) -> int:
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {table} WHERE {where} AND requested_at < %s",
+                [*params, cutoff],
+            )
+            return cursor.rowcount
+
+    deleted = 0
+    start = low
+    while start <= high:
+        deleted += delete("id >= %s AND id < %s", [start, start + batch_size])
+        start += batch_size
+        if progress is not None:
+            progress(deleted)
+        if sleep and start <= high:
+            time.sleep(sleep)
+
+    # Old rows written late from a buffer have ids above high
+    while True:
+        ids = list(late[:batch_size])
+        if ids:
+            placeholders = ", ".join(["%s"] * len(ids))
+            deleted += delete(f"id IN ({placeholders})", ids)
+        if progress is not None:
+            progress(deleted)
+        if len(ids) < batch_size:
+            return deleted
+        if sleep:
+            time.sleep(sleep)
+
+
+def purge_older_than(
+    cutoff: datetime,
+    using: str | None = None,
+    batch_size: int | None = None,
+    sleep: float | None = None,
+    progress: Callable[[int], None] | None = None,
+) -> tuple[int, list[str]]:
+    """
+    Remove request logs older than ``cutoff``.
+
+    On a partitioned table, whole partitions before the cutoff are dropped
+    first, so only the rows of the partition containing the cutoff are left to
+    ``delete_older_than``.
+
+    Args:
+        cutoff: Logs requested before this moment are removed
+        using: Database alias, defaults to the router's choice for ``RequestLog``
+        batch_size: Width of each id range deleted at once
+        sleep: Seconds to pause between batches
+        progress: Called with the running total of deleted rows after each batch
+
+    Returns:
+        Number of rows deleted and names of the partitions dropped
+    """
+    if using is None:
+        using = router.db_for_write(RequestLog)
+    dropped = drop_partitions_before(cutoff, using) if is_partitioned(using) else []
+    deleted = delete_older_than(cutoff, using, batch_size, sleep, progress)
+    return deleted, dropped
+
+
+def keep_latest(
+    n: int,
+    using: str | None = None,
+    batch_size: int | None = None,
+    sleep: float | None = None,
+    progress: Callable[[int], None] | None = None,
+) -> tuple[int, list[str]]:
+    """
+    Remove all request logs but the ``n`` most recent ones.
+
+    The newest row to remove is found with a single ``OFFSET n`` lookup on the
+    ``requested_at`` index. Older logs go through ``purge_older_than`` and the
+    ones requested at the very same moment are deleted by id.
+
+    Args:
+        n: Number of logs to keep
+        using: Database alias, defaults to the router's choice for ``RequestLog``
+        batch_size: Width of each id range deleted at once
+        sleep: Seconds to pause between batches
+        progress: Called with the running total of deleted rows after each batch
+
+    Returns:
+        Number of rows deleted and names of the partitions dropped
+    """
+    if using is None:
+        using = router.db_for_write(RequestLog)
+    boundary = (
+        RequestLog.objects.using(using)
+        .order_by("-requested_at", "-id")
+        .values_list("requested_at", "id")[n : n + 1]
+        .first()
+    )
+    if boundary is None:
+        return 0, []
+    cutoff, boundary_id = boundary
+
+    deleted, dropped = purge_older_than(cutoff, using, batch_size, sleep, progress)
+
+    connection = connections[using]
+    table = connection.ops.quote_name(RequestLog._meta.db_table)
+    cutoff = RequestLog._meta.get_field("requested_at").get_db_prep_value(
+        cutoff, connection
+    )
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {table} WHERE requested_at = %s AND id <= %s",
+            [cutoff, boundary_id],
+        )
+        deleted += cursor.rowcount
+    if progress is not None:
+        progress(deleted)
+    return deleted, dropped
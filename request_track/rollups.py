@@ -0,0 +1,189 @@
+"""
+Per-minute traffic rollups built from batches of request logs.
+
+``process_request_logs`` folds each flushed batch into
+``(minute, route, method, status class, app)`` counters in memory, then adds
+them to ``RequestLogRollup`` rows with one upsert per chunk of keys. Routes
+are counted by URL pattern, so ``/items/1/`` and ``/items/2/`` share a row;
+only requests that did not resolve are counted by path.
+
+Distinct users are counted with a ``UserSketch`` per row, merged into the
+stored one under a row lock, so a user seen in several batches of the same
+minute is still counted once.
+"""
+
+import hashlib
+import math
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Hashable, Iterable
+
+from django.db import connections, router, transaction
+from django.db.models import F
+
+from .models import RequestLogRollup
+from .utils import get_log_route, get_requested_at, lock_rows
+
+RollupKey = tuple[datetime, str, str, int, str]
+
+# Maximum number of rollup rows per upsert statement
+ROLLUP_BATCH_SIZE = 500
+
+_KEY_FIELDS = ("bucket", "route", "method", "status_class", "app_name")
+
+# Number of index bits of the user sketches, 2 ** 8 one-byte registers per row
+USER_SKETCH_PRECISION = 8
+
+_REGISTERS = 1 << USER_SKETCH_PRECISION
+_RANK_BITS = 64 - USER_SKETCH_PRECISION
+_ALPHA = 0.7213 / (1 + 1.079 / _REGISTERS)
+
+
+class UserSketch:
+    """
+    HyperLogLog estimate of a number of distinct users.
+
+    Each user id is hashed to 64 bits: the first ``USER_SKETCH_PRECISION``
+    bits pick a register, which keeps the highest rank of the first set bit
+    of the rest. Two sketches merge by taking the maximum of each register.
+    Estimates are within about 6.5% of the true count, and exact-ish for small
+    counts, where linear counting is used.
+
+    Args:
+        registers: Serialized registers, as returned by ``to_bytes``
+    """
+
+    def __init__(self, registers: bytes | None = None):
+        self.registers = bytearray(registers or bytes(_REGISTERS))
+
+    def add(self, value: Hashable) -> None:
+        """Add a user id."""
+        digest = hashlib.blake2b(str(value).encode(), digest_size=8).digest()
+        hashed = int.from_bytes(digest, "big")
+        index = hashed >> _RANK_BITS
+        rank = _RANK_BITS - (hashed & ((1 << _RANK_BITS) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "UserSketch") -> None:
+        """Add the users of another sketch to this one."""
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def estimate(self) -> int:
+        """Return the estimated number of distinct users."""
+        zeros = self.registers.count(0)
+        raw = _ALPHA * _REGISTERS**2 / sum(2.0**-rank for rank in self.registers)
+        if raw <= 2.5 * _REGISTERS and zeros:
+            return round(_REGISTERS * math.log(_REGISTERS / zeros))
+        return round(raw)
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
+
+
+def rollup_key(log: dict[str, Any]) -> RollupKey:
+    """Return the rollup row a log dict is counted in."""
+    return (
+        get_requested_at(log).replace(second=0, microsecond=0),
+        get_log_route(log),
+        log["method"],
+        log["status_code"] // 100,
+        log.get("app_name") or "",
+    )
+
+
+def aggregate_logs(logs: Iterable[dict[str, Any]]) -> dict[RollupKey, list]:
+    """
+    Count a batch of log dicts per rollup row.
+
+    Args:
+        logs: Log dicts as produced by ``params_request``
+
+    Returns:
+        ``[count, set of user ids]`` for each rollup key
+    """
+    rollups = defaultdict(lambda: [0, set()])
+    for log in logs:
+        rollup = rollups[rollup_key(log)]
+        rollup[0] += 1
+        if log.get("user_id") is not None:
+            rollup[1].add(log["user_id"])
+    return dict(rollups)
+
+
+def _upsert_sql(connection, rows: int) -> str:
+    quote = connection.ops.quote_name
+    table = quote(RequestLogRollup._meta.db_table)
+    columns = [quote(name) for name in (*_KEY_FIELDS, "count", "users", "users_sketch")]
+    placeholder = "({})".format(", ".join(["%s"] * len(columns)))
+    sql = "INSERT INTO {} ({}) VALUES {}".format(
+        table, ", ".join(columns), ", ".join([placeholder] * rows)
+    )
+    count = quote("count")
+    if connection.vendor == "mysql":
+        return sql + f" ON DUPLICATE KEY UPDATE {count} = {count} + VALUES({count})"
+    return sql + " ON CONFLICT ({}) DO UPDATE SET {} = {}.{} + EXCLUDED.{}".format(
+        ", ".join(quote(name) for name in _KEY_FIELDS), count, table, count, count
+    )
+
+
+def _merge_users(queryset, rollups: list[tuple[RollupKey, list]]) -> None:
+    """Merge the users of a batch into the sketches of locked rollup rows."""
+    users = {key: user_ids for key, (_, user_ids) in rollups if user_ids}
+    if not users:
+        return
+    updated = []
+    for row in lock_rows(queryset, _KEY_FIELDS, sorted(users)):
+        sketch = UserSketch(bytes(row.users_sketch))
+        for user_id in users[tuple(getattr(row, name) for name in _KEY_FIELDS)]:
+            sketch.add(user_id)
+        row.users_sketch = sketch.to_bytes()
+        row.users = sketch.estimate()
+        updated.append(row)
+    queryset.bulk_update(updated, ["users_sketch", "users"])
+
+
+def save_rollups(logs: list[dict[str, Any]], using: str | None = None) -> int:
+    """
+    Add a batch of log dicts to the per-minute rollups.
+
+    On PostgreSQL, SQLite and MySQL the counters are added with an upsert, so
+    concurrent workers never overwrite each other. Other databases update the
+    rows one by one. The users of the batch are then merged into the user
+    sketches of the rows, locked in a consistent order.
+
+    Args:
+        logs: Log dicts as produced by ``params_request``
+        using: Database alias, defaults to the router's choice for ``RequestLogRollup``
+
+    Returns:
+        Number of rollup rows touched
+    """
+    if using is None:
+        using = router.db_for_write(RequestLogRollup)
+    rollups = sorted(aggregate_logs(logs).items())
+    if not rollups:
+        return 0
+
+    connection = connections[using]
+    field = RequestLogRollup._meta.get_field("bucket")
+    queryset = RequestLogRollup.objects.using(using)
+    with transaction.atomic(using=using, savepoint=False):
+        if connection.vendor not in ("postgresql", "sqlite", "mysql"):
+            for key, (count, _) in rollups:
+                filters = dict(zip(_KEY_FIELDS, key))
+                if not queryset.select_for_update().filter(**filters).update(
+                    count=F("count") + count
+                ):
+                    queryset.create(**filters, count=count)
+        else:
+            with connection.cursor() as cursor:
+                for start in range(0, len(rollups), ROLLUP_BATCH_SIZE):
+                    chunk = rollups[start:start + ROLLUP_BATCH_SIZE]
+                    params = []
+                    for (bucket, *key), (count, _) in chunk:
+                        bucket = field.get_db_prep_save(bucket, connection)
+                        params.extend((bucket, *key, count, 0, b""))
+                    cursor.execute(_upsert_sql(connection, len(chunk)), params)
+        _merge_users(queryset, rollups)
+    return len(rollups)
@@ -0,0 +1,173 @@
+"""
+Compiled rules that decide which requests are logged.
+
+The filtering settings are snapshotted once and path lists are compiled into
+prefix tries, so deciding whether to log a request costs one walk over the
+path instead of a settings lookup and a scan of every configured prefix.
+The compiled rules are rebuilt when ``REQUEST_TRACK_SETTINGS`` changes.
+"""
+
+import enum
+import random
+from typing import Any, Iterable
+
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import HttpRequest
+
+from .settings import REQUEST_TRACK_SETTINGS
+
+# Trie key marking the end of a configured prefix
+_END = None
+
+
+class Decision(enum.IntEnum):
+    """Outcome of the checks that only need the request, not the user."""
+
+    SKIP = 0  # Do not log the request
+    LOG = 1  # Log the request whoever the user is
+    CHECK_USER = 2  # Log the request if USER_LOGGING_MODE allows the user
+
+
+class PrefixMatcher:
+    """
+    Prefix trie answering "does the path start with any configured prefix".
+
+    Matching walks the path once and stops at the first complete prefix, so
+    its cost depends on the path length rather than the number of prefixes.
+
+    Args:
+        prefixes: Path prefixes to match
+    """
+
+    def __init__(self, prefixes: Iterable[str]):
+        self._root: dict = {}
+        self._empty = True
+        for prefix in prefixes:
+            node = self._root
+            for char in prefix:
+                node = node.setdefault(char, {})
+            node[_END] = True
+            self._empty = False
+
+    def __bool__(self) -> bool:
+        return not self._empty
+
+    def matches(self, path: str) -> bool:
+        """Return True if ``path`` starts with one of the prefixes."""
+        node = self._root
+        if _END in node:
+            return True
+        for char in path:
+            node = node.get(char)
+            if node is None:
+                return False
+            if _END in node:
+                return True
+        return False
+
+
+class RequestFilter:
+    """
+    Snapshot of the filtering settings with compiled path matchers.
+
+    Args:
+        config: The ``REQUEST_TRACK_SETTINGS`` dict to compile
+    """
+
+    def __init__(self, config: dict[str, Any]):
+        self.sampling_rate = config.get("SAMPLING_RATE", 1.0)
+        self.force_paths_sampling = config.get("FORCE_PATHS_SAMPLING", False)
+        self.user_logging_mode = config.get("USER_LOGGING_MODE", "all")
+        self.force_paths = PrefixMatcher(config.get("FORCE_PATHS", []))
+
+        exclude_paths = config.get("EXCLUDE_PATHS", [])
+        self.exclude_all = "*" in exclude_paths
+        self.exclude_paths = PrefixMatcher(p for p in exclude_paths if p != "*")
+
+    def check_request(self, request: HttpRequest) -> Decision:
+        """
+        Apply the path and sampling rules, which do not need the user.
+
+        Running this before the view lets excluded and unsampled requests skip
+        every other step, including loading the user.
+
+        Args:
+            request: The Django HttpRequest object
+
+        Returns:
+            Decision telling whether the request is logged or the user decides
+        """
+        path = request.path
+
+        # Check if path is in force log paths
+        if self.force_paths and self.force_paths.matches(path):
+            if self.force_paths_sampling:
+                # Apply sampling rate if FORCE_PATHS_SAMPLING is enable
+                if random.random() < self.sampling_rate:
+                    return Decision.LOG
+                return Decision.SKIP
+            return Decision.LOG
+
+        # Check exclude paths
+        if self.exclude_all or self.exclude_paths.matches(path):
+            return Decision.SKIP
+
+        # Apply sampling rate
+        if 0 <= self.sampling_rate < 1 and random.random() > self.sampling_rate:
+            return Decision.SKIP
+
+        if self.user_logging_mode in ("authenticated", "anonymous"):
+            return Decision.CHECK_USER
+        return Decision.LOG
+
+    def check_user(self, user) -> bool:
+        """
+        Apply USER_LOGGING_MODE to the user making the request.
+
+        Args:
+            user: The user making the request
+
+        Returns:
+            Boolean indicating whether requests from this user are logged
+        """
+        if self.user_logging_mode == "authenticated":
+            return user.is_authenticated
+        if self.user_logging_mode == "anonymous":
+            return not user.is_authenticated
+        return True
+
+    def should_log(self, request: HttpRequest, user) -> bool:
+        """
+        Determine if the request should be logged.
+
+        Args:
+            request: The Django HttpRequest object
+            user: The user making the request
+
+        Returns:
+            Boolean indicating whether this request should be logged
+        """
+        decision = self.check_request(request)
+        if decision == Decision.CHECK_USER:
+            return self.check_user(user)
+        return decision == Decision.LOG
+
+
+_request_filter: RequestFilter | None = None
+
+
+def get_request_filter() -> RequestFilter:
+    """Return the compiled rules, compiling them on first use."""
+    global _request_filter
+    if _request_filter is None:
+        _request_filter = RequestFilter(dict(REQUEST_TRACK_SETTINGS.items()))
+    return _request_filter
+
+
+@receiver(setting_changed)
+def reset_request_filter(setting: str, **kwargs) -> None:
+    """Drop the compiled rules when ``REQUEST_TRACK_SETTINGS`` changes."""
+    global _request_filter
+    if setting == "REQUEST_TRACK_SETTINGS":
+        _request_filter = None
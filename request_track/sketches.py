@@ -0,0 +1,254 @@
+"""
+Per-route latency percentiles from mergeable sketches.
+
+``process_request_logs`` adds the durations of each flushed batch to one
+``LatencySketch`` per ``(time bucket, route, method)``, stored in
+``RouteLatencySketch``. Percentiles over any time range are then computed by
+merging the sketches of the covered buckets, without reading raw logs. Routes
+are keyed by URL pattern, falling back to the path of requests that did not
+resolve.
+
+The sketch keeps counts in logarithmic buckets, so every percentile it returns
+is within ``RELATIVE_ACCURACY`` of the true value, and two sketches merge by
+adding their counts.
+"""
+
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Iterable
+
+import msgpack
+from django.db import router, transaction
+
+from .models import RouteLatencySketch
+from .settings import REQUEST_TRACK_SETTINGS
+from .utils import get_log_route, get_requested_at, lock_rows
+
+RELATIVE_ACCURACY = 0.01
+
+_GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+
+SketchKey = tuple[datetime, str, str]
+
+_KEY_FIELDS = ("bucket", "route", "method")
+
+
+class LatencySketch:
+    """
+    Quantile sketch of durations with a bounded relative error.
+
+    A duration ``v`` is counted in bucket ``ceil(log(v) / log(gamma))``, whose
+    representative value is within ``RELATIVE_ACCURACY`` of every value in it.
+    Durations of 0 are counted apart.
+
+    Args:
+        counts: Count per bucket index
+        zero_count: Number of durations equal to 0
+    """
+
+    def __init__(self, counts: dict[int, int] | None = None, zero_count: int = 0):
+        self.counts = defaultdict(int, counts or {})
+        self.zero_count = zero_count
+
+    @property
+    def count(self) -> int:
+        return self.zero_count + sum(self.counts.values())
+
+    def add(self, value: float, count: int = 1) -> None:
+        """Add ``count`` occurrences of a duration."""
+        if value <= 0:
+            self.zero_count += count
+        else:
+            self.counts[math.ceil(math.log(value) / _LOG_GAMMA)] += count
+
+    def merge(self, other: "LatencySketch") -> None:
+        """Add the durations of another sketch to this one."""
+        self.zero_count += other.zero_count
+        for index, count in other.counts.items():
+            self.counts[index] += count
+
+    def quantile(self, q: float) -> float | None:
+        """
+        Return the duration below which a fraction ``q`` of the durations fall.
+
+        Args:
+            q: Quantile between 0 and 1
+
+        Returns:
+            The estimated duration, or None for an empty sketch
+        """
+        total = self.count
+        if not total:
+            return None
+        rank = q * (total - 1)
+        seen = self.zero_count
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen > rank:
+                return 2 * _GAMMA**index / (_GAMMA + 1)
+        return 2 * _GAMMA ** max(self.counts) / (_GAMMA + 1)
+
+    def to_bytes(self) -> bytes:
+        """Serialize the sketch as msgpack ``[zero count, first index, counts...]``."""
+        if not self.counts:
+            return msgpack.dumps([self.zero_count])
+        low, high = min(self.counts), max(self.counts)
+        return msgpack.dumps(
+            [self.zero_count, low, [self.counts.get(i, 0) for i in range(low, high + 1)]]
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "LatencySketch":
+        """Load a sketch serialized with ``to_bytes``."""
+        if not data:
+            return cls()
+        zero_count, *rest = msgpack.loads(data)
+        counts = {}
+        if rest:
+            low, dense = rest
+            counts = {low + i: count for i, count in enumerate(dense) if count}
+        return cls(counts, zero_count)
+
+
+def get_sketch_interval() -> int:
+    """Return the width in seconds of the sketch time buckets."""
+    return REQUEST_TRACK_SETTINGS.get("LATENCY_SKETCH_INTERVAL", 3600)
+
+
+def bucket_start(moment: datetime, interval: int) -> datetime:
+    """Return the start of the ``interval`` seconds bucket containing ``moment``."""
+    offset = int(moment.timestamp()) % interval
+    return moment.replace(microsecond=0) - timedelta(seconds=offset)
+
+
+def build_sketches(logs: Iterable[dict[str, Any]]) -> dict[SketchKey, LatencySketch]:
+    """
+    Sketch the durations of a batch of log dicts per bucket, route and method.
+
+    Args:
+        logs: Log dicts as produced by ``params_request``
+
+    Returns:
+        A sketch for each ``(bucket, route, method)``; logs without a duration
+        are skipped
+    """
+    interval = get_sketch_interval()
+    sketches = defaultdict(LatencySketch)
+    for log in logs:
+        if log.get("duration") is None:
+            continue
+        bucket = bucket_start(get_requested_at(log), interval)
+        sketches[(bucket, get_log_route(log), log["method"])].add(log["duration"])
+    return sketches
+
+
+def save_sketches(logs: list[dict[str, Any]], using: str | None = None) -> int:
+    """
+    Merge the durations of a batch of log dicts into the stored sketches.
+
+    Missing rows are created first with a conflict-ignoring insert, then all
+    rows of the batch are locked, merged and updated, so concurrent workers
+    never lose each other's durations.
+
+    Args:
+        logs: Log dicts as produced by ``params_request``
+        using: Database alias, defaults to the router's choice for ``RouteLatencySketch``
+
+    Returns:
+        Number of sketch rows updated
+    """
+    sketches = build_sketches(logs)
+    if not sketches:
+        return 0
+    if using is None:
+        using = router.db_for_write(RouteLatencySketch)
+
+    keys = sorted(sketches)
+    queryset = RouteLatencySketch.objects.using(using)
+    with transaction.atomic(using=using, savepoint=False):
+        queryset.bulk_create(
+            [
+                RouteLatencySketch(bucket=bucket, route=route, method=method)
+                for bucket, route, method in keys
+            ],
+            ignore_conflicts=True,
+        )
+        updated = []
+        for row in lock_rows(queryset, _KEY_FIELDS, keys):
+            sketch = LatencySketch.from_bytes(bytes(row.sketch))
+            sketch.merge(sketches[(row.bucket, row.route, row.method)])
+            row.sketch = sketch.to_bytes()
+            row.count = sketch.count
+            updated.append(row)
+        queryset.bulk_update(updated, ["sketch", "count"])
+    return len(updated)
+
+
+def merged_sketch(
+    route: str,
+    method: str | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    using: str | None = None,
+) -> LatencySketch:
+    """
+    Merge the stored sketches of a route over a time range.
+
+    Args:
+        route: The URL pattern, or the path of requests that did not resolve
+        method: Only include this HTTP method (all methods when None)
+        start: Include buckets starting at or after this moment
+        end: Include buckets starting before this moment
+        using: Database alias to read from
+
+    Returns:
+        The merged sketch
+    """
+    queryset = RouteLatencySketch.objects.filter(route=route)
+    if using is not None:
+        queryset = queryset.using(using)
+    if method is not None:
+        queryset = queryset.filter(method=method)
+    if start is not None:
+        queryset = queryset.filter(bucket__gte=start)
+    if end is not None:
+        queryset = queryset.filter(bucket__lt=end)
+
+    sketch = LatencySketch()
+    for data in queryset.values_list("sketch", flat=True).iterator():
+        sketch.merge(LatencySketch.from_bytes(bytes(data)))
+    return sketch
+
+
+def route_percentiles(
+    route: str,
+    method: str | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    percentiles: Iterable[float] = (50, 95, 99),
+    using: str | None = None,
+) -> dict[float, float | None]:
+    """
+    Return latency percentiles of a route in milliseconds.
+
+    Args:
+        route: The URL pattern, or the path of requests that did not resolve
+        method: Only include this HTTP method (all methods when None)
+        start: Include buckets starting at or after this moment
+        end: Include buckets starting before this moment
+        percentiles: Percentiles to compute, between 0 and 100
+        using: Database alias to read from
+
+    Returns:
+        Duration in milliseconds for each percentile, None without data
+    """
+    sketch = merged_sketch(route, method, start, end, using)
+    result = {}
+    for percentile in percentiles:
+        value = sketch.quantile(percentile / 100)
+        result[percentile] = None if value is None else value / 1000
+    return result
@@ -1,63 +1,242 @@
 """
 Celery tasks for processing request logs from Redis buffer.
 """
+import math
+import time
+from datetime import timedelta
+from typing import Callable, Iterator
+
 import msgpack
-from celery import shared_task
+from celery import group, shared_task
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
-from .models import RequestLog, IpAddress
+from .buffer import Batch, get_buffer_backend, shard_keys
+from .retention import keep_latest, purge_older_than
+from .rollups import save_rollups
+from .sketches import save_sketches
 from .settings import REQUEST_TRACK_SETTINGS, redis_client, redis_key
+from .wire import decode_log, get_compression, unpack_entries
+from .writers import write_logs
+
+
+def pop_batches(
+    backend,
+    key: str,
+    batch_size: int,
+    max_items: int | None = None,
+    deadline: float | None = None,
+) -> Iterator[tuple[Batch, list[bytes]]]:
+    """
+    Pop entries from the Redis buffer in chunks until it is drained.
+
+    Each chunk is popped only after the previous one was consumed, so at most
+    one chunk is held in memory whatever the size of the backlog. Items pushed
+    as compressed frames hold many entries, so the number of items popped at
+    once follows the largest item seen so far, keeping each chunk at about
+    ``batch_size`` entries, or a single frame when frames are larger.
+
+    Args:
+        backend: Buffer backend the entries are popped from
+        key: Redis key of the buffer (or buffer shard)
+        batch_size: Maximum number of entries popped at once
+        max_items: Maximum number of entries popped in total (None for all),
+            exceeded by at most the rest of the last frame
+        deadline: ``time.monotonic()`` value after which no new chunk is popped
+
+    Yields:
+        Each popped batch with the packed entries it holds
+    """
+    popped = 0
+    # Largest number of entries in one item, guessed until an item was seen
+    largest = 0
+    while max_items is None or popped < max_items:
+        wanted = batch_size
+        if max_items is not None:
+            wanted = min(batch_size, max_items - popped)
+        per_item = largest or (1 if get_compression() is None else batch_size)
+        count = max(1, wanted // per_item)
+        batch = backend.pop(redis_client, key, count)
+        if not len(batch):
+            return
+        entries = []
+        for raw in batch.items:
+            item_entries = unpack_entries(raw)
+            largest = max(largest, len(item_entries))
+            entries.extend(item_entries)
+        popped += len(entries)
+        yield batch, entries
+
+        # A short chunk means the buffer is empty
+        if len(batch) < count and not batch.redelivered:
+            return
+        if deadline is not None and time.monotonic() >= deadline:
+            return
+
+
+def save_chunk(
+    entries: list[bytes], batch_size: int, use_rollups: bool, use_sketches: bool
+) -> int:
+    """
+    Deserialize packed entries and save them, with their rollups and sketches.
+
+    Args:
+        entries: Packed log entries
+        batch_size: Maximum number of rows per INSERT statement
+        use_rollups: Whether to add the logs to the rollups
+        use_sketches: Whether to add the durations to the latency sketches
+
+    Returns:
+        Number of logs written
+    """
+    logs = [decode_log(msgpack.loads(entry)) for entry in entries]
+    aggregates = []
+    if use_rollups:
+        aggregates.append(save_rollups)
+    if use_sketches:
+        aggregates.append(save_sketches)
+    return write_logs(logs, batch_size=batch_size, aggregates=aggregates)
 
 
 @shared_task
-def process_request_logs(max_items: int | None = None) -> dict[str, int]:
+def process_request_logs(
+    max_items: int | None = None,
+    batch_size: int | None = None,
+    time_budget: float | None = None,
+    shard: int | None = None,
+) -> dict[str, int]:
     """
     Process request logs from Redis buffer and save them to the database.
 
-    This task fetches log entries from Redis, processes them, and bulk inserts
-    them into the database for better performance.
+    This task pops log entries from Redis in fixed-size chunks and bulk inserts
+    each chunk before popping the next one, so memory stays flat regardless of
+    the size of the backlog. With ``USE_ROLLUPS`` enabled, each chunk is also
+    added to the per-minute ``RequestLogRollup`` counters, and with
+    ``USE_LATENCY_SKETCHES`` its durations to the ``RouteLatencySketch`` rows.
+
+    When the buffer is sharded (``REDIS_SHARDS`` > 1) and no shard is given,
+    the task only dispatches one task per shard, so the shards are drained in
+    parallel by the available Celery workers. ``max_items`` is then split
+    evenly across the shard tasks.
 
     Args:
-        max_items: Maximum number of items to process in one batch (None for all)
+        max_items: Maximum number of logs to process in this run (None for all)
+        batch_size: Number of logs popped and inserted at once
+            (defaults to the FLUSH_BATCH_SIZE setting)
+        time_budget: Seconds after which no new chunk is started
+            (defaults to the FLUSH_TIME_BUDGET setting, None for no limit)
+        shard: Index of the buffer shard to drain
 
     Returns:
-        Dict with counts of processed logs and IPs
+        Dict with the number of processed logs (or dispatched shard tasks),
+        or None if the buffer was empty
     """
     if redis_client is None:
         return {"error": "Redis client not configured"}
 
-    # Use pipeline for atomic operations
-    pipe = redis_client.pipeline()
-    if max_items:
-        pipe.spop(redis_key, max_items)
-    else:
-        pipe.smembers(redis_key)
-        pipe.delete(redis_key)
+    keys = shard_keys(redis_key)
+    if shard is None and len(keys) > 1:
+        # Split the limit so the whole run stays within max_items
+        if max_items is not None:
+            max_items = math.ceil(max_items / len(keys))
+        group(
+            process_request_logs.s(max_items, batch_size, time_budget, shard=i)
+            for i in range(len(keys))
+        ).apply_async()
+        return {"dispatched": len(keys)}
+    key = keys[shard or 0]
+
+    if batch_size is None:
+        batch_size = REQUEST_TRACK_SETTINGS.get("FLUSH_BATCH_SIZE", 1000)
+    if time_budget is None:
+        time_budget = REQUEST_TRACK_SETTINGS.get("FLUSH_TIME_BUDGET", None)
+    deadline = time.monotonic() + time_budget if time_budget else None
+
+    backend = get_buffer_backend()
+    use_rollups = REQUEST_TRACK_SETTINGS.get("USE_ROLLUPS", False)
+    use_sketches = REQUEST_TRACK_SETTINGS.get("USE_LATENCY_SKETCHES", False)
 
-    items, _ = pipe.execute()
+    # Requeue batches left behind by workers that died mid-flush
+    backend.recover(redis_client, key)
 
-    if not items:
+    processed = 0
+    for batch, entries in pop_batches(backend, key, batch_size, max_items, deadline):
+        # Deserialize and save the chunk batch_size logs at a time, as a frame
+        # can hold more, then acknowledge it
+        for start in range(0, len(entries), batch_size):
+            chunk = entries[start:start + batch_size]
+            processed += save_chunk(chunk, batch_size, use_rollups, use_sketches)
+        backend.ack(redis_client, key, batch)
+
+    if not processed:
         return None
 
-    # Deserialize all logs
-    logs = [msgpack.loads(raw) for raw in items]
-
-    # Extract unique IPs (if exists ip_id)
-    ip_set = set()
-    for log in filter(lambda log: log.get("ip_id"), logs):
-        ip_set.add(log["ip_id"])
-
-    # Find which IPs already exist in database
-    if ip_set:
-        existing_ips = set(
-            IpAddress.objects.filter(ip__in=ip_set).values_list("ip", flat=True)
-        )
-        missing_ips = ip_set - existing_ips
-
-        # Create missing IPs
-        if missing_ips:
-            IpAddress.objects.bulk_create(
-                [IpAddress(ip=ip) for ip in missing_ips], ignore_conflicts=True
-            )
-
-    # Bulk create logs
-    RequestLog.objects.bulk_create([RequestLog(**log) for log in logs])
+    return {"processed": processed}
+
+
+@shared_task
+def purge_request_logs() -> dict[str, int]:
+    """
+    Delete request logs older than ``RETENTION_DAYS`` days.
+
+    Meant to be scheduled with Celery beat. Old rows are deleted in batches
+    and, on a partitioned table, old partitions are dropped.
+
+    Returns:
+        Dict with the number of deleted logs and dropped partitions
+    """
+    retention_days = REQUEST_TRACK_SETTINGS.get("RETENTION_DAYS", None)
+    if retention_days is None:
+        return {"error": "RETENTION_DAYS not configured"}
+
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    deleted, dropped = purge_older_than(cutoff)
+    return {"deleted": deleted, "dropped": len(dropped)}
+
+
+def _report_progress(task) -> Callable[[int], None]:
+    """Return a callback reporting deleted rows as the ``PROGRESS`` state of a task."""
+
+    def progress(deleted: int) -> None:
+        if task.request.id is not None:
+            task.update_state(state="PROGRESS", meta={"deleted": deleted})
+
+    return progress
+
+
+@shared_task(bind=True)
+def keep_last_logs(self, n: int) -> dict[str, int]:
+    """
+    Delete all request logs but the ``n`` most recent ones.
+
+    Started from the admin maintenance page. While running, the number of
+    deleted logs is reported as the ``PROGRESS`` state of the task.
+
+    Args:
+        n: Number of logs to keep
+
+    Returns:
+        Dict with the number of deleted logs and dropped partitions
+    """
+    deleted, dropped = keep_latest(n, progress=_report_progress(self))
+    return {"deleted": deleted, "dropped": len(dropped)}
+
+
+@shared_task(bind=True)
+def purge_logs_before(self, cutoff: str) -> dict[str, int]:
+    """
+    Delete request logs requested before ``cutoff``.
+
+    Started from the admin maintenance page. While running, the number of
+    deleted logs is reported as the ``PROGRESS`` state of the task.
+
+    Args:
+        cutoff: ISO 8601 moment; logs requested before it are deleted
+
+    Returns:
+        Dict with the number of deleted logs and dropped partitions
+    """
+    deleted, dropped = purge_older_than(
+        parse_datetime(cutoff), progress=_report_progress(self)
+    )
+    return {"deleted": deleted, "dropped": len(dropped)}
@@ -1,5 +1,5 @@
 from unittest import mock
-from django.test import TestCase, RequestFactory
+from django.test import TestCase, RequestFactory, override_settings
 from django.contrib.admin.sites import AdminSite
 from django.contrib.auth import get_user_model
 from django.contrib.messages.storage.fallback import FallbackStorage
@@ -7,6 +7,7 @@ from django.utils import timezone
 
 from request_track.admin import RequestLogAdmin, UserLoggedInFilter, StatusCodeFilter
 from request_track.models import RequestLog, IpAddress
+from request_track.paginator import EstimatedCountPaginator
 
 
 User = get_user_model()
@@ -110,4 +111,133 @@ class AdminTestCase(TestCase):
         request = self.factory.get("/admin/request_track/requestlog/1/change/")
         request.user = self.superuser
         
-        self.assertFalse(self.admin.has_change_permission(request, self.log1))        
\ No newline at end of file
+        self.assertFalse(self.admin.has_change_permission(request, self.log1))        
+
+    def test_remove_older_than_week(self):
+        """Test that the maintenance action deletes logs older than a week."""
+        request = self.factory.get(
+            "/admin/request_track/requestlog/remove-older-than-week/"
+        )
+        request.user = self.superuser
+        setattr(request, "session", "session")
+        setattr(request, "_messages", FallbackStorage(request))
+
+        response = self.admin.remove_older_than_week(request)
+
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(RequestLog.objects.filter(pk=self.log1.pk).exists())
+        self.assertEqual(RequestLog.objects.count(), 2)
+
+    @override_settings(REQUEST_TRACK_SETTINGS={"MAINTENANCE_ASYNC": True})
+    def test_remove_older_than_week_async(self):
+        """Test that the age based cleanup can run as a Celery task."""
+        request = self.factory.get(
+            "/admin/request_track/requestlog/remove-older-than-week/"
+        )
+        request.user = self.superuser
+        setattr(request, "session", {})
+        setattr(request, "_messages", FallbackStorage(request))
+
+        with mock.patch("request_track.admin.purge_logs_before") as mock_task:
+            mock_task.delay.return_value.id = "task-id"
+            response = self.admin.remove_older_than_week(request)
+
+        self.assertEqual(response.status_code, 302)
+        mock_task.delay.assert_called_once()
+        self.assertEqual(request.session, {"request_track_maintenance_task": "task-id"})
+        self.assertEqual(RequestLog.objects.count(), 3)
+
+    def test_keep_last_n(self):
+        """Test that the maintenance action keeps only the newest logs."""
+        request = self.factory.get(
+            "/admin/request_track/requestlog/keep-last-n/", {"n": "2"}
+        )
+        request.user = self.superuser
+        setattr(request, "session", "session")
+        setattr(request, "_messages", FallbackStorage(request))
+
+        response = self.admin.keep_last_n(request)
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            set(RequestLog.objects.values_list("pk", flat=True)),
+            {self.log2.pk, self.log3.pk},
+        )
+
+    @override_settings(REQUEST_TRACK_SETTINGS={"MAINTENANCE_ASYNC": True})
+    def test_keep_last_n_async(self):
+        """Test that the maintenance action can run as a Celery task."""
+        request = self.factory.get(
+            "/admin/request_track/requestlog/keep-last-n/", {"n": "2"}
+        )
+        request.user = self.superuser
+        setattr(request, "session", {})
+        setattr(request, "_messages", FallbackStorage(request))
+
+        with mock.patch("request_track.admin.keep_last_logs") as mock_task:
+            mock_task.delay.return_value.id = "task-id"
+            response = self.admin.keep_last_n(request)
+
+        self.assertEqual(response.status_code, 302)
+        mock_task.delay.assert_called_once_with(2)
+        self.assertEqual(request.session, {"request_track_maintenance_task": "task-id"})
+        self.assertEqual(RequestLog.objects.count(), 3)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        """Test that rendering the changelist does not query per log."""
+        request = self.factory.get("/admin/request_track/requestlog/")
+        request.user = self.superuser
+
+        def render_queries():
+            changelist = self.admin.get_changelist_instance(request)
+            logs = list(changelist.result_list)
+            with self.assertNumQueries(0):
+                for log in logs:
+                    self.admin.display_ip(log)
+                    str(log.user)
+
+        render_queries()
+        for i in range(5):
+            RequestLog.objects.create(
+                ip=self.ip, user=self.user, user_agent="Test Agent",
+                route=f"/more{i}/", method="GET", query_params="",
+                status_code=200, requested_at=timezone.now(),
+            )
+        render_queries()
+
+    def test_paginator_uses_estimate_above_threshold(self):
+        """Test that large unfiltered tables are not counted exactly."""
+        with mock.patch(
+            "request_track.paginator.estimate_row_count", return_value=500000000
+        ):
+            paginator = EstimatedCountPaginator(RequestLog.objects.all(), 50)
+            with self.assertNumQueries(0):
+                self.assertEqual(paginator.count, 500000000)
+
+            filtered = RequestLog.objects.filter(method="GET")
+            self.assertEqual(EstimatedCountPaginator(filtered, 50).count, 2)
+
+    def test_maintenance_view_uses_estimate(self):
+        """Test that the maintenance page does not count large tables exactly."""
+        request = self.factory.get("/admin/request_track/requestlog/maintenance/")
+        request.user = self.superuser
+        request.session = {}
+        with mock.patch(
+            "request_track.paginator.estimate_row_count", return_value=500000000
+        ):
+            response = self.admin.maintenance_view(request)
+        self.assertEqual(response.context_data["log_count"], 500000000)
+
+        with mock.patch("request_track.paginator.estimate_row_count", return_value=10):
+            response = self.admin.maintenance_view(request)
+        self.assertEqual(response.context_data["log_count"], 3)
+
+    def test_paginator_counts_below_threshold(self):
+        """Test that small tables and missing estimates are counted exactly."""
+        queryset = RequestLog.objects.all()
+        with mock.patch("request_track.paginator.estimate_row_count", return_value=10):
+            self.assertEqual(EstimatedCountPaginator(queryset, 50).count, 3)
+        with mock.patch(
+            "request_track.paginator.estimate_row_count", return_value=None
+        ):
+            self.assertEqual(EstimatedCountPaginator(queryset, 50).count, 3)
@@ -0,0 +1,124 @@
+import asyncio
+import threading
+
+from django.test import SimpleTestCase
+
+from request_track.background import AsyncLogFlusher, BackgroundLogWriter
+
+
+class BackgroundLogWriterTestCase(SimpleTestCase):
+    def test_writes_in_batches(self):
+        """Test that queued logs reach the sink in batches."""
+        batches = []
+        writer = BackgroundLogWriter(batches.append, batch_size=2, flush_interval=5)
+
+        for i in range(3):
+            self.assertTrue(writer.put({"n": i}))
+        writer.stop()
+
+        self.assertEqual(batches, [[{"n": 0}, {"n": 1}], [{"n": 2}]])
+
+    def test_stop_drains_queue(self):
+        """Test that stopping the writer writes everything already queued."""
+        batches = []
+        writer = BackgroundLogWriter(batches.append, batch_size=100, flush_interval=5)
+
+        for i in range(10):
+            writer.put({"n": i})
+        writer.stop()
+
+        self.assertEqual(sum(len(batch) for batch in batches), 10)
+
+    def test_drop_on_full(self):
+        """Test that logs are dropped instead of blocking when the queue is full."""
+        entered = threading.Event()
+        release = threading.Event()
+        batches = []
+
+        def sink(batch):
+            entered.set()
+            release.wait(5)
+            batches.append(batch)
+
+        writer = BackgroundLogWriter(sink, queue_size=1, batch_size=1)
+        writer.put({"n": 0})
+        entered.wait(5)
+
+        self.assertTrue(writer.put({"n": 1}))
+        self.assertFalse(writer.put({"n": 2}))
+        self.assertEqual(writer.dropped, 1)
+
+        release.set()
+        writer.stop()
+        self.assertEqual(batches, [[{"n": 0}], [{"n": 1}]])
+
+    def test_sink_errors_do_not_stop_writer(self):
+        """Test that a failing batch is logged and later batches still run."""
+        batches = []
+
+        def sink(batch):
+            if batch[0]["n"] == 0:
+                raise RuntimeError("database is down")
+            batches.append(batch)
+
+        writer = BackgroundLogWriter(sink, batch_size=1)
+        with self.assertLogs("request_track.background", "ERROR"):
+            writer.put({"n": 0})
+            writer.put({"n": 1})
+            writer.stop()
+
+        self.assertEqual(batches, [[{"n": 1}]])
+
+
+class AsyncLogFlusherTestCase(SimpleTestCase):
+    async def test_writes_in_batches(self):
+        """Test that queued logs reach the async sink in batches."""
+        batches = []
+
+        async def sink(batch):
+            batches.append(batch)
+
+        flusher = AsyncLogFlusher(sink, batch_size=2, flush_interval=0.01)
+        for i in range(3):
+            self.assertTrue(await flusher.put({"n": i}))
+        await flusher.join()
+
+        self.assertEqual(batches, [[{"n": 0}, {"n": 1}], [{"n": 2}]])
+
+    async def test_drop_on_full(self):
+        """Test that logs are dropped when the per-loop queue is full."""
+        release = asyncio.Event()
+        batches = []
+
+        async def sink(batch):
+            await release.wait()
+            batches.append(batch)
+
+        flusher = AsyncLogFlusher(sink, queue_size=1, batch_size=1)
+        await flusher.put({"n": 0})
+        await asyncio.sleep(0)  # Let the flusher task take the first log
+
+        self.assertTrue(await flusher.put({"n": 1}))
+        self.assertFalse(await flusher.put({"n": 2}))
+        self.assertEqual(flusher.dropped, 1)
+
+        release.set()
+        await flusher.join()
+        self.assertEqual(batches, [[{"n": 0}], [{"n": 1}]])
+
+    def test_drains_on_loop_shutdown(self):
+        """Test that logs still queued are written when the loop shuts down."""
+        batches = []
+
+        async def sink(batch):
+            batches.append(batch)
+
+        flusher = AsyncLogFlusher(sink, batch_size=100, flush_interval=60)
+
+        async def main():
+            for i in range(5):
+                await flusher.put({"n": i})
+
+        asyncio.run(main())
+
+        self.assertEqual(sum(len(batch) for batch in batches), 5)
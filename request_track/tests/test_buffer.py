@@ -0,0 +1,377 @@
+import asyncio
+import threading
+from unittest import mock
+
+import redis
+from asgiref.sync import async_to_sync
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+
+from request_track.buffer import (
+    Batch,
+    ListBackend,
+    RedisLogBuffer,
+    ReliableBackend,
+    SetBackend,
+    StreamBackend,
+    flush_all_buffers,
+    get_buffer_backend,
+    shard_keys,
+)
+from request_track.wire import unpack_entries
+
+
+class RedisLogBufferTestCase(SimpleTestCase):
+    def setUp(self):
+        self.client = mock.MagicMock()
+        self.aclient = mock.AsyncMock()
+
+    def test_flush_on_batch_size(self):
+        """Test that entries are written in one command once the batch is full."""
+        buffer = RedisLogBuffer(
+            self.client, self.aclient, "logs", batch_size=3, max_age=60
+        )
+
+        buffer.add(b"a")
+        buffer.add(b"b")
+        self.client.sadd.assert_not_called()
+        self.assertEqual(len(buffer), 2)
+
+        buffer.add(b"c")
+        self.client.sadd.assert_called_once_with("logs", b"a", b"b", b"c")
+        self.assertEqual(len(buffer), 0)
+
+    def test_compressed_batches(self):
+        """Test that batches are pushed as one compressed frame."""
+        buffer = RedisLogBuffer(
+            self.client, self.aclient, "logs", batch_size=2, compression="zlib"
+        )
+
+        buffer.add(b"\x91\x01")
+        buffer.add(b"\x91\x02")
+
+        (key, frame), _ = self.client.sadd.call_args
+        self.assertEqual(key, "logs")
+        self.assertEqual(unpack_entries(frame), [b"\x91\x01", b"\x91\x02"])
+
+        # A single entry is not worth a frame
+        buffer.write([b"\x91\x03"])
+        self.client.sadd.assert_called_with("logs", b"\x91\x03")
+
+    def test_flush_on_max_age(self):
+        """Test that old pending entries are written on the next add."""
+        buffer = RedisLogBuffer(
+            self.client, self.aclient, "logs", batch_size=100, max_age=5
+        )
+
+        with mock.patch("request_track.buffer.time.monotonic", return_value=100.0):
+            buffer.add(b"a")
+        self.client.sadd.assert_not_called()
+
+        with mock.patch("request_track.buffer.time.monotonic", return_value=106.0):
+            buffer.add(b"b")
+        self.client.sadd.assert_called_once_with("logs", b"a", b"b")
+
+    def test_timer_flushes_idle_buffer(self):
+        """Test that pending entries reach Redis after max_age without another add."""
+        buffer = RedisLogBuffer(
+            self.client, self.aclient, "logs", batch_size=100, max_age=0.05
+        )
+        written = threading.Event()
+        self.client.sadd.side_effect = lambda *args: written.set()
+
+        buffer.add(b"a")
+
+        self.assertTrue(written.wait(5))
+        self.client.sadd.assert_called_once_with("logs", b"a")
+        self.assertEqual(len(buffer), 0)
+
+    def test_async_timer_flushes_idle_buffer(self):
+        """Test that the event loop flushes pending entries after max_age."""
+        buffer = RedisLogBuffer(
+            self.client, self.aclient, "logs", batch_size=100, max_age=0.05
+        )
+
+        async def add_and_idle():
+            await buffer.aadd(b"a")
+            await asyncio.sleep(0.3)
+
+        async_to_sync(add_and_idle)()
+
+        self.aclient.sadd.assert_awaited_once_with("logs", b"a")
+        self.assertEqual(len(buffer), 0)
+
+    def test_failed_push_keeps_batch(self):
+        """Test that a batch whose push fails is kept pending for a retry."""
+        buffer = RedisLogBuffer(
+            self.client, self.aclient, "logs", batch_size=2, max_age=60
+        )
+        self.client.sadd.side_effect = [redis.ConnectionError, None]
+
+        buffer.add(b"a")
+        with self.assertRaises(redis.ConnectionError):
+            buffer.add(b"b")
+        self.assertEqual(len(buffer), 2)
+
+        buffer.add(b"c")
+        self.client.sadd.assert_called_with("logs", b"a", b"b", b"c")
+        self.assertEqual(len(buffer), 0)
+
+    def test_default_batch_size_writes_immediately(self):
+        """Test that the default configuration keeps one write per entry."""
+        buffer = RedisLogBuffer(self.client, self.aclient, "logs")
+
+        buffer.add(b"a")
+        self.client.sadd.assert_called_once_with("logs", b"a")
+
+    def test_async_add(self):
+        """Test that the async path writes batches with the async client."""
+        buffer = RedisLogBuffer(
+            self.client, self.aclient, "logs", batch_size=2, max_age=60
+        )
+
+        async_to_sync(buffer.aadd)(b"a")
+        async_to_sync(buffer.aadd)(b"b")
+
+        self.aclient.sadd.assert_awaited_once_with("logs", b"a", b"b")
+        self.client.sadd.assert_not_called()
+
+    def test_flush(self):
+        """Test that flush writes pending entries and is a no-op when empty."""
+        buffer = RedisLogBuffer(
+            self.client, self.aclient, "logs", batch_size=10, max_age=60
+        )
+        self.assertEqual(buffer.flush(), 0)
+        self.client.sadd.assert_not_called()
+
+        buffer.add(b"a")
+        buffer.add(b"b")
+        self.assertEqual(buffer.flush(), 2)
+        self.client.sadd.assert_called_once_with("logs", b"a", b"b")
+
+    def test_flush_all_buffers(self):
+        """Test that the shutdown hook flushes every live buffer."""
+        buffer = RedisLogBuffer(
+            self.client, self.aclient, "logs", batch_size=10, max_age=60
+        )
+        buffer.add(b"a")
+
+        flush_all_buffers()
+
+        self.client.sadd.assert_called_once_with("logs", b"a")
+
+
+class BufferBackendTestCase(SimpleTestCase):
+    def setUp(self):
+        self.client = mock.MagicMock()
+
+    def test_get_buffer_backend(self):
+        """Test that REDIS_BUFFER_TYPE selects the backend."""
+        with override_settings(REQUEST_TRACK_SETTINGS={}):
+            self.assertIsInstance(get_buffer_backend(), SetBackend)
+        with override_settings(REQUEST_TRACK_SETTINGS={"REDIS_BUFFER_TYPE": "list"}):
+            self.assertIsInstance(get_buffer_backend(), ListBackend)
+        with override_settings(REQUEST_TRACK_SETTINGS={"REDIS_BUFFER_TYPE": "stream"}):
+            self.assertIsInstance(get_buffer_backend(), StreamBackend)
+        with override_settings(REQUEST_TRACK_SETTINGS={"REDIS_BUFFER_TYPE": "heap"}):
+            with self.assertRaises(ImproperlyConfigured):
+                get_buffer_backend()
+
+    def test_buffer_uses_backend(self):
+        """Test that the buffer writes through the selected backend."""
+        buffer = RedisLogBuffer(
+            self.client, None, "logs", batch_size=2, backend=ListBackend()
+        )
+        buffer.add(b"a")
+        buffer.add(b"a")
+
+        self.client.rpush.assert_called_once_with("logs", b"a", b"a")
+        self.client.sadd.assert_not_called()
+
+    def test_list_backend(self):
+        """Test that the list backend keeps duplicates and pops in order."""
+        backend = ListBackend()
+        backend.push(self.client, "logs", [b"a", b"a", b"b"])
+        self.client.rpush.assert_called_once_with("logs", b"a", b"a", b"b")
+
+        self.client.lpop.return_value = [b"a", b"a"]
+        batch = backend.pop(self.client, "logs", 2)
+
+        self.client.lpop.assert_called_once_with("logs", 2)
+        self.assertEqual(batch.items, [b"a", b"a"])
+
+    def test_list_backend_empty(self):
+        """Test that popping an empty list returns an empty batch."""
+        self.client.lpop.return_value = None
+
+        self.assertEqual(len(ListBackend().pop(self.client, "logs", 10)), 0)
+
+    def test_stream_backend_push(self):
+        """Test that stream entries are added with one pipelined XADD each."""
+        pipe = self.client.pipeline.return_value
+        StreamBackend().push(self.client, "logs", [b"a", b"b"])
+
+        self.assertEqual(pipe.xadd.call_args_list, [
+            mock.call("logs", {b"d": b"a"}),
+            mock.call("logs", {b"d": b"b"}),
+        ])
+        pipe.execute.assert_called_once()
+
+    def test_stream_backend_read_and_ack(self):
+        """Test that new entries are read through the group and acknowledged."""
+        backend = StreamBackend(consumer="worker-1")
+        self.client.xautoclaim.return_value = [b"0-0", [], []]
+        self.client.xreadgroup.return_value = [
+            [b"logs", [(b"1-0", {b"d": b"a"}), (b"1-1", {b"d": b"b"})]]
+        ]
+
+        batch = backend.pop(self.client, "logs", 10)
+
+        self.client.xgroup_create.assert_called_once_with(
+            "logs", "request_track", id="0", mkstream=True
+        )
+        self.client.xreadgroup.assert_called_once_with(
+            "request_track", "worker-1", {"logs": ">"}, count=10
+        )
+        self.assertEqual(batch.items, [b"a", b"b"])
+        self.assertFalse(batch.redelivered)
+
+        pipe = self.client.pipeline.return_value
+        backend.ack(self.client, "logs", batch)
+        pipe.xack.assert_called_once_with("logs", "request_track", b"1-0", b"1-1")
+        pipe.xdel.assert_called_once_with("logs", b"1-0", b"1-1")
+
+    def test_stream_backend_redelivers_idle_entries(self):
+        """Test that entries left pending by a dead consumer are claimed first."""
+        backend = StreamBackend(consumer="worker-2", claim_idle=60)
+        self.client.xautoclaim.return_value = [
+            b"0-0", [(b"1-0", {b"d": b"a"}), (b"1-1", None)], []
+        ]
+
+        batch = backend.pop(self.client, "logs", 10)
+
+        self.client.xautoclaim.assert_called_once_with(
+            "logs", "request_track", "worker-2",
+            min_idle_time=60000, start_id="0-0", count=10,
+        )
+        self.client.xreadgroup.assert_not_called()
+        self.assertTrue(batch.redelivered)
+        self.assertEqual(batch.items, [b"a"])
+        self.assertEqual(batch.ids, [b"1-0", b"1-1"])
+
+    def test_stream_backend_existing_group(self):
+        """Test that an existing consumer group is reused."""
+        self.client.xgroup_create.side_effect = redis.exceptions.ResponseError(
+            "BUSYGROUP Consumer Group name already exists"
+        )
+        self.client.xautoclaim.return_value = [b"0-0", [], []]
+        self.client.xreadgroup.return_value = []
+
+        batch = StreamBackend().pop(self.client, "logs", 10)
+
+        self.assertEqual(len(batch), 0)
+
+    def test_set_backend_ack_is_noop(self):
+        """Test that acknowledging a set batch sends nothing to Redis."""
+        SetBackend().ack(self.client, "logs", Batch([b"a"]))
+
+        self.assertEqual(self.client.method_calls, [])
+
+
+class ReliableBackendTestCase(SimpleTestCase):
+    def setUp(self):
+        self.client = mock.MagicMock()
+        self.script = self.client.register_script.return_value
+
+    def test_get_buffer_backend_wraps(self):
+        """Test that REDIS_RELIABLE_FLUSH wraps set and list backends."""
+        with override_settings(REQUEST_TRACK_SETTINGS={
+            "REDIS_BUFFER_TYPE": "list",
+            "REDIS_RELIABLE_FLUSH": True,
+            "REDIS_RELIABLE_TIMEOUT": 60,
+        }):
+            backend = get_buffer_backend()
+
+        self.assertIsInstance(backend, ReliableBackend)
+        self.assertIsInstance(backend.backend, ListBackend)
+        self.assertEqual(backend.timeout, 60)
+
+    def test_pop_moves_batch_to_processing_key(self):
+        """Test that a batch is claimed into its own processing key."""
+        self.script.return_value = [b"a", b"b"]
+        backend = ReliableBackend(SetBackend())
+
+        batch = backend.pop(self.client, "logs", 2)
+
+        self.assertEqual(batch.items, [b"a", b"b"])
+        self.assertTrue(batch.token.startswith("{logs}:processing:"))
+        kwargs = self.script.call_args.kwargs
+        self.assertEqual(kwargs["keys"], ["logs", batch.token, "{logs}:processing"])
+        self.assertEqual(kwargs["args"][0], 2)
+        self.assertEqual(kwargs["args"][2], "set")
+
+    def test_pop_empty(self):
+        """Test that an empty buffer gives an empty batch without a token."""
+        self.script.return_value = []
+
+        batch = ReliableBackend(ListBackend()).pop(self.client, "logs", 10)
+
+        self.assertEqual(len(batch), 0)
+        self.assertIsNone(batch.token)
+
+    def test_ack_deletes_processing_key(self):
+        """Test that acknowledging removes the processing key and its index entry."""
+        pipe = self.client.pipeline.return_value
+        batch = Batch([b"a"], token="{logs}:processing:1")
+
+        ReliableBackend(ListBackend()).ack(self.client, "logs", batch)
+
+        pipe.delete.assert_called_once_with("{logs}:processing:1")
+        pipe.zrem.assert_called_once_with("{logs}:processing", "{logs}:processing:1")
+        pipe.execute.assert_called_once()
+
+    @mock.patch("request_track.buffer.time.time", return_value=1000.0)
+    def test_recover_requeues_stale_batches(self, mock_time):
+        """Test that batches older than the timeout are put back."""
+        self.client.zrangebyscore.return_value = [
+            "{logs}:processing:1", "{logs}:processing:2"
+        ]
+        self.script.side_effect = [3, 2]
+
+        count = ReliableBackend(ListBackend(), timeout=300).recover(self.client, "logs")
+
+        self.assertEqual(count, 5)
+        self.client.zrangebyscore.assert_called_once_with(
+            "{logs}:processing", "-inf", 700.0
+        )
+        self.script.assert_has_calls([
+            mock.call(
+                keys=["logs", "{logs}:processing", "{logs}:processing:1"],
+                args=[700.0, "list"],
+            ),
+            mock.call(
+                keys=["logs", "{logs}:processing", "{logs}:processing:2"],
+                args=[700.0, "list"],
+            ),
+        ])
+
+
+class ShardingTestCase(SimpleTestCase):
+    def test_shard_keys(self):
+        """Test that the buffer key is split into numbered shard keys."""
+        self.assertEqual(shard_keys("logs", 1), ["logs"])
+        self.assertEqual(shard_keys("logs", 3), ["logs:0", "logs:1", "logs:2"])
+
+        with override_settings(REQUEST_TRACK_SETTINGS={"REDIS_SHARDS": 2}):
+            self.assertEqual(shard_keys("logs"), ["logs:0", "logs:1"])
+
+    @mock.patch("request_track.buffer.os.getpid", return_value=7)
+    def test_buffer_writes_to_process_shard(self, mock_getpid):
+        """Test that a process writes its batches to the shard of its pid."""
+        client = mock.MagicMock()
+        buffer = RedisLogBuffer(client, None, "logs", backend=SetBackend(), shards=4)
+
+        buffer.add(b"a")
+
+        self.assertEqual(buffer.shard_key, "logs:3")
+        client.sadd.assert_called_once_with("logs:3", b"a")
@@ -0,0 +1,100 @@
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from request_track.cache import KnownIdCache, KnownValueCache, get_ip_cache
+from request_track.models import RequestLog, IpAddress
+from request_track.tests.utils import make_log
+from request_track.writers import write_logs
+
+
+class KnownValueCacheTestCase(SimpleTestCase):
+    def test_missing_and_add(self):
+        """Test that only values not added yet are reported missing."""
+        cache = KnownValueCache(maxsize=10)
+        cache.add({"a", "b"})
+
+        self.assertEqual(cache.missing(["a", "b", "c"]), {"c"})
+
+    def test_lru_eviction(self):
+        """Test that the least recently used value is evicted first."""
+        cache = KnownValueCache(maxsize=2)
+        cache.add(["a"])
+        cache.add(["b"])
+        cache.missing(["a"])  # Touch "a" so "b" becomes the oldest
+        cache.add(["c"])
+
+        self.assertEqual(len(cache), 2)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+
+    def test_disabled(self):
+        """Test that a zero size cache never remembers anything."""
+        cache = KnownValueCache(maxsize=0)
+        cache.add(["a"])
+
+        self.assertEqual(cache.missing(["a"]), {"a"})
+
+    def test_id_cache(self):
+        """Test that the id cache returns the ids of known values."""
+        cache = KnownIdCache(maxsize=10)
+        cache.add_ids({"orders/<int:pk>/": 1})
+
+        found, missing = cache.lookup(["orders/<int:pk>/", "users/"])
+
+        self.assertEqual(found, {"orders/<int:pk>/": 1})
+        self.assertEqual(missing, {"users/"})
+
+    def test_shared_cache(self):
+        """Test that values added by one process are found through the Django cache."""
+        first = KnownValueCache(maxsize=10, cache_alias="default", prefix="test:ip")
+        second = KnownValueCache(maxsize=10, cache_alias="default", prefix="test:ip")
+        first.add(["10.0.0.1"])
+
+        self.assertEqual(second.missing(["10.0.0.1", "10.0.0.2"]), {"10.0.0.2"})
+        self.assertIn("10.0.0.1", second)
+
+        first.discard("10.0.0.1")
+        third = KnownValueCache(maxsize=10, cache_alias="default", prefix="test:ip")
+        self.assertEqual(third.missing(["10.0.0.1"]), {"10.0.0.1"})
+
+
+@override_settings(REQUEST_TRACK_SETTINGS={"IP_CACHE_SIZE": 100})
+class IpCacheWritesTestCase(TestCase):
+    def test_cached_ip_skips_queries(self):
+        """Test that a known IP costs no query on later writes."""
+        with self.captureOnCommitCallbacks(execute=True):
+            write_logs([make_log(ip_id="10.0.0.1")])
+        self.assertIn("10.0.0.1", get_ip_cache())
+
+        # Only the log insert runs
+        with self.assertNumQueries(1):
+            write_logs([make_log(ip_id="10.0.0.1")])
+
+        self.assertEqual(RequestLog.objects.count(), 2)
+
+    def test_unknown_ips_are_upserted_without_select(self):
+        """Test that unknown IPs cost one conflict-ignoring insert and no lookup."""
+        IpAddress.objects.create(ip="10.0.0.4")
+        logs = [make_log(ip_id="10.0.0.4"), make_log(ip_id="10.0.0.5")]
+
+        # One IP insert and one log insert
+        with self.assertNumQueries(2):
+            write_logs(logs)
+
+        self.assertEqual(IpAddress.objects.count(), 2)
+        self.assertEqual(RequestLog.objects.count(), 2)
+
+    def test_uncommitted_ip_is_not_cached(self):
+        """Test that IPs are only cached after the transaction commits."""
+        with self.captureOnCommitCallbacks(execute=False):
+            write_logs([make_log(ip_id="10.0.0.2")])
+
+        self.assertNotIn("10.0.0.2", get_ip_cache())
+
+    def test_deleted_ip_is_forgotten(self):
+        """Test that deleting an IpAddress removes it from the cache."""
+        with self.captureOnCommitCallbacks(execute=True):
+            write_logs([make_log(ip_id="10.0.0.3")])
+
+        IpAddress.objects.filter(ip="10.0.0.3").delete()
+
+        self.assertNotIn("10.0.0.3", get_ip_cache())
@@ -5,6 +5,7 @@ from django.http import HttpResponse
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 
 from request_track.middleware import (
     LoggingRequestMiddleware,
@@ -13,6 +14,7 @@ from request_track.middleware import (
     get_logged_headers,
 )
 from request_track.models import RequestLog, IpAddress
+from request_track.rules import Decision
 
 
 User = get_user_model()
@@ -63,7 +65,20 @@ class MiddlewareTestCase(TestCase):
         self.assertEqual(params["user_agent"], "Test Agent")
         self.assertEqual(params["query_params"], "param1=value1&param2=value2")
         self.assertEqual(params["app_name"], "test_app")
-        self.assertEqual(params["requested_at"], now.isoformat())
+        self.assertEqual(params["requested_at"], now)
+
+    def test_params_request_sizes(self):
+        """Test that the duration and body sizes are recorded."""
+        request = self.factory.post(
+            "/test-path/", data="x" * 12, content_type="text/plain"
+        )
+        response = HttpResponse(b"hello")
+
+        params = params_request(request, response, self.anon_user, duration=1500)
+
+        self.assertEqual(params["duration"], 1500)
+        self.assertEqual(params["response_size"], 5)
+        self.assertEqual(params["request_size"], 12)
         
     def test_params_request_anonymous_user(self):
         """Test that request parameters handle anonymous users correctly."""
@@ -75,6 +90,35 @@ class MiddlewareTestCase(TestCase):
         self.assertIsNone(params["user_id"])
         self.assertEqual(params["method"], "GET")
         
+    def test_params_request_raw_query_string(self):
+        """Test that the query string is logged as sent, without re-encoding."""
+        request = self.factory.get("/test-path/?q=blue+shoes&next=/a/&q=red")
+        response = HttpResponse(status=200)
+
+        params = params_request(request, response, self.anon_user)
+
+        self.assertEqual(params["query_params"], "q=blue+shoes&next=/a/&q=red")
+
+    def test_params_request_follows_settings_changes(self):
+        """Test that the compiled extractor is rebuilt when settings change."""
+        request = self.factory.get("/test-path/", HTTP_ACCEPT="text/html")
+        request.META["REMOTE_ADDR"] = "10.0.0.1"
+        response = HttpResponse(status=200)
+
+        with override_settings(REQUEST_TRACK_SETTINGS={
+            "HEADERS_TO_LOG": ["accept"], "USE_IP_ADDRESS_MODEL": False
+        }):
+            params = params_request(request, response, self.anon_user)
+        self.assertEqual(params["headers"], {"accept": "text/html"})
+        self.assertEqual(params["ip_address"], "10.0.0.1")
+        self.assertNotIn("ip_id", params)
+
+        with override_settings(REQUEST_TRACK_SETTINGS={}):
+            params = params_request(request, response, self.anon_user)
+        self.assertEqual(params["headers"], {})
+        self.assertEqual(params["ip_id"], "10.0.0.1")
+        self.assertNotIn("ip_address", params)
+
     def test_should_log_request_basic(self):
         """Test basic functionality of should_log_request."""
         request = self.factory.get("/test-path/")
@@ -176,7 +220,26 @@ class MiddlewareTestCase(TestCase):
         self.assertEqual(log.method, "GET")
         self.assertEqual(log.route, "/test-path/")
         self.assertEqual(log.user, self.user)
+        self.assertIsNotNone(log.duration)
+        self.assertEqual(log.response_size, 0)
         
+    @mock.patch('request_track.middleware.redis_client', None)
+    def test_middleware_uses_settings_it_was_created_with(self):
+        """Test that each middleware instance extracts logs with its own settings."""
+        request = self.factory.get("/test-path/", HTTP_ACCEPT="text/html")
+        request.user = self.user
+        response_callable = mock.MagicMock(return_value=HttpResponse())
+
+        with override_settings(REQUEST_TRACK_SETTINGS={"HEADERS_TO_LOG": ["accept"]}):
+            middleware = LoggingRequestMiddleware(response_callable)
+        middleware(request)
+        self.assertEqual(RequestLog.objects.latest("id").headers, {"accept": "text/html"})
+
+        with override_settings(REQUEST_TRACK_SETTINGS={}):
+            middleware = LoggingRequestMiddleware(response_callable)
+        middleware(request)
+        self.assertEqual(RequestLog.objects.latest("id").headers, {})
+
     @mock.patch('request_track.middleware.redis_client')
     def test_middleware_sync_with_redis(self, mock_redis):
         """Test synchronous middleware with Redis."""
@@ -194,10 +257,10 @@ class MiddlewareTestCase(TestCase):
         self.assertEqual(RequestLog.objects.count(), initial_count)  # No DB writes
         mock_redis.sadd.assert_called_once()  # Should call Redis
         
-    @mock.patch('request_track.middleware.should_log_request')
-    def test_middleware_skip_logging(self, mock_should_log):
-        """Test middleware skips logging when should_log_request returns False."""
-        mock_should_log.return_value = False
+    @mock.patch('request_track.middleware.get_request_filter')
+    def test_middleware_skip_logging(self, mock_get_filter):
+        """Test middleware skips logging when the request filter decides to skip."""
+        mock_get_filter.return_value.check_request.return_value = Decision.SKIP
         request = self.factory.get("/test-path/")
         request.user = self.user
         
@@ -207,4 +270,78 @@ class MiddlewareTestCase(TestCase):
         initial_count = RequestLog.objects.count()
         response = middleware(request)
         
-        self.assertEqual(RequestLog.objects.count(), initial_count)  # No new logs
\ No newline at end of file
+        self.assertEqual(RequestLog.objects.count(), initial_count)  # No new logs
+
+    @mock.patch('request_track.middleware.redis_client', None)
+    @mock.patch('request_track.middleware.BackgroundLogWriter')
+    def test_middleware_sync_background_writer(self, mock_writer_class):
+        """Test synchronous middleware only enqueues logs when the background writer is on."""
+        request = self.factory.get("/test-path/")
+        request.user = self.user
+
+        response_callable = mock.MagicMock(return_value=HttpResponse())
+        with override_settings(REQUEST_TRACK_SETTINGS={"BACKGROUND_WRITER": True}):
+            middleware = LoggingRequestMiddleware(response_callable)
+            middleware(request)
+
+        self.assertEqual(RequestLog.objects.count(), 0)  # No inline DB writes
+        mock_writer_class.return_value.put.assert_called_once()
+        log_params = mock_writer_class.return_value.put.call_args[0][0]
+        self.assertEqual(log_params["route"], "/test-path/")
+
+    @mock.patch('request_track.middleware.redis_client', None)
+    @mock.patch('request_track.middleware.AsyncLogFlusher')
+    async def test_middleware_async_background_writer(self, mock_flusher_class):
+        """Test asynchronous middleware only enqueues logs when the background writer is on."""
+        mock_flusher_class.return_value.put = mock.AsyncMock()
+        request = self.factory.get("/test-path/")
+
+        async def auser():
+            return self.anon_user
+
+        request.auser = auser
+
+        async def get_response(request):
+            return HttpResponse()
+
+        with override_settings(REQUEST_TRACK_SETTINGS={"BACKGROUND_WRITER": True}):
+            middleware = LoggingRequestMiddleware(get_response)
+            await middleware(request)
+
+        mock_flusher_class.return_value.put.assert_awaited_once()
+        log_params = mock_flusher_class.return_value.put.call_args[0][0]
+        self.assertEqual(log_params["route"], "/test-path/")
+        self.assertIsNone(log_params["user_id"])
+
+    @mock.patch('request_track.middleware.redis_client', None)
+    def test_middleware_sync_excluded_skips_user(self):
+        """Test that excluded requests never load the user."""
+        request = self.factory.get("/health/")
+        user_loader = mock.MagicMock(return_value=self.user)
+        request.user = SimpleLazyObject(user_loader)
+
+        response_callable = mock.MagicMock(return_value=HttpResponse())
+        with override_settings(REQUEST_TRACK_SETTINGS={"EXCLUDE_PATHS": ["/health/"]}):
+            middleware = LoggingRequestMiddleware(response_callable)
+            middleware(request)
+
+        self.assertEqual(response_callable.call_count, 1)
+        user_loader.assert_not_called()
+        self.assertEqual(RequestLog.objects.count(), 0)
+
+    @mock.patch('request_track.middleware.redis_client', None)
+    async def test_middleware_async_unsampled_skips_user(self):
+        """Test that unsampled requests never await request.auser()."""
+        request = self.factory.get("/test-path/")
+        request.auser = mock.AsyncMock(return_value=self.anon_user)
+
+        async def get_response(request):
+            return HttpResponse()
+
+        with override_settings(REQUEST_TRACK_SETTINGS={"SAMPLING_RATE": 0.0}):
+            middleware = LoggingRequestMiddleware(get_response)
+            response = await middleware(request)
+
+        self.assertEqual(response.status_code, 200)
+        request.auser.assert_not_awaited()
+        self.assertEqual(await RequestLog.objects.acount(), 0)
@@ -0,0 +1,178 @@
+from datetime import datetime, timezone as dt_timezone
+from io import StringIO
+from unittest import skipUnless
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from request_track.models import RequestLog
+from request_track.partitions import (
+    convert_to_partitioned,
+    drop_partitions_before,
+    ensure_partitions,
+    get_partition_interval,
+    is_partitioned,
+    list_partitions,
+    next_period,
+    parse_upper_bound,
+    partition_name,
+    period_start,
+)
+
+
+class PeriodTestCase(SimpleTestCase):
+    def test_period_start(self):
+        """Test that moments are truncated to the UTC start of their period."""
+        moment = datetime(2024, 3, 15, 18, 30, tzinfo=dt_timezone.utc)
+
+        self.assertEqual(
+            period_start(moment, "day"), datetime(2024, 3, 15, tzinfo=dt_timezone.utc)
+        )
+        self.assertEqual(
+            period_start(moment, "month"), datetime(2024, 3, 1, tzinfo=dt_timezone.utc)
+        )
+
+    def test_next_period(self):
+        """Test that periods advance by a day or a calendar month."""
+        start = datetime(2024, 12, 1, tzinfo=dt_timezone.utc)
+
+        self.assertEqual(
+            next_period(start, "day"), datetime(2024, 12, 2, tzinfo=dt_timezone.utc)
+        )
+        self.assertEqual(
+            next_period(start, "month"), datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+        )
+
+    def test_partition_name(self):
+        """Test that partition names carry the start of their period."""
+        start = datetime(2024, 3, 1, tzinfo=dt_timezone.utc)
+
+        self.assertEqual(partition_name(start, "day"), "request_track_requestlog_20240301")
+        self.assertEqual(partition_name(start, "month"), "request_track_requestlog_202403")
+
+    def test_parse_upper_bound(self):
+        """Test that bounds with a PostgreSQL style offset are parsed."""
+        bound = (
+            "FOR VALUES FROM ('2024-01-01 00:00:00+00') TO ('2024-02-01 00:00:00+00')"
+        )
+
+        self.assertEqual(
+            parse_upper_bound(bound), datetime(2024, 2, 1, tzinfo=dt_timezone.utc)
+        )
+        legacy = "FOR VALUES FROM (MINVALUE) TO ('2024-01-01 00:00:00+00')"
+        self.assertEqual(
+            parse_upper_bound(legacy), datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        )
+        self.assertIsNone(parse_upper_bound("DEFAULT"))
+
+    def test_get_partition_interval(self):
+        """Test that unknown intervals are rejected."""
+        with override_settings(REQUEST_TRACK_SETTINGS={}):
+            self.assertIsNone(get_partition_interval())
+        with override_settings(REQUEST_TRACK_SETTINGS={"PARTITION_INTERVAL": "week"}):
+            with self.assertRaises(ImproperlyConfigured):
+                get_partition_interval()
+
+
+class PartitionCommandTestCase(TestCase):
+    def test_command_requires_interval(self):
+        """Test that the command refuses to run without PARTITION_INTERVAL."""
+        with override_settings(REQUEST_TRACK_SETTINGS={}):
+            with self.assertRaisesMessage(CommandError, "PARTITION_INTERVAL"):
+                call_command("request_log_partitions", stdout=StringIO())
+
+    @override_settings(REQUEST_TRACK_SETTINGS={"PARTITION_INTERVAL": "day"})
+    def test_command_requires_postgresql(self):
+        """Test that the command refuses to run on databases other than PostgreSQL."""
+        with self.assertRaisesMessage(CommandError, "PostgreSQL"):
+            call_command("request_log_partitions", "--convert", stdout=StringIO())
+
+
+@skipUnless(connection.vendor == "postgresql", "Partitioning requires PostgreSQL")
+@override_settings(
+    REQUEST_TRACK_SETTINGS={"PARTITION_INTERVAL": "day", "PARTITION_PREMAKE": 2}
+)
+class PostgresPartitionTestCase(TestCase):
+    now = datetime(2024, 3, 15, 12, tzinfo=dt_timezone.utc)
+
+    def create_log(self, requested_at: datetime) -> RequestLog:
+        log = RequestLog.objects.create(
+            route="/test/",
+            method="GET",
+            status_code=200,
+            requested_at=requested_at,
+        )
+        # Fire the deferred foreign key checks, as PostgreSQL refuses to alter
+        # a table with pending trigger events
+        connection.check_constraints()
+        return log
+
+    def convert(self) -> list[str]:
+        self.old = self.create_log(datetime(2024, 1, 1, tzinfo=dt_timezone.utc))
+        self.current = self.create_log(self.now)
+        return convert_to_partitioned(DEFAULT_DB_ALIAS, now=self.now)
+
+    def test_convert_keeps_rows_in_legacy_partition(self):
+        """Test that the existing table becomes the first partition."""
+        created = self.convert()
+
+        self.assertTrue(is_partitioned(DEFAULT_DB_ALIAS))
+        self.assertEqual(
+            created,
+            ["request_track_requestlog_20240316", "request_track_requestlog_20240317"],
+        )
+        self.assertEqual(
+            list_partitions(DEFAULT_DB_ALIAS),
+            [
+                ("request_track_requestlog_20240316",
+                 datetime(2024, 3, 17, tzinfo=dt_timezone.utc)),
+                ("request_track_requestlog_20240317",
+                 datetime(2024, 3, 18, tzinfo=dt_timezone.utc)),
+                ("request_track_requestlog_default", None),
+                ("request_track_requestlog_legacy",
+                 datetime(2024, 3, 16, tzinfo=dt_timezone.utc)),
+            ],
+        )
+        self.assertEqual(
+            set(RequestLog.objects.values_list("pk", flat=True)),
+            {self.old.pk, self.current.pk},
+        )
+
+        # New ids continue after the existing ones
+        log = self.create_log(datetime(2024, 3, 16, 1, tzinfo=dt_timezone.utc))
+        self.assertGreater(log.pk, self.current.pk)
+
+    def test_ensure_partitions_moves_default_rows(self):
+        """Test that rows in the default partition move into a new partition."""
+        self.convert()
+        later = datetime(2024, 3, 20, 8, tzinfo=dt_timezone.utc)
+        log = self.create_log(later)
+
+        created = ensure_partitions(DEFAULT_DB_ALIAS, ahead=0, now=later)
+
+        self.assertEqual(created, ["request_track_requestlog_20240320"])
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM request_track_requestlog_default")
+            self.assertEqual(cursor.fetchone()[0], 0)
+            cursor.execute("SELECT id FROM request_track_requestlog_20240320")
+            self.assertEqual(cursor.fetchall(), [(log.pk,)])
+
+    def test_drop_partitions_before(self):
+        """Test that only partitions entirely older than the cutoff are dropped."""
+        self.convert()
+
+        dropped = drop_partitions_before(
+            datetime(2024, 3, 17, tzinfo=dt_timezone.utc), DEFAULT_DB_ALIAS
+        )
+
+        self.assertEqual(
+            dropped,
+            ["request_track_requestlog_20240316", "request_track_requestlog_legacy"],
+        )
+        self.assertFalse(RequestLog.objects.exists())
+        self.assertEqual(
+            [name for name, _ in list_partitions(DEFAULT_DB_ALIAS)],
+            ["request_track_requestlog_20240317", "request_track_requestlog_default"],
+        )
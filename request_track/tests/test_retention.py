@@ -0,0 +1,150 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from request_track.models import RequestLog
+from request_track.retention import (
+    delete_older_than,
+    keep_latest,
+    parse_age,
+    purge_older_than,
+)
+from request_track.tests.utils import make_log
+
+
+class ParseAgeTestCase(SimpleTestCase):
+    def test_parse_age(self):
+        """Test that ages accept minutes, hours, days and weeks."""
+        self.assertEqual(parse_age("90m"), timedelta(minutes=90))
+        self.assertEqual(parse_age("12h"), timedelta(hours=12))
+        self.assertEqual(parse_age("30d"), timedelta(days=30))
+        self.assertEqual(parse_age("30"), timedelta(days=30))
+        self.assertEqual(parse_age("2w"), timedelta(weeks=2))
+
+        with self.assertRaises(ValueError):
+            parse_age("a month")
+
+
+class RetentionTestCase(TestCase):
+    def create_log(self, days_ago):
+        return RequestLog.objects.create(
+            **make_log(
+                ip_id=None,
+                ip_address="10.0.0.1",
+                requested_at=timezone.now() - timedelta(days=days_ago),
+            )
+        )
+
+    def test_delete_in_batches(self):
+        """Test that old rows are deleted range by range and recent ones are kept."""
+        for days_ago in (40, 39, 38, 37, 36, 2, 1):
+            self.create_log(days_ago)
+        # Written late, so its id is higher than the newest old row's
+        self.create_log(50)
+        progress = []
+
+        deleted = delete_older_than(
+            timezone.now() - timedelta(days=30), batch_size=2, progress=progress.append
+        )
+
+        self.assertEqual(deleted, 6)
+        self.assertEqual(RequestLog.objects.count(), 2)
+        self.assertEqual(progress, [2, 4, 5, 6])
+
+    def test_delete_late_rows_in_batches(self):
+        """Test that old rows with ids above the newest old row go in batches."""
+        self.create_log(40)
+        self.create_log(1)
+        for _ in range(5):
+            self.create_log(50)
+        progress = []
+
+        deleted = delete_older_than(
+            timezone.now() - timedelta(days=30), batch_size=2, progress=progress.append
+        )
+
+        self.assertEqual(deleted, 6)
+        self.assertEqual(RequestLog.objects.count(), 1)
+        self.assertEqual(progress, [1, 3, 5, 6])
+
+    def test_nothing_to_delete(self):
+        """Test that no statement runs when no row is old enough."""
+        self.create_log(1)
+
+        with self.assertNumQueries(1):
+            deleted = delete_older_than(timezone.now() - timedelta(days=30))
+
+        self.assertEqual(deleted, 0)
+
+    def test_purge_without_partitions(self):
+        """Test that purging an unpartitioned table only deletes rows."""
+        self.create_log(10)
+        recent = self.create_log(1)
+
+        deleted, dropped = purge_older_than(timezone.now() - timedelta(days=7))
+
+        self.assertEqual(deleted, 1)
+        self.assertEqual(dropped, [])
+        self.assertEqual(list(RequestLog.objects.all()), [recent])
+
+    def test_keep_latest(self):
+        """Test that only the newest logs are kept, ties broken by id."""
+        moment = timezone.now() - timedelta(days=5)
+        for days_ago in (40, 30, 20):
+            self.create_log(days_ago)
+        tied = [
+            RequestLog.objects.create(
+                ip_address="10.0.0.1",
+                user_agent="Test Agent",
+                route="/test/",
+                method="GET",
+                query_params="",
+                status_code=200,
+                requested_at=moment,
+            )
+            for _ in range(3)
+        ]
+        newest = self.create_log(1)
+
+        deleted, dropped = keep_latest(2, batch_size=2)
+
+        self.assertEqual(deleted, 5)
+        self.assertEqual(dropped, [])
+        self.assertEqual(
+            set(RequestLog.objects.values_list("pk", flat=True)),
+            {newest.pk, tied[-1].pk},
+        )
+
+    def test_keep_latest_with_fewer_logs(self):
+        """Test that nothing is deleted when there are at most n logs."""
+        self.create_log(1)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(keep_latest(5), (0, []))
+
+    def test_command(self):
+        """Test that the command deletes logs older than --older-than."""
+        self.create_log(40)
+        self.create_log(1)
+        out = StringIO()
+
+        call_command("purge_request_logs", "--older-than", "30d", "--batch-size", "1",
+                     stdout=out)
+
+        self.assertIn("1 logs deleted.", out.getvalue())
+        self.assertEqual(RequestLog.objects.count(), 1)
+
+    def test_command_uses_retention_days(self):
+        """Test that the command falls back to RETENTION_DAYS."""
+        self.create_log(10)
+
+        with override_settings(REQUEST_TRACK_SETTINGS={"RETENTION_DAYS": 7}):
+            call_command("purge_request_logs", stdout=StringIO())
+        self.assertEqual(RequestLog.objects.count(), 0)
+
+        with override_settings(REQUEST_TRACK_SETTINGS={}):
+            with self.assertRaises(CommandError):
+                call_command("purge_request_logs", stdout=StringIO())
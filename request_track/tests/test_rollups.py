@@ -0,0 +1,103 @@
+from datetime import datetime, timezone as dt_timezone
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+
+from request_track.models import RequestLogRollup
+from request_track.rollups import UserSketch, aggregate_logs, rollup_key, save_rollups
+from request_track.tests.utils import make_log
+from request_track.utils import lock_rows
+
+
+User = get_user_model()
+
+
+def rollup_log(**overrides):
+    return make_log(**{"requested_at": "2024-01-01T12:00:30.5+00:00", **overrides})
+
+
+class AggregateTestCase(SimpleTestCase):
+    def test_rollup_key(self):
+        """Test that logs are keyed by minute, route, method, status class and app."""
+        self.assertEqual(
+            rollup_key(rollup_log(status_code=404, app_name="api")),
+            (
+                datetime(2024, 1, 1, 12, 0, tzinfo=dt_timezone.utc),
+                "/test/",
+                "GET",
+                4,
+                "api",
+            ),
+        )
+        self.assertEqual(rollup_key(rollup_log())[4], "")
+
+    def test_aggregate_logs(self):
+        """Test that a batch is counted per rollup row with its users."""
+        logs = [
+            rollup_log(user_id=1),
+            rollup_log(user_id=1, requested_at="2024-01-01T12:00:59+00:00"),
+            rollup_log(user_id=2, status_code=204),
+            rollup_log(),
+            rollup_log(requested_at="2024-01-01T12:01:00+00:00"),
+        ]
+
+        rollups = aggregate_logs(logs)
+
+        minute = datetime(2024, 1, 1, 12, 0, tzinfo=dt_timezone.utc)
+        self.assertEqual(rollups[(minute, "/test/", "GET", 2, "")], [4, {1, 2}])
+        self.assertEqual(len(rollups), 2)
+
+    def test_user_sketch(self):
+        """Test that user sketches estimate distinct users and merge losslessly."""
+        first, second = UserSketch(), UserSketch()
+        for user_id in range(3000):
+            first.add(user_id)
+        for user_id in range(2000, 5000):
+            second.add(user_id)
+        self.assertEqual(UserSketch().estimate(), 0)
+        self.assertAlmostEqual(first.estimate(), 3000, delta=3000 * 0.2)
+
+        first.merge(second)
+        self.assertAlmostEqual(first.estimate(), 5000, delta=5000 * 0.2)
+        self.assertEqual(UserSketch(first.to_bytes()).registers, first.registers)
+
+        small = UserSketch()
+        for user_id in (1, 2, 2, 3):
+            small.add(user_id)
+        self.assertEqual(small.estimate(), 3)
+
+
+class SaveRollupsTestCase(TestCase):
+    def test_save_rollups_adds_counts(self):
+        """Test that saving the same rollup twice adds the counts."""
+        user = User.objects.create_user(username="testuser", password="testpassword")
+        logs = [rollup_log(user_id=user.pk), rollup_log(), rollup_log(status_code=500)]
+
+        self.assertEqual(save_rollups(logs), 2)
+        save_rollups(logs[:2])
+
+        ok = RequestLogRollup.objects.get(status_class=2)
+        # The user is seen in both batches but counted once
+        self.assertEqual((ok.count, ok.users), (4, 1))
+        self.assertEqual(ok.bucket, datetime(2024, 1, 1, 12, 0, tzinfo=dt_timezone.utc))
+        self.assertEqual(RequestLogRollup.objects.get(status_class=5).count, 1)
+
+    def test_save_nothing(self):
+        """Test that an empty batch runs no query."""
+        with self.assertNumQueries(0):
+            self.assertEqual(save_rollups([]), 0)
+
+    def test_lock_rows_matches_exact_keys(self):
+        """Test that only rows of the given keys are locked, not their cross product."""
+        minute = datetime(2024, 1, 1, 12, 0, tzinfo=dt_timezone.utc)
+        fields = ("route", "method")
+        for route, method in (("/a/", "GET"), ("/a/", "POST"), ("/b/", "GET")):
+            RequestLogRollup.objects.create(
+                bucket=minute, route=route, method=method, status_class=2, count=1
+            )
+
+        rows = lock_rows(
+            RequestLogRollup.objects.all(), fields, [("/a/", "GET"), ("/b/", "POST")]
+        )
+
+        self.assertEqual([(row.route, row.method) for row in rows], [("/a/", "GET")])
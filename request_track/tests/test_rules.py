@@ -0,0 +1,72 @@
+from django.test import SimpleTestCase, RequestFactory, override_settings
+from django.contrib.auth.models import AnonymousUser
+
+from request_track.rules import PrefixMatcher, RequestFilter, get_request_filter
+
+
+class PrefixMatcherTestCase(SimpleTestCase):
+    def test_matches(self):
+        """Test that paths match when they start with any prefix."""
+        matcher = PrefixMatcher(["/admin/", "/api/v1", "/static"])
+
+        self.assertTrue(matcher.matches("/admin/"))
+        self.assertTrue(matcher.matches("/admin/auth/user/"))
+        self.assertTrue(matcher.matches("/api/v1/orders/"))
+        self.assertTrue(matcher.matches("/staticfiles/app.css"))
+        self.assertFalse(matcher.matches("/admin"))
+        self.assertFalse(matcher.matches("/api/v2/"))
+        self.assertFalse(matcher.matches("/"))
+
+    def test_overlapping_prefixes(self):
+        """Test that a shorter prefix matches even when a longer one shares it."""
+        matcher = PrefixMatcher(["/api/v1/orders/", "/api/"])
+
+        self.assertTrue(matcher.matches("/api/health"))
+        self.assertTrue(matcher.matches("/api/v1/orders/1/"))
+
+    def test_empty(self):
+        """Test that an empty matcher is falsy and matches nothing."""
+        matcher = PrefixMatcher([])
+
+        self.assertFalse(matcher)
+        self.assertFalse(matcher.matches("/"))
+
+    def test_empty_prefix_matches_everything(self):
+        """Test that an empty string prefix behaves like str.startswith('')."""
+        matcher = PrefixMatcher([""])
+
+        self.assertTrue(matcher.matches("/anything/"))
+
+
+class RequestFilterTestCase(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.anon_user = AnonymousUser()
+
+    def test_many_exclude_paths(self):
+        """Test excluding with a large number of prefixes."""
+        request_filter = RequestFilter(
+            {"EXCLUDE_PATHS": [f"/excluded-{i}/" for i in range(500)]}
+        )
+
+        self.assertFalse(
+            request_filter.should_log(self.factory.get("/excluded-250/x/"), self.anon_user)
+        )
+        self.assertTrue(
+            request_filter.should_log(self.factory.get("/included/"), self.anon_user)
+        )
+
+    def test_recompiled_on_setting_changed(self):
+        """Test that the compiled rules follow changes to REQUEST_TRACK_SETTINGS."""
+        request = self.factory.get("/private/")
+
+        with override_settings(REQUEST_TRACK_SETTINGS={}):
+            self.assertTrue(get_request_filter().should_log(request, self.anon_user))
+
+        with override_settings(REQUEST_TRACK_SETTINGS={"EXCLUDE_PATHS": ["/private/"]}):
+            self.assertFalse(get_request_filter().should_log(request, self.anon_user))
+
+    def test_compiled_once(self):
+        """Test that the same compiled rules are reused between requests."""
+        with override_settings(REQUEST_TRACK_SETTINGS={}):
+            self.assertIs(get_request_filter(), get_request_filter())
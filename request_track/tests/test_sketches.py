@@ -0,0 +1,96 @@
+import random
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from request_track.models import RouteLatencySketch
+from request_track.sketches import (
+    RELATIVE_ACCURACY,
+    LatencySketch,
+    bucket_start,
+    route_percentiles,
+    save_sketches,
+)
+from request_track.tests.utils import make_log
+
+
+def sketch_log(duration, requested_at="2024-01-01T12:10:00+00:00", **overrides):
+    return make_log(duration=duration, requested_at=requested_at, **overrides)
+
+
+class LatencySketchTestCase(SimpleTestCase):
+    def test_quantiles_within_accuracy(self):
+        """Test that quantiles stay within the relative accuracy."""
+        rng = random.Random(42)
+        values = sorted(rng.lognormvariate(9, 1.5) for _ in range(10000))
+        sketch = LatencySketch()
+        for value in values:
+            sketch.add(value)
+
+        for q in (0.5, 0.9, 0.95, 0.99):
+            expected = values[int(q * (len(values) - 1))]
+            self.assertAlmostEqual(
+                sketch.quantile(q), expected, delta=expected * RELATIVE_ACCURACY
+            )
+
+    def test_merge_and_serialize(self):
+        """Test that merged and reloaded sketches keep every duration."""
+        first, second = LatencySketch(), LatencySketch()
+        for value in (0, 100, 200):
+            first.add(value)
+        second.add(5000, count=3)
+
+        first.merge(second)
+        loaded = LatencySketch.from_bytes(first.to_bytes())
+
+        self.assertEqual(loaded.count, 6)
+        self.assertEqual(loaded.quantile(0), 0.0)
+        self.assertAlmostEqual(loaded.quantile(1), 5000, delta=50)
+        self.assertIsNone(LatencySketch().quantile(0.5))
+        self.assertEqual(LatencySketch.from_bytes(b"").count, 0)
+
+    def test_bucket_start(self):
+        """Test that moments are truncated to the start of their bucket."""
+        moment = datetime(2024, 1, 1, 12, 34, 56, 789, tzinfo=dt_timezone.utc)
+
+        self.assertEqual(
+            bucket_start(moment, 3600), datetime(2024, 1, 1, 12, tzinfo=dt_timezone.utc)
+        )
+        self.assertEqual(
+            bucket_start(moment, 300),
+            datetime(2024, 1, 1, 12, 30, tzinfo=dt_timezone.utc),
+        )
+
+
+class RoutePercentilesTestCase(TestCase):
+    def test_save_and_merge_buckets(self):
+        """Test that sketches are merged on save and across buckets on read."""
+        save_sketches([sketch_log(1000), sketch_log(2000), sketch_log(None)])
+        save_sketches([sketch_log(3000)])
+        save_sketches([sketch_log(100000, requested_at="2024-01-01T13:10:00+00:00")])
+
+        self.assertEqual(RouteLatencySketch.objects.count(), 2)
+        self.assertEqual(RouteLatencySketch.objects.order_by("bucket").first().count, 3)
+
+        hour = datetime(2024, 1, 1, 12, tzinfo=dt_timezone.utc)
+        first_hour = route_percentiles(
+            "/test/", "GET", hour, hour + timedelta(hours=1), percentiles=(50,)
+        )
+        self.assertAlmostEqual(first_hour[50], 2.0, delta=0.02)
+
+        both_hours = route_percentiles("/test/", percentiles=(100,))
+        self.assertAlmostEqual(both_hours[100], 100.0, delta=1)
+
+        self.assertEqual(route_percentiles("/other/"), {50: None, 95: None, 99: None})
+
+    @override_settings(REQUEST_TRACK_SETTINGS={"LATENCY_SKETCH_INTERVAL": 60})
+    def test_interval_setting(self):
+        """Test that the bucket width follows LATENCY_SKETCH_INTERVAL."""
+        save_sketches(
+            [
+                sketch_log(1000),
+                sketch_log(1000, requested_at="2024-01-01T12:11:00+00:00"),
+            ]
+        )
+
+        self.assertEqual(RouteLatencySketch.objects.count(), 2)
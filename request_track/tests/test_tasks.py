@@ -1,12 +1,26 @@
+from datetime import timedelta
 from unittest import mock
 
 from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 import msgpack
 
-from request_track.tasks import process_request_logs
-from request_track.models import RequestLog, IpAddress
+from request_track.tasks import (
+    keep_last_logs,
+    process_request_logs,
+    purge_logs_before,
+    purge_request_logs,
+)
+from request_track.wire import encode_log, pack_frame
+from request_track.writers import write_logs
+from request_track.models import (
+    IpAddress,
+    RequestLog,
+    RequestLogRollup,
+    RouteLatencySketch,
+)
 
 
 User = get_user_model()
@@ -55,11 +69,9 @@ class TasksTestCase(TestCase):
     def test_process_request_logs_empty(self, mock_redis_client):
         """Test handling when no logs to process."""
         mock_redis_client.__bool__.return_value = True
-        mock_pipeline = mock.MagicMock()
-        mock_redis_client.pipeline.return_value = mock_pipeline
         
         # No items in Redis
-        mock_pipeline.execute.return_value = ([], None)
+        mock_redis_client.spop.return_value = []
         
         result = process_request_logs()
         
@@ -71,14 +83,12 @@ class TasksTestCase(TestCase):
     def test_process_request_logs_with_ip_model(self, mock_msgpack, mock_redis_client):
         """Test processing logs with IP relation."""
         mock_redis_client.__bool__.return_value = True
-        mock_pipeline = mock.MagicMock()
-        mock_redis_client.pipeline.return_value = mock_pipeline
         
         # Pack the log data
         packed_data_1 = msgpack.dumps(self.log_data_with_ip)
         
         # One item in Redis
-        mock_pipeline.execute.return_value = ([packed_data_1], None)
+        mock_redis_client.spop.return_value = [packed_data_1]
         
         # Mock msgpack.loads to return our original data
         mock_msgpack.loads.return_value = self.log_data_with_ip
@@ -109,14 +119,12 @@ class TasksTestCase(TestCase):
     def test_process_request_logs_with_direct_ip(self, mock_msgpack, mock_redis_client):
         """Test processing logs with direct IP address."""
         mock_redis_client.__bool__.return_value = True
-        mock_pipeline = mock.MagicMock()
-        mock_redis_client.pipeline.return_value = mock_pipeline
         
         # Pack the log data
         packed_data_2 = msgpack.dumps(self.log_data_with_direct_ip)
         
         # One item in Redis
-        mock_pipeline.execute.return_value = ([packed_data_2], None)
+        mock_redis_client.spop.return_value = [packed_data_2]
         
         # Mock msgpack.loads to return our original data
         mock_msgpack.loads.return_value = self.log_data_with_direct_ip
@@ -143,15 +151,13 @@ class TasksTestCase(TestCase):
     def test_process_request_logs_multiple(self, mock_msgpack, mock_redis_client):
         """Test processing multiple logs at once."""
         mock_redis_client.__bool__.return_value = True
-        mock_pipeline = mock.MagicMock()
-        mock_redis_client.pipeline.return_value = mock_pipeline
         
         # Pack the log data
         packed_data_1 = msgpack.dumps(self.log_data_with_ip)
         packed_data_2 = msgpack.dumps(self.log_data_with_direct_ip)
         
         # Multiple items in Redis
-        mock_pipeline.execute.return_value = ([packed_data_1, packed_data_2], None)
+        mock_redis_client.spop.return_value = [packed_data_1, packed_data_2]
         
         # Mock msgpack.loads to return our original data
         mock_msgpack.loads.side_effect = [
@@ -174,14 +180,12 @@ class TasksTestCase(TestCase):
     def test_process_request_logs_max_items(self, mock_msgpack, mock_redis_client):
         """Test processing logs with max_items parameter."""
         mock_redis_client.__bool__.return_value = True
-        mock_pipeline = mock.MagicMock()
-        mock_redis_client.pipeline.return_value = mock_pipeline
         
         # Pack the log data
         packed_data = msgpack.dumps(self.log_data_with_ip)
         
         # One item in Redis
-        mock_pipeline.execute.return_value = ([packed_data], None)
+        mock_redis_client.spop.return_value = [packed_data]
         
         # Mock msgpack.loads to return our original data
         mock_msgpack.loads.return_value = self.log_data_with_ip
@@ -190,7 +194,7 @@ class TasksTestCase(TestCase):
         result = process_request_logs(max_items=10)
         
         # Should call spop with the limit
-        mock_pipeline.spop.assert_called_with(mock.ANY, 10)
+        mock_redis_client.spop.assert_called_with(mock.ANY, 10)
         
         # Check results
         self.assertEqual(RequestLog.objects.count(), 1)
@@ -203,14 +207,12 @@ class TasksTestCase(TestCase):
         ip = IpAddress.objects.create(ip="192.168.1.1")
         
         mock_redis_client.__bool__.return_value = True
-        mock_pipeline = mock.MagicMock()
-        mock_redis_client.pipeline.return_value = mock_pipeline
         
         # Pack the log data
         packed_data = msgpack.dumps(self.log_data_with_ip)
         
         # One item in Redis
-        mock_pipeline.execute.return_value = ([packed_data], None)
+        mock_redis_client.spop.return_value = [packed_data]
         
         # Mock msgpack.loads to return our original data
         mock_msgpack.loads.return_value = self.log_data_with_ip
@@ -227,4 +229,338 @@ class TasksTestCase(TestCase):
         
         # Verify the log correctly references the existing IP
         log = RequestLog.objects.first()
-        self.assertEqual(log.ip, ip)
\ No newline at end of file
+        self.assertEqual(log.ip, ip)
+
+    @mock.patch('request_track.tasks.redis_client')
+    def test_process_request_logs_drains_in_chunks(self, mock_redis_client):
+        """Test that a large backlog is popped and inserted chunk by chunk."""
+        packed = msgpack.dumps(self.log_data_with_direct_ip)
+        mock_redis_client.spop.side_effect = [[packed] * 2, [packed] * 2, [packed]]
+
+        with mock.patch('request_track.tasks.write_logs', wraps=write_logs) as mock_write:
+            result = process_request_logs(batch_size=2)
+
+        self.assertEqual(result, {"processed": 5})
+        self.assertEqual(RequestLog.objects.count(), 5)
+        self.assertEqual(mock_redis_client.spop.call_count, 3)
+        self.assertEqual([len(c.args[0]) for c in mock_write.call_args_list], [2, 2, 1])
+
+    @mock.patch('request_track.tasks.redis_client')
+    def test_process_request_logs_max_items_across_chunks(self, mock_redis_client):
+        """Test that max_items caps the total across chunks."""
+        packed = msgpack.dumps(self.log_data_with_direct_ip)
+        mock_redis_client.spop.side_effect = lambda key, count: [packed] * count
+
+        result = process_request_logs(max_items=5, batch_size=2)
+
+        self.assertEqual(result, {"processed": 5})
+        self.assertEqual(
+            [c.args[1] for c in mock_redis_client.spop.call_args_list], [2, 2, 1]
+        )
+
+    @mock.patch('request_track.tasks.redis_client')
+    @mock.patch('request_track.tasks.time.monotonic')
+    def test_process_request_logs_time_budget(self, mock_monotonic, mock_redis_client):
+        """Test that no new chunk is started once the time budget is spent."""
+        packed = msgpack.dumps(self.log_data_with_direct_ip)
+        mock_redis_client.spop.side_effect = lambda key, count: [packed] * count
+        mock_monotonic.side_effect = [0.0, 1.0, 11.0]
+
+        result = process_request_logs(batch_size=2, time_budget=10)
+
+        self.assertEqual(result, {"processed": 4})
+        self.assertEqual(mock_redis_client.spop.call_count, 2)
+
+    @mock.patch('request_track.tasks.redis_client')
+    def test_process_request_logs_stream_acks_after_write(self, mock_redis_client):
+        """Test that stream entries are acknowledged only after they were saved."""
+        packed = msgpack.dumps(self.log_data_with_direct_ip)
+        mock_redis_client.xautoclaim.return_value = [b"0-0", [], []]
+        mock_redis_client.xreadgroup.side_effect = [
+            [[b"req_logs", [(b"1-0", {b"d": packed}), (b"1-1", {b"d": packed})]]],
+            [],
+        ]
+        pipe = mock_redis_client.pipeline.return_value
+
+        def check_saved(*ids):
+            self.assertEqual(RequestLog.objects.count(), 2)
+
+        pipe.xack.side_effect = check_saved
+
+        with override_settings(REQUEST_TRACK_SETTINGS={"REDIS_BUFFER_TYPE": "stream"}):
+            result = process_request_logs(batch_size=10)
+
+        self.assertEqual(result, {"processed": 2})
+        pipe.xack.assert_called_once()
+
+    @mock.patch('request_track.tasks.redis_client')
+    def test_process_request_logs_write_error_leaves_stream_pending(self, mock_redis_client):
+        """Test that a failed write does not acknowledge stream entries."""
+        packed = msgpack.dumps(self.log_data_with_direct_ip)
+        mock_redis_client.xautoclaim.return_value = [b"0-0", [], []]
+        mock_redis_client.xreadgroup.return_value = [
+            [b"req_logs", [(b"1-0", {b"d": packed})]]
+        ]
+
+        with override_settings(REQUEST_TRACK_SETTINGS={"REDIS_BUFFER_TYPE": "stream"}):
+            with mock.patch('request_track.tasks.write_logs', side_effect=RuntimeError):
+                with self.assertRaises(RuntimeError):
+                    process_request_logs(batch_size=10)
+
+        mock_redis_client.pipeline.return_value.xack.assert_not_called()
+
+    @mock.patch('request_track.tasks.redis_client')
+    def test_process_request_logs_reliable_flush(self, mock_redis_client):
+        """Test that reliable flush recovers first and acknowledges after saving."""
+        packed = msgpack.dumps(self.log_data_with_direct_ip)
+        mock_redis_client.zrangebyscore.return_value = ["{req_logs}:processing:1"]
+        script = mock_redis_client.register_script.return_value
+        script.side_effect = [0, [packed]]  # Recovery sweep, then one claimed batch
+        pipe = mock_redis_client.pipeline.return_value
+
+        with override_settings(REQUEST_TRACK_SETTINGS={
+            "REDIS_BUFFER_TYPE": "list",
+            "REDIS_RELIABLE_FLUSH": True,
+        }):
+            result = process_request_logs(batch_size=10)
+
+        self.assertEqual(result, {"processed": 1})
+        self.assertEqual(RequestLog.objects.count(), 1)
+        self.assertEqual(script.call_count, 2)
+        pipe.delete.assert_called_once()
+
+    @mock.patch('request_track.tasks.redis_client')
+    def test_process_request_logs_reliable_flush_keeps_failed_batch(self, mock_redis_client):
+        """Test that a failed write leaves the batch in its processing key."""
+        packed = msgpack.dumps(self.log_data_with_direct_ip)
+        mock_redis_client.zrangebyscore.return_value = []
+        script = mock_redis_client.register_script.return_value
+        script.side_effect = [[packed]]
+
+        with override_settings(REQUEST_TRACK_SETTINGS={
+            "REDIS_BUFFER_TYPE": "set",
+            "REDIS_RELIABLE_FLUSH": True,
+        }):
+            with mock.patch('request_track.tasks.write_logs', side_effect=RuntimeError):
+                with self.assertRaises(RuntimeError):
+                    process_request_logs(batch_size=10)
+
+        mock_redis_client.pipeline.return_value.delete.assert_not_called()
+
+    @mock.patch('request_track.tasks.redis_key', "req_logs")
+    @mock.patch('request_track.tasks.redis_client')
+    @mock.patch('request_track.tasks.group')
+    def test_process_request_logs_fans_out_shards(self, mock_group, mock_redis_client):
+        """Test that a sharded buffer dispatches one task per shard."""
+        with override_settings(REQUEST_TRACK_SETTINGS={"REDIS_SHARDS": 3}):
+            result = process_request_logs(batch_size=10)
+
+        self.assertEqual(result, {"dispatched": 3})
+        signatures = list(mock_group.call_args.args[0])
+        self.assertEqual([sig.kwargs["shard"] for sig in signatures], [0, 1, 2])
+        mock_group.return_value.apply_async.assert_called_once()
+        mock_redis_client.spop.assert_not_called()
+
+    @mock.patch('request_track.tasks.redis_key', "req_logs")
+    @mock.patch('request_track.tasks.redis_client')
+    @mock.patch('request_track.tasks.group')
+    def test_process_request_logs_splits_max_items(self, mock_group, mock_redis_client):
+        """Test that max_items is split across the shard tasks."""
+        with override_settings(REQUEST_TRACK_SETTINGS={"REDIS_SHARDS": 3}):
+            process_request_logs(max_items=100, batch_size=10, time_budget=5)
+
+        signatures = list(mock_group.call_args.args[0])
+        self.assertEqual([sig.args for sig in signatures], [(34, 10, 5)] * 3)
+
+        with override_settings(REQUEST_TRACK_SETTINGS={"REDIS_SHARDS": 3}):
+            process_request_logs(batch_size=10)
+
+        signatures = list(mock_group.call_args.args[0])
+        self.assertEqual([sig.args for sig in signatures], [(None, 10, None)] * 3)
+
+    @mock.patch('request_track.tasks.redis_key', "req_logs")
+    @mock.patch('request_track.tasks.redis_client')
+    def test_process_request_logs_drains_one_shard(self, mock_redis_client):
+        """Test that a shard task only pops from its own shard key."""
+        mock_redis_client.spop.return_value = [msgpack.dumps(self.log_data_with_direct_ip)]
+
+        with override_settings(REQUEST_TRACK_SETTINGS={"REDIS_SHARDS": 3}):
+            result = process_request_logs(batch_size=10, shard=1)
+
+        self.assertEqual(result, {"processed": 1})
+        mock_redis_client.spop.assert_called_once_with("req_logs:1", 10)
+
+    def test_purge_request_logs(self):
+        """Test that the retention task deletes logs older than RETENTION_DAYS."""
+        write_logs([self.log_data_with_direct_ip])  # Requested in 2023
+        write_logs([{**self.log_data_with_direct_ip, "requested_at": timezone.now()}])
+
+        with override_settings(REQUEST_TRACK_SETTINGS={"RETENTION_DAYS": 30}):
+            result = purge_request_logs()
+
+        self.assertEqual(result, {"deleted": 1, "dropped": 0})
+        self.assertEqual(RequestLog.objects.count(), 1)
+
+    def test_purge_request_logs_not_configured(self):
+        """Test that the retention task does nothing without RETENTION_DAYS."""
+        with override_settings(REQUEST_TRACK_SETTINGS={}):
+            result = purge_request_logs()
+
+        self.assertEqual(result, {"error": "RETENTION_DAYS not configured"})
+
+    def test_keep_last_logs(self):
+        """Test that the maintenance task keeps only the newest logs."""
+        write_logs([self.log_data_with_direct_ip])  # Requested in 2023
+        write_logs([{**self.log_data_with_direct_ip, "requested_at": timezone.now()}])
+
+        result = keep_last_logs(1)
+
+        self.assertEqual(result, {"deleted": 1, "dropped": 0})
+        self.assertEqual(RequestLog.objects.count(), 1)
+
+    def test_purge_logs_before(self):
+        """Test that the maintenance task deletes logs before an ISO cutoff."""
+        write_logs([self.log_data_with_direct_ip])  # Requested in 2023
+        write_logs([{**self.log_data_with_direct_ip, "requested_at": timezone.now()}])
+        cutoff = timezone.now() - timedelta(days=7)
+
+        result = purge_logs_before(cutoff.isoformat())
+
+        self.assertEqual(result, {"deleted": 1, "dropped": 0})
+        self.assertEqual(RequestLog.objects.count(), 1)
+
+    @override_settings(REQUEST_TRACK_SETTINGS={"USE_ROLLUPS": True})
+    @mock.patch('request_track.tasks.redis_client')
+    def test_process_request_logs_with_rollups(self, mock_redis_client):
+        """Test that flushed logs are also counted in the rollups."""
+        mock_redis_client.__bool__.return_value = True
+        mock_redis_client.spop.side_effect = [
+            [msgpack.dumps(self.log_data_with_ip), msgpack.dumps(self.log_data_with_ip)],
+            [],
+        ]
+
+        result = process_request_logs()
+
+        self.assertEqual(result, {"processed": 2})
+        rollup = RequestLogRollup.objects.get()
+        self.assertEqual(
+            (rollup.route, rollup.status_class, rollup.app_name), ("/test/", 2, "test_app")
+        )
+        self.assertEqual((rollup.count, rollup.users), (2, 1))
+
+    @override_settings(REQUEST_TRACK_SETTINGS={"USE_LATENCY_SKETCHES": True})
+    @mock.patch('request_track.tasks.redis_client')
+    def test_process_request_logs_with_sketches(self, mock_redis_client):
+        """Test that flushed durations are added to the latency sketches."""
+        mock_redis_client.__bool__.return_value = True
+        mock_redis_client.spop.side_effect = [
+            [
+                msgpack.dumps({**self.log_data_with_ip, "duration": 1500}),
+                msgpack.dumps(self.log_data_with_direct_ip),
+            ],
+            [],
+        ]
+
+        result = process_request_logs()
+
+        self.assertEqual(result, {"processed": 2})
+        sketch = RouteLatencySketch.objects.get()
+        self.assertEqual((sketch.route, sketch.method, sketch.count), ("/test/", "GET", 1))
+
+    @override_settings(
+        REQUEST_TRACK_SETTINGS={"USE_ROLLUPS": True, "USE_LATENCY_SKETCHES": True}
+    )
+    @mock.patch('request_track.tasks.redis_client')
+    def test_process_request_logs_rollups_by_pattern(self, mock_redis_client):
+        """Test that paths of the same URL pattern share rollup and sketch rows."""
+        mock_redis_client.__bool__.return_value = True
+        logs = [
+            {**self.log_data_with_ip, "route": f"/items/{pk}/",
+             "pattern": "items/<int:pk>/", "duration": 1500}
+            for pk in (1, 2)
+        ]
+        mock_redis_client.spop.side_effect = [
+            [msgpack.dumps(log) for log in logs],
+            [],
+        ]
+
+        result = process_request_logs()
+
+        self.assertEqual(result, {"processed": 2})
+        rollup = RequestLogRollup.objects.get()
+        self.assertEqual((rollup.route, rollup.count), ("items/<int:pk>/", 2))
+        sketch = RouteLatencySketch.objects.get()
+        self.assertEqual((sketch.route, sketch.count), ("items/<int:pk>/", 2))
+        self.assertEqual(
+            set(RequestLog.objects.values_list("route", "pattern__pattern")),
+            {("/items/1/", "items/<int:pk>/"), ("/items/2/", "items/<int:pk>/")},
+        )
+
+    @mock.patch('request_track.tasks.redis_client')
+    def test_process_request_logs_wire_format(self, mock_redis_client):
+        """Test that positional entries and legacy dict entries are both saved."""
+        mock_redis_client.__bool__.return_value = True
+        log = {
+            **self.log_data_with_ip,
+            "requested_at": timezone.now(),
+            "duration": 1500,
+        }
+        mock_redis_client.spop.side_effect = [
+            [
+                msgpack.dumps(encode_log(log)),
+                msgpack.dumps(self.log_data_with_direct_ip),
+            ],
+            [],
+        ]
+
+        result = process_request_logs()
+
+        self.assertEqual(result, {"processed": 2})
+        saved = RequestLog.objects.get(ip_id="192.168.1.1")
+        self.assertEqual(saved.requested_at, log["requested_at"])
+        self.assertEqual(saved.duration, 1500)
+        self.assertTrue(RequestLog.objects.filter(ip_address="192.168.1.2").exists())
+
+    @mock.patch('request_track.tasks.redis_client')
+    def test_process_request_logs_compressed_frames(self, mock_redis_client):
+        """Test that compressed frames are unpacked into their logs."""
+        mock_redis_client.__bool__.return_value = True
+        frame = pack_frame(
+            [
+                msgpack.dumps(self.log_data_with_ip),
+                msgpack.dumps(self.log_data_with_direct_ip),
+            ],
+            "zlib",
+        )
+        mock_redis_client.spop.side_effect = [[frame], []]
+
+        result = process_request_logs()
+
+        self.assertEqual(result, {"processed": 2})
+        self.assertEqual(RequestLog.objects.count(), 2)
+
+    @override_settings(REQUEST_TRACK_SETTINGS={"REDIS_COMPRESSION": "zlib"})
+    @mock.patch('request_track.tasks.redis_client')
+    def test_process_request_logs_bounds_frames_by_entries(self, mock_redis_client):
+        """Test that chunks and max_items count the logs inside frames."""
+        mock_redis_client.__bool__.return_value = True
+        entry = msgpack.dumps(self.log_data_with_direct_ip)
+        frames = [pack_frame([entry] * 3, "zlib") for _ in range(3)]
+        mock_redis_client.spop.side_effect = lambda key, count: [
+            frames.pop() for _ in range(min(count, len(frames)))
+        ]
+
+        with mock.patch(
+            "request_track.tasks.write_logs", wraps=write_logs
+        ) as mock_write_logs:
+            result = process_request_logs(max_items=4, batch_size=2)
+
+        # Frames are popped one at a time and never split across acks
+        self.assertEqual(result, {"processed": 6})
+        self.assertEqual(
+            [c.args[1] for c in mock_redis_client.spop.call_args_list], [1, 1]
+        )
+        self.assertEqual(
+            [len(c.args[0]) for c in mock_write_logs.call_args_list], [2, 1, 2, 1]
+        )
+        self.assertEqual(len(frames), 1)
@@ -1,6 +1,13 @@
+from django.http import HttpResponse, StreamingHttpResponse
 from django.test import TestCase, RequestFactory
+from django.urls import resolve
 
-from request_track.utils import get_ip_address
+from request_track.utils import (
+    get_ip_address,
+    get_request_size,
+    get_response_size,
+    get_route_pattern,
+)
 
 
 class UtilsTestCase(TestCase):
@@ -48,4 +55,34 @@ class UtilsTestCase(TestCase):
         request.META["REMOTE_ADDR"] = "2001:db8::1"
         
         ip = get_ip_address(request)
-        self.assertEqual(ip, "2001:db8::1")
\ No newline at end of file
+        self.assertEqual(ip, "2001:db8::1")
+
+    def test_get_request_size(self):
+        """Test getting the request body size from Content-Length."""
+        request = self.factory.post("/", data="abc", content_type="text/plain")
+        self.assertEqual(get_request_size(request), 3)
+
+        self.assertEqual(get_request_size(self.factory.get("/")), 0)
+
+        request.META["CONTENT_LENGTH"] = "invalid"
+        self.assertIsNone(get_request_size(request))
+
+    def test_get_response_size(self):
+        """Test getting the response body size without consuming streams."""
+        self.assertEqual(get_response_size(HttpResponse(b"hello")), 5)
+
+        response = HttpResponse(b"hello")
+        response["Content-Length"] = "42"
+        self.assertEqual(get_response_size(response), 42)
+
+        self.assertIsNone(get_response_size(StreamingHttpResponse(iter([b"a"]))))
+
+    def test_get_route_pattern(self):
+        """Test getting the URL pattern the request was resolved to."""
+        request = self.factory.get("/admin/auth/user/1/change/")
+        self.assertIsNone(get_route_pattern(request))
+
+        request.resolver_match = resolve("/admin/auth/user/1/change/")
+        self.assertEqual(
+            get_route_pattern(request), "admin/auth/user/<path:object_id>/change/"
+        )
@@ -0,0 +1,109 @@
+from datetime import datetime, timezone as dt_timezone
+
+import msgpack
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+
+from request_track.wire import (
+    FIELDS,
+    decode_log,
+    encode_log,
+    get_compression,
+    pack_frame,
+    unpack_entries,
+)
+
+
+class WireTestCase(SimpleTestCase):
+    def setUp(self):
+        self.log = {
+            "ip_id": "192.168.1.1",
+            "user_id": 7,
+            "method": "GET",
+            "route": "/orders/1/",
+            "pattern": "orders/<int:pk>/",
+            "status_code": 200,
+            "user_agent": "Test Agent",
+            "query_params": "page=2",
+            "headers": {"accept": "application/json"},
+            "app_name": None,
+            "requested_at": datetime(
+                2024, 1, 1, 12, 0, 0, 123456, tzinfo=dt_timezone.utc
+            ),
+            "duration": 1500,
+            "response_size": 512,
+            "request_size": 0,
+        }
+
+    def test_round_trip(self):
+        """Test that a log survives encoding, packing and decoding."""
+        decoded = decode_log(msgpack.loads(msgpack.dumps(encode_log(self.log))))
+
+        self.assertEqual(decoded, {**self.log, "ip_address": None})
+        self.assertEqual(set(decoded), set(FIELDS))
+
+    def test_record_is_positional_and_smaller(self):
+        """Test that records carry no key strings and an integer timestamp."""
+        record = encode_log(self.log)
+        legacy = {**self.log, "requested_at": self.log["requested_at"].isoformat()}
+
+        self.assertEqual(record[0], 1)
+        self.assertEqual(record[FIELDS.index("method") + 1], 0)
+        self.assertEqual(record[FIELDS.index("requested_at") + 1], 1704110400123456)
+        self.assertLess(len(msgpack.dumps(record)), len(msgpack.dumps(legacy)) * 0.6)
+
+    def test_uncommon_method(self):
+        """Test that methods without a code are sent as strings."""
+        decoded = decode_log(encode_log({**self.log, "method": "PROPFIND"}))
+
+        self.assertEqual(decoded["method"], "PROPFIND")
+
+    def test_legacy_dict_entries(self):
+        """Test that dict entries buffered by older versions are still decoded."""
+        legacy = {**self.log, "requested_at": "2024-01-01T12:00:00+00:00"}
+
+        self.assertEqual(decode_log(msgpack.loads(msgpack.dumps(legacy))), legacy)
+
+    def test_unknown_keys_are_kept(self):
+        """Test that logs with extra keys fall back to a dict record."""
+        log = {**self.log, "extra": "value"}
+
+        record = encode_log(log)
+
+        self.assertIsInstance(record, dict)
+        self.assertEqual(decode_log(msgpack.loads(msgpack.dumps(record))), log)
+
+    def test_naive_datetime(self):
+        """Test that naive datetimes are sent as ISO strings."""
+        log = {**self.log, "requested_at": datetime(2024, 1, 1, 12, 0)}
+
+        decoded = decode_log(msgpack.loads(msgpack.dumps(encode_log(log))))
+
+        self.assertEqual(decoded["requested_at"], "2024-01-01T12:00:00")
+
+    def test_unknown_version(self):
+        """Test that records of an unknown format version are rejected."""
+        with self.assertRaises(ValueError):
+            decode_log([99, *[None] * len(FIELDS)])
+
+    def test_frames(self):
+        """Test that frames hold many entries in a fraction of their size."""
+        entries = [
+            msgpack.dumps(encode_log({**self.log, "user_id": i})) for i in range(100)
+        ]
+
+        frame = pack_frame(entries, "zlib")
+
+        self.assertEqual(unpack_entries(frame), entries)
+        self.assertLess(len(frame), sum(map(len, entries)) / 5)
+        self.assertEqual(unpack_entries(entries[0]), [entries[0]])
+
+    def test_get_compression(self):
+        """Test that unknown compressions are rejected."""
+        with override_settings(REQUEST_TRACK_SETTINGS={}):
+            self.assertIsNone(get_compression())
+        with override_settings(REQUEST_TRACK_SETTINGS={"REDIS_COMPRESSION": "zlib"}):
+            self.assertEqual(get_compression(), "zlib")
+        with override_settings(REQUEST_TRACK_SETTINGS={"REDIS_COMPRESSION": "lz4"}):
+            with self.assertRaises(ImproperlyConfigured):
+                get_compression()
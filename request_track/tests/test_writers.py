@@ -0,0 +1,261 @@
+from datetime import datetime, timezone as dt_timezone
+from unittest import mock
+
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from request_track.cache import forget_known_rows, get_ip_cache, get_pattern_cache
+from request_track.models import (
+    HeaderSet,
+    IpAddress,
+    RequestLog,
+    RequestLogRollup,
+    RoutePattern,
+    UserAgent,
+)
+from request_track.rollups import save_rollups
+from request_track.tests.utils import make_log
+from request_track.writers import (
+    CopyLogWriter,
+    OrmLogWriter,
+    RawLogWriter,
+    awrite_logs,
+    format_copy_rows,
+    get_log_writer,
+    write_logs,
+)
+
+
+class WritersTestCase(TestCase):
+    def test_write_logs(self):
+        """Test that logs and their missing IPs are written in bulk."""
+        IpAddress.objects.create(ip="192.168.1.1")
+        logs = [make_log(), make_log(ip_id="10.0.0.1"), make_log()]
+
+        self.assertEqual(write_logs(logs), 3)
+
+        self.assertEqual(RequestLog.objects.count(), 3)
+        self.assertEqual(IpAddress.objects.count(), 2)
+        self.assertEqual(RequestLog.objects.filter(ip_id="10.0.0.1").count(), 1)
+
+    def test_write_logs_empty(self):
+        """Test that an empty batch does nothing."""
+        self.assertEqual(write_logs([]), 0)
+        self.assertEqual(RequestLog.objects.count(), 0)
+
+    def test_write_logs_with_patterns(self):
+        """Test that patterns are stored once and logs reference them by id."""
+        logs = [
+            make_log(route="/orders/1/", pattern="orders/<int:pk>/"),
+            make_log(route="/orders/2/", pattern="orders/<int:pk>/"),
+            make_log(route="/missing/", pattern=None),
+        ]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            write_logs(logs)
+
+        pattern = RoutePattern.objects.get()
+        self.assertEqual(pattern.pattern, "orders/<int:pk>/")
+        self.assertEqual(RequestLog.objects.filter(pattern=pattern).count(), 2)
+        self.assertTrue(RequestLog.objects.filter(pattern=None).exists())
+
+        # Known patterns are served from the cache
+        with self.assertNumQueries(1):
+            write_logs([make_log(pattern="orders/<int:pk>/")])
+        self.assertEqual(RequestLog.objects.filter(pattern=pattern).count(), 3)
+
+    @override_settings(
+        REQUEST_TRACK_SETTINGS={
+            "USE_USER_AGENT_MODEL": True,
+            "USE_HEADER_SET_MODEL": True,
+        }
+    )
+    def test_write_logs_with_interned_strings(self):
+        """Test that user agents and header sets are stored once per value."""
+        logs = [
+            make_log(headers={"accept": "text/html", "dnt": "1"}),
+            make_log(headers={"dnt": "1", "accept": "text/html"}),
+            make_log(user_agent="Other Agent", headers={}),
+        ]
+
+        write_logs(logs)
+
+        self.assertEqual(UserAgent.objects.count(), 2)
+        self.assertEqual(HeaderSet.objects.count(), 2)
+        log = RequestLog.objects.order_by("id").first()
+        self.assertEqual(log.user_agent, "")
+        self.assertIsNone(log.headers)
+        self.assertEqual(log.effective_user_agent, "Test Agent")
+        self.assertEqual(log.effective_headers, {"accept": "text/html", "dnt": "1"})
+        self.assertEqual(RequestLog.objects.filter(header_set=log.header_set).count(), 2)
+
+    @override_settings(REQUEST_TRACK_SETTINGS={"USE_USER_AGENT_MODEL": True})
+    def test_interned_row_not_read_back(self):
+        """Test that a value missing from the read back does not fail the batch."""
+        # e.g. a row deleted concurrently, or folded by the database collation
+        with mock.patch.object(
+            UserAgent.objects, "filter", return_value=UserAgent.objects.none()
+        ), mock.patch.object(
+            RoutePattern.objects, "filter", return_value=RoutePattern.objects.none()
+        ):
+            write_logs([make_log(pattern="orders/<int:pk>/")])
+
+        log = RequestLog.objects.get()
+        self.assertIsNone(log.agent_id)
+        self.assertEqual(log.user_agent, "Test Agent")
+        self.assertIsNone(log.pattern_id)
+
+    def test_interned_strings_disabled(self):
+        """Test that user agents and headers are stored inline by default."""
+        write_logs([make_log(headers={"dnt": "1"})])
+
+        log = RequestLog.objects.get()
+        self.assertEqual((log.user_agent, log.headers), ("Test Agent", {"dnt": "1"}))
+        self.assertIsNone(log.agent_id)
+        self.assertEqual(log.effective_user_agent, "Test Agent")
+        self.assertFalse(UserAgent.objects.exists())
+
+    async def test_awrite_logs(self):
+        """Test that the async writer saves logs and creates missing IPs."""
+        logs = [make_log(), make_log(ip_id="10.0.0.1")]
+
+        self.assertEqual(await awrite_logs(logs), 2)
+
+        self.assertEqual(await RequestLog.objects.acount(), 2)
+        self.assertEqual(await IpAddress.objects.acount(), 2)
+
+    async def test_awrite_logs_with_patterns(self):
+        """Test that the async writer resolves patterns to their ids."""
+        logs = [make_log(pattern="orders/<int:pk>/")]
+
+        await awrite_logs(logs)
+
+        log = await RequestLog.objects.select_related("pattern").aget()
+        self.assertEqual(log.pattern.pattern, "orders/<int:pk>/")
+
+    @override_settings(REQUEST_TRACK_SETTINGS={"USE_USER_AGENT_MODEL": True})
+    async def test_awrite_logs_with_user_agents(self):
+        """Test that the async writer resolves user agents to their ids."""
+        await awrite_logs([make_log()])
+
+        log = await RequestLog.objects.select_related("agent").aget()
+        self.assertEqual(log.agent.agent, "Test Agent")
+
+
+class LogWriterTestCase(TestCase):
+    def test_get_log_writer(self):
+        """Test that LOG_WRITER selects the writer and auto picks raw on SQLite."""
+        with override_settings(REQUEST_TRACK_SETTINGS={}):
+            self.assertIsInstance(get_log_writer(), RawLogWriter)
+            self.assertNotIsInstance(get_log_writer(), CopyLogWriter)
+        with override_settings(REQUEST_TRACK_SETTINGS={"LOG_WRITER": "orm"}):
+            self.assertIsInstance(get_log_writer(), OrmLogWriter)
+        with override_settings(REQUEST_TRACK_SETTINGS={"LOG_WRITER": "copy"}):
+            self.assertIsInstance(get_log_writer(), CopyLogWriter)
+        with override_settings(
+            REQUEST_TRACK_SETTINGS={"LOG_WRITER": "request_track.writers.OrmLogWriter"}
+        ):
+            self.assertIsInstance(get_log_writer(), OrmLogWriter)
+
+    @override_settings(REQUEST_TRACK_SETTINGS={"LOG_WRITER": "copy"})
+    def test_copy_writer_falls_back_to_raw(self):
+        """Test that the COPY writer uses raw inserts on databases other than PostgreSQL."""
+        logs = [
+            {"ip_address": "10.0.0.1", "method": "GET", "route": "/", "status_code": 200}
+            for _ in range(CopyLogWriter.min_rows)
+        ]
+        with mock.patch.object(RawLogWriter, "insert") as mock_insert:
+            write_logs(logs, batch_size=50)
+
+        mock_insert.assert_called_once_with(logs, 50)
+
+    def test_raw_writer(self):
+        """Test that raw inserts store the same values as the ORM, in chunks."""
+        IpAddress.objects.create(ip="10.0.0.1")
+        logs = [
+            {
+                "ip_id": "10.0.0.1",
+                "method": "POST",
+                "route": f"/items/{i}/",
+                "status_code": 201,
+                "user_agent": "Test Agent",
+                "requested_at": "2024-01-01T12:00:00+00:00",
+                "headers": {"Host": "example.com"},
+            }
+            for i in range(250)
+        ]
+
+        RawLogWriter("default").insert(logs, batch_size=100)
+
+        self.assertEqual(RequestLog.objects.count(), 250)
+        log = RequestLog.objects.get(route="/items/7/")
+        self.assertEqual(log.ip_id, "10.0.0.1")
+        self.assertIsNone(log.user_id)
+        self.assertEqual(log.query_params, "")
+        self.assertEqual(log.headers, {"Host": "example.com"})
+        self.assertEqual(
+            log.requested_at, datetime(2024, 1, 1, 12, tzinfo=dt_timezone.utc)
+        )
+
+    def test_copy_row(self):
+        """Test that log dicts become column tuples with defaults and JSON encoded."""
+        writer = CopyLogWriter("default")
+        columns = [field.attname for field in writer.fields]
+
+        row = dict(zip(columns, writer.row({
+            "ip_id": "10.0.0.1",
+            "method": "GET",
+            "route": "/",
+            "status_code": 200,
+            "requested_at": "2024-01-01T12:00:00+00:00",
+            "headers": {"Host": "example.com"},
+        })))
+
+        self.assertEqual(row["ip_id"], "10.0.0.1")
+        self.assertIsNone(row["user_id"])
+        self.assertEqual(row["headers"], '{"Host": "example.com"}')
+        self.assertEqual(
+            row["requested_at"], datetime(2024, 1, 1, 12, tzinfo=dt_timezone.utc)
+        )
+
+    def test_format_copy_rows(self):
+        """Test the COPY text format escaping."""
+        requested_at = datetime(2024, 1, 1, 12, tzinfo=dt_timezone.utc)
+        text = format_copy_rows([
+            ("a\tb\nc\\d", None, True, requested_at, 200),
+        ])
+
+        self.assertEqual(
+            text, "a\\tb\\nc\\\\d\t\\N\tt\t2024-01-01T12:00:00+00:00\t200\n"
+        )
+
+
+class StaleCacheTestCase(TransactionTestCase):
+    def test_rows_deleted_by_another_process(self):
+        """Test that ids cached for rows deleted elsewhere are dropped and retried."""
+        # Rows another process deleted without this one knowing
+        get_ip_cache().add(["10.0.0.1"])
+        get_pattern_cache().add_ids({"orders/<int:pk>/": 999})
+
+        log = make_log(ip_id="10.0.0.1", pattern="orders/<int:pk>/")
+        self.assertEqual(write_logs([log]), 1)
+
+        log = RequestLog.objects.get()
+        self.assertEqual(log.ip_id, "10.0.0.1")
+        self.assertEqual(log.pattern.pattern, "orders/<int:pk>/")
+        self.assertTrue(IpAddress.objects.filter(ip="10.0.0.1").exists())
+
+    def test_retry_rolls_back_aggregates(self):
+        """Test that aggregates saved with a failed attempt are not counted twice."""
+        get_pattern_cache().add_ids({"orders/<int:pk>/": 999})
+
+        with mock.patch(
+            "request_track.writers.forget_known_rows", wraps=forget_known_rows
+        ) as mock_forget:
+            write_logs(
+                [make_log(ip_id="10.0.0.1", pattern="orders/<int:pk>/")],
+                aggregates=[save_rollups],
+            )
+
+        mock_forget.assert_called_once_with()
+        self.assertEqual(RequestLogRollup.objects.get().count, 1)
+        self.assertEqual(RequestLog.objects.count(), 1)
@@ -0,0 +1,19 @@
+from django.utils import timezone
+
+
+def make_log(**overrides):
+    """Return a log dict as produced by ``params_request``, with overrides."""
+    log = {
+        "ip_id": "192.168.1.1",
+        "user_id": None,
+        "method": "GET",
+        "route": "/test/",
+        "status_code": 200,
+        "user_agent": "Test Agent",
+        "query_params": "",
+        "requested_at": timezone.now(),
+        "app_name": None,
+        "headers": {},
+    }
+    log.update(overrides)
+    return log
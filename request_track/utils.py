@@ -2,7 +2,17 @@
 Utility functions for request logging.
 """
 
-from django.http import HttpRequest
+import operator
+from datetime import datetime
+from functools import reduce
+from typing import Any, Iterator, Sequence
+
+from django.db.models import Model, Q, QuerySet
+from django.http import HttpRequest, HttpResponse
+
+# Maximum number of keys per locking query, 5 fields each stay well below the
+# query parameter limit of SQLite
+LOCK_BATCH_SIZE = 100
 
 
 def get_ip_address(request: HttpRequest) -> str:
@@ -20,3 +30,100 @@ def get_ip_address(request: HttpRequest) -> str:
         return x_forwarded_for.split(",")[0].strip()
 
     return request.META.get("REMOTE_ADDR", "")
+
+
+def get_route_pattern(request: HttpRequest) -> str | None:
+    """
+    Return the URL pattern the request was resolved to.
+
+    Args:
+        request: The Django HttpRequest object, after the view ran
+
+    Returns:
+        The pattern (e.g. ``orders/<int:pk>/``), the view name for patterns
+        without a route, or None if the path did not resolve
+    """
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return None
+    return match.route or match.view_name or None
+
+
+def get_request_size(request: HttpRequest) -> int | None:
+    """
+    Return the size of the request body from its ``Content-Length`` header.
+
+    Args:
+        request: The Django HttpRequest object
+
+    Returns:
+        Size in bytes, 0 without a body, or None if the header is invalid
+    """
+    content_length = request.META.get("CONTENT_LENGTH")
+    if not content_length:
+        return 0
+    try:
+        return int(content_length)
+    except ValueError:
+        return None
+
+
+def get_response_size(response: HttpResponse) -> int | None:
+    """
+    Return the size of the response body.
+
+    Uses the ``Content-Length`` header when set, otherwise the length of the
+    content. Streaming responses are not consumed.
+
+    Args:
+        response: The Django HttpResponse object
+
+    Returns:
+        Size in bytes, or None for streaming responses without Content-Length
+    """
+    content_length = response.get("Content-Length")
+    if content_length:
+        try:
+            return int(content_length)
+        except ValueError:
+            pass
+    if getattr(response, "streaming", False):
+        return None
+    return len(response.content)
+
+
+def get_requested_at(log: dict[str, Any]) -> datetime:
+    """Return the ``requested_at`` of a log dict, which is buffered as a string."""
+    requested_at = log["requested_at"]
+    if isinstance(requested_at, str):
+        return datetime.fromisoformat(requested_at)
+    return requested_at
+
+
+def get_log_route(log: dict[str, Any]) -> str:
+    """Return the URL pattern of a log dict, or its path when none resolved."""
+    return log.get("pattern") or log["route"]
+
+
+def lock_rows(
+    queryset: QuerySet, fields: Sequence[str], keys: Sequence[tuple]
+) -> Iterator[Model]:
+    """
+    Lock and yield the rows whose ``fields`` equal one of ``keys``.
+
+    Each query matches the exact key tuples, so rows of other keys that share
+    some field values with the batch are not locked. Keys must be sorted, so
+    concurrent workers lock the rows in the same order and never deadlock.
+
+    Args:
+        queryset: The queryset to lock rows of
+        fields: Names of the key fields, in key tuple order
+        keys: Sorted key tuples
+
+    Returns:
+        Iterator over the locked rows, in key order
+    """
+    for start in range(0, len(keys), LOCK_BATCH_SIZE):
+        chunk = keys[start:start + LOCK_BATCH_SIZE]
+        condition = reduce(operator.or_, (Q(**dict(zip(fields, key))) for key in chunk))
+        yield from queryset.select_for_update().filter(condition).order_by(*fields)
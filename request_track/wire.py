@@ -0,0 +1,185 @@
+"""
+Compact wire format of the log entries buffered in Redis.
+
+A log dict is sent as a msgpack array holding a format version and then the
+values in ``FIELDS`` order, so key strings are not repeated in every entry.
+``requested_at`` becomes an integer of microseconds since the epoch and common
+HTTP methods a small integer code.
+
+Entries written by older versions as plain dicts are still decoded, so a
+buffer can be drained across an upgrade.
+
+With ``REDIS_COMPRESSION`` set, producers push each batch of packed entries as
+a single compressed frame, so repeated user agents, routes and headers are
+stored once per frame instead of once per entry.
+"""
+
+import zlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Any
+
+import msgpack
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import REQUEST_TRACK_SETTINGS
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+WIRE_VERSION = 1
+
+FIELDS = (
+    "ip_id",
+    "ip_address",
+    "user_id",
+    "user_agent",
+    "route",
+    "pattern",
+    "method",
+    "query_params",
+    "status_code",
+    "requested_at",
+    "app_name",
+    "headers",
+    "duration",
+    "response_size",
+    "request_size",
+)
+
+METHODS = ("GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS", "TRACE", "CONNECT")
+
+_FIELD_SET = frozenset(FIELDS)
+_METHOD_CODES = {method: code for code, method in enumerate(METHODS)}
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def encode_log(log: dict[str, Any]) -> list | dict[str, Any]:
+    """
+    Convert a log dict to its msgpack-ready wire record.
+
+    Logs with keys outside ``FIELDS`` are kept as dicts so nothing is lost.
+
+    Args:
+        log: Log dict as produced by ``params_request``
+
+    Returns:
+        ``[WIRE_VERSION, *values]``, or a dict for logs with unknown keys
+    """
+    requested_at = log.get("requested_at")
+    if isinstance(requested_at, datetime):
+        if requested_at.tzinfo is not None:
+            requested_at = (requested_at - _EPOCH) // _MICROSECOND
+        else:
+            # Naive datetimes (USE_TZ = False) keep their local time
+            requested_at = requested_at.isoformat()
+
+    if not _FIELD_SET.issuperset(log):
+        return {**log, "requested_at": requested_at}
+
+    method = log.get("method")
+    record = [WIRE_VERSION]
+    for field in FIELDS:
+        if field == "requested_at":
+            record.append(requested_at)
+        elif field == "method":
+            record.append(_METHOD_CODES.get(method, method))
+        else:
+            record.append(log.get(field))
+    return record
+
+
+def decode_log(record: list | dict[str, Any]) -> dict[str, Any]:
+    """
+    Convert a wire record back to a log dict.
+
+    Args:
+        record: Record produced by ``encode_log``, or a log dict buffered by
+            an older version
+
+    Returns:
+        The log dict
+    """
+    if isinstance(record, dict):
+        log = record
+    else:
+        version, *values = record
+        if version != WIRE_VERSION:
+            raise ValueError(f"Unknown request log wire format version {version!r}")
+        log = dict(zip(FIELDS, values))
+        method = log["method"]
+        if isinstance(method, int):
+            log["method"] = METHODS[method]
+
+    requested_at = log.get("requested_at")
+    if isinstance(requested_at, int):
+        log["requested_at"] = _EPOCH + requested_at * _MICROSECOND
+    return log
+
+
+# 0xc1 is never used by msgpack, so it cannot start a single packed entry
+FRAME_MARKER = b"\xc1"
+
+_ZLIB = b"z"
+_ZSTD = b"s"
+
+
+def get_compression() -> str | None:
+    """Return the configured ``REDIS_COMPRESSION``, or None when disabled."""
+    compression = REQUEST_TRACK_SETTINGS.get("REDIS_COMPRESSION", None)
+    if compression not in (None, "zlib", "zstd"):
+        raise ImproperlyConfigured(
+            f"Unknown REDIS_COMPRESSION {compression!r} in REQUEST_TRACK_SETTINGS. "
+            "Choose one of: zlib, zstd."
+        )
+    if compression == "zstd" and zstandard is None:
+        raise ImproperlyConfigured(
+            "REDIS_COMPRESSION is 'zstd' but the zstandard package is not installed."
+        )
+    return compression
+
+
+def pack_frame(entries: list[bytes], compression: str) -> bytes:
+    """
+    Pack several entries into one compressed frame.
+
+    Args:
+        entries: Packed log entries
+        compression: ``"zlib"`` or ``"zstd"``
+
+    Returns:
+        The frame: marker, codec byte and the compressed msgpack array of entries
+    """
+    payload = msgpack.dumps(entries)
+    if compression == "zstd":
+        return FRAME_MARKER + _ZSTD + zstandard.ZstdCompressor().compress(payload)
+    return FRAME_MARKER + _ZLIB + zlib.compress(payload)
+
+
+def unpack_entries(raw: bytes) -> list[bytes]:
+    """
+    Return the packed entries held by a buffered item.
+
+    Args:
+        raw: A frame built by ``pack_frame`` or a single packed entry
+
+    Returns:
+        The packed entries
+    """
+    if raw[:1] != FRAME_MARKER:
+        return [raw]
+    codec, data = raw[1:2], raw[2:]
+    if codec == _ZSTD:
+        if zstandard is None:
+            raise ImproperlyConfigured(
+                "Found zstd compressed request logs in Redis but the zstandard "
+                "package is not installed."
+            )
+        payload = zstandard.ZstdDecompressor().decompress(data)
+    elif codec == _ZLIB:
+        payload = zlib.decompress(data)
+    else:
+        raise ValueError(f"Unknown request log frame codec {codec!r}")
+    return msgpack.loads(payload)
@@ -0,0 +1,488 @@
+"""
+Database writers for request logs.
+
+``write_logs`` resolves the IP addresses and interned values of a batch and
+hands the rows to a log writer selected by the ``LOG_WRITER`` setting:
+
+- ``"auto"`` (default): ``COPY`` on PostgreSQL, raw multi-row INSERT elsewhere
+- ``"raw"``: multi-row INSERT built straight from the log dicts
+- ``"orm"``: ``bulk_create`` on every database
+- ``"copy"``: ``COPY ... FROM STDIN``, falling back to ``"raw"`` on other databases
+- a dotted path to a custom writer class
+"""
+
+import hashlib
+import io
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from functools import partial
+from typing import Any, Callable, Iterable
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, connections, models, router, transaction
+from django.utils.module_loading import import_string
+
+from .cache import forget_known_rows, get_id_cache, get_ip_cache
+from .models import HeaderSet, IpAddress, RequestLog, RoutePattern, UserAgent
+from .settings import REQUEST_TRACK_SETTINGS
+
+
+class OrmLogWriter:
+    """
+    Insert logs with ``bulk_create``.
+
+    Args:
+        using: Database alias to write to
+    """
+
+    def __init__(self, using: str):
+        self.using = using
+
+    def insert(self, logs: list[dict[str, Any]], batch_size: int | None = None) -> None:
+        RequestLog.objects.using(self.using).bulk_create(
+            [RequestLog(**log) for log in logs], batch_size=batch_size
+        )
+
+
+def _copy_text_value(value: Any) -> str:
+    """Format a value for PostgreSQL's COPY text format."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def format_copy_rows(rows) -> str:
+    """Serialize rows to PostgreSQL's COPY text format."""
+    return "".join(
+        "\t".join(_copy_text_value(value) for value in row) + "\n" for row in rows
+    )
+
+
+class RawLogWriter:
+    """
+    Insert logs with multi-row INSERT statements built from the log dicts.
+
+    Each log is turned straight into a tuple of database values in field order,
+    skipping model instantiation. Values go through each field's
+    ``get_db_prep_save``, so JSON encoding and timezone conversion match the ORM.
+
+    Args:
+        using: Database alias to write to
+    """
+
+    def __init__(self, using: str):
+        self.using = using
+        self.fields = [
+            field for field in RequestLog._meta.concrete_fields if not field.primary_key
+        ]
+
+    def values(self, log: dict[str, Any]):
+        """Yield ``(field, value)`` for each column, using defaults for missing keys."""
+        for field in self.fields:
+            if field.attname in log:
+                yield field, log[field.attname]
+            elif field.name in log:
+                yield field, log[field.name]
+            else:
+                yield field, field.get_default()
+
+    def row(self, log: dict[str, Any]) -> tuple:
+        """Convert a log dict to a tuple of database values."""
+        connection = connections[self.using]
+        return tuple(
+            field.get_db_prep_save(value, connection)
+            for field, value in self.values(log)
+        )
+
+    def insert(self, logs: list[dict[str, Any]], batch_size: int | None = None) -> None:
+        connection = connections[self.using]
+        quote = connection.ops.quote_name
+        max_batch_size = connection.ops.bulk_batch_size(self.fields, logs)
+        batch_size = min(batch_size, max_batch_size) if batch_size else max_batch_size
+
+        prefix = "INSERT INTO {} ({}) VALUES ".format(
+            quote(RequestLog._meta.db_table),
+            ", ".join(quote(field.column) for field in self.fields),
+        )
+        placeholder = "({})".format(", ".join(["%s"] * len(self.fields)))
+        with transaction.atomic(using=self.using, savepoint=False):
+            with connection.cursor() as cursor:
+                for start in range(0, len(logs), batch_size):
+                    chunk = logs[start:start + batch_size]
+                    params = []
+                    for log in chunk:
+                        params.extend(self.row(log))
+                    cursor.execute(
+                        prefix + ", ".join([placeholder] * len(chunk)), params
+                    )
+
+
+class CopyLogWriter(RawLogWriter):
+    """
+    Insert logs on PostgreSQL with ``COPY ... FROM STDIN``.
+
+    Rows are streamed to the server without building model instances or one
+    huge multi-row INSERT. Small batches, where the ORM is just as fast, and
+    databases other than PostgreSQL go through ``RawLogWriter`` instead.
+
+    Args:
+        using: Database alias to write to
+    """
+
+    min_rows = 100
+
+    def row(self, log: dict[str, Any]) -> tuple:
+        """Convert a log dict to a tuple of values COPY can serialize."""
+        values = []
+        for field, value in self.values(log):
+            value = field.get_prep_value(value)
+            if isinstance(field, models.JSONField) and value is not None:
+                value = json.dumps(value, cls=field.encoder)
+            values.append(value)
+        return tuple(values)
+
+    def insert(self, logs: list[dict[str, Any]], batch_size: int | None = None) -> None:
+        connection = connections[self.using]
+        if connection.vendor != "postgresql" or len(logs) < self.min_rows:
+            super().insert(logs, batch_size)
+            return
+
+        quote = connection.ops.quote_name
+        sql = "COPY {} ({}) FROM STDIN".format(
+            quote(RequestLog._meta.db_table),
+            ", ".join(quote(field.column) for field in self.fields),
+        )
+        rows = (self.row(log) for log in logs)
+        with connection.cursor() as cursor:
+            raw_cursor = cursor.cursor
+            if hasattr(raw_cursor, "copy"):
+                # psycopg 3 adapts each value itself
+                with raw_cursor.copy(sql) as copy:
+                    for row in rows:
+                        copy.write_row(row)
+            else:
+                # psycopg2 reads the text format from a file-like object
+                raw_cursor.copy_expert(sql, io.StringIO(format_copy_rows(rows)))
+
+
+LOG_WRITERS = {
+    "orm": OrmLogWriter,
+    "raw": RawLogWriter,
+    "copy": CopyLogWriter,
+}
+
+
+def get_log_writer(using: str | None = None):
+    """
+    Return the log writer selected by the ``LOG_WRITER`` setting.
+
+    Args:
+        using: Database alias, defaults to the router's choice for ``RequestLog``
+
+    Returns:
+        Writer instance with an ``insert(logs, batch_size)`` method
+    """
+    if using is None:
+        using = router.db_for_write(RequestLog)
+    name = REQUEST_TRACK_SETTINGS.get("LOG_WRITER", "auto")
+    if name == "auto":
+        name = "copy" if connections[using].vendor == "postgresql" else "raw"
+    writer_class = LOG_WRITERS.get(name) or import_string(name)
+    return writer_class(using)
+
+
+# Maximum number of IP addresses per conflict-ignoring INSERT
+IP_BATCH_SIZE = 1000
+
+
+def _lock_order(values: Iterable) -> list:
+    """
+    Sort values about to be inserted with a conflict-ignoring INSERT.
+
+    Concurrent workers inserting overlapping values then lock the entries of
+    the unique index in the same order, so they wait for each other instead
+    of deadlocking.
+    """
+    return sorted(values)
+
+
+def _new_ip_addresses(ip_set: set) -> list[IpAddress]:
+    return [IpAddress(ip=ip) for ip in _lock_order(ip_set)]
+
+
+def header_digest(headers: dict) -> str:
+    """Return the SHA-1 of the canonical JSON of a set of headers."""
+    canonical = json.dumps(headers, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode()).hexdigest()
+
+
+@dataclass(frozen=True)
+class InternedColumn:
+    """
+    A log value stored once in a lookup table and referenced by its id.
+
+    Attributes:
+        key: Key of the value in the log dicts
+        attname: Foreign key column of ``RequestLog`` receiving the id
+        model: Lookup table model
+        lookup: Unique field of ``model`` the rows are found by
+        cache_name: Name of the per-process id cache
+        setting: Setting enabling the column, None if always enabled
+        digest: Turns a value into its ``lookup`` value, None to use it as is
+        inline: Whether ``RequestLog`` can store the value itself under ``key``
+            when its row cannot be found
+    """
+
+    key: str
+    attname: str
+    model: type[models.Model]
+    lookup: str
+    cache_name: str
+    setting: str | None = None
+    digest: Callable[[Any], str] | None = None
+    inline: bool = False
+
+    def enabled(self) -> bool:
+        return self.setting is None or REQUEST_TRACK_SETTINGS.get(self.setting, False)
+
+    def lookup_value(self, value: Any) -> Any:
+        return value if self.digest is None else self.digest(value)
+
+    def new_row(self, lookup_value: Any, value: Any) -> models.Model:
+        row = self.model(**{self.lookup: lookup_value})
+        if self.digest is not None:
+            setattr(row, self.key, value)
+        return row
+
+
+INTERNED_COLUMNS = (
+    InternedColumn("pattern", "pattern_id", RoutePattern, "pattern", "pattern"),
+    InternedColumn(
+        "user_agent",
+        "agent_id",
+        UserAgent,
+        "agent",
+        "user_agent",
+        setting="USE_USER_AGENT_MODEL",
+        inline=True,
+    ),
+    InternedColumn(
+        "headers",
+        "header_set_id",
+        HeaderSet,
+        "digest",
+        "header_set",
+        setting="USE_HEADER_SET_MODEL",
+        digest=header_digest,
+        inline=True,
+    ),
+)
+
+
+def _pop_interned(logs: list[dict[str, Any]], column: InternedColumn):
+    # Logs carry the value; the row stores the id of its lookup table row
+    values = [log.pop(column.key, None) for log in logs]
+    lookups = [
+        None if value is None else column.lookup_value(value) for value in values
+    ]
+    cache = get_id_cache(column.cache_name)
+    ids, missing = cache.lookup(lookup for lookup in lookups if lookup is not None)
+    new_rows = {}
+    for lookup, value in zip(lookups, values):
+        if lookup in missing and lookup not in new_rows:
+            new_rows[lookup] = column.new_row(lookup, value)
+    return values, lookups, ids, [new_rows[lookup] for lookup in _lock_order(new_rows)]
+
+
+def _set_interned_ids(
+    logs: list[dict[str, Any]],
+    column: InternedColumn,
+    values: list,
+    lookups: list,
+    ids: dict,
+) -> None:
+    for log, value, lookup in zip(logs, values, lookups):
+        if lookup is None:
+            continue
+        # The read back can miss a row, e.g. one deleted concurrently or
+        # matched by a collation that folds case, accents or trailing spaces
+        pk = ids.get(lookup)
+        if pk is not None:
+            log[column.attname] = pk
+        elif column.inline:
+            log[column.key] = value
+
+
+def resolve_interned(logs: list[dict[str, Any]]) -> None:
+    """
+    Replace interned values of each log dict with the id of their row.
+
+    URL patterns are always interned; user agents and header sets when
+    ``USE_USER_AGENT_MODEL`` and ``USE_HEADER_SET_MODEL`` are enabled. Values
+    not in the per-process caches are inserted with a conflict-ignoring insert
+    and their ids read back in one query per table. Values whose row is not
+    read back are kept in the log row for user agents and headers and left
+    out for patterns, instead of failing the batch.
+
+    Args:
+        logs: Log dicts as produced by ``params_request``, changed in place
+    """
+    for column in INTERNED_COLUMNS:
+        if not column.enabled():
+            continue
+        values, lookups, ids, new_rows = _pop_interned(logs, column)
+        if new_rows:
+            column.model.objects.bulk_create(new_rows, ignore_conflicts=True)
+            missing = [getattr(row, column.lookup) for row in new_rows]
+            new_ids = dict(
+                column.model.objects.filter(
+                    **{f"{column.lookup}__in": missing}
+                ).values_list(column.lookup, "id")
+            )
+            ids.update(new_ids)
+            cache = get_id_cache(column.cache_name)
+            transaction.on_commit(partial(cache.add_ids, new_ids))
+        _set_interned_ids(logs, column, values, lookups, ids)
+
+
+async def aresolve_interned(logs: list[dict[str, Any]]) -> None:
+    """Async version of ``resolve_interned``."""
+    for column in INTERNED_COLUMNS:
+        if not column.enabled():
+            continue
+        values, lookups, ids, new_rows = _pop_interned(logs, column)
+        if new_rows:
+            await column.model.objects.abulk_create(new_rows, ignore_conflicts=True)
+            missing = [getattr(row, column.lookup) for row in new_rows]
+            new_ids = {
+                lookup: pk
+                async for lookup, pk in column.model.objects.filter(
+                    **{f"{column.lookup}__in": missing}
+                ).values_list(column.lookup, "id")
+            }
+            ids.update(new_ids)
+            cache = get_id_cache(column.cache_name)
+            await sync_to_async(transaction.on_commit)(partial(cache.add_ids, new_ids))
+        _set_interned_ids(logs, column, values, lookups, ids)
+
+
+def _write_logs(logs: list[dict[str, Any]], batch_size: int | None) -> None:
+    # Extract unique IPs (if exists ip_id) that are not known to exist
+    ip_cache = get_ip_cache()
+    ip_set = ip_cache.missing(log["ip_id"] for log in logs if log.get("ip_id"))
+
+    # Insert them all, the unique constraint skips IPs that already exist
+    if ip_set:
+        IpAddress.objects.bulk_create(
+            _new_ip_addresses(ip_set), batch_size=IP_BATCH_SIZE, ignore_conflicts=True
+        )
+
+        # Only trust the cache once the rows are committed
+        transaction.on_commit(lambda: ip_cache.add(ip_set))
+
+    resolve_interned(logs)
+    get_log_writer().insert(logs, batch_size=batch_size)
+
+
+def write_logs(
+    logs: list[dict[str, Any]],
+    batch_size: int | None = None,
+    aggregates: Iterable[Callable[[list[dict[str, Any]]], Any]] = (),
+) -> int:
+    """
+    Save a batch of log dicts to the database.
+
+    IP addresses referenced through ``ip_id`` are upserted first with a
+    conflict-ignoring insert and interned values (URL patterns, optionally user
+    agents and header sets) are swapped for their ids, then all logs are
+    inserted by the configured log writer. Values already known to exist are
+    served from per-process caches and not sent to the database at all.
+
+    Outside of a transaction the batch is written in one, and if it fails on a
+    foreign key, the caches are emptied with ``forget_known_rows`` and the
+    batch is written once more. Inside a transaction the error is left to the
+    caller.
+
+    Args:
+        logs: Log dicts as produced by ``params_request``
+        batch_size: Maximum number of rows per INSERT statement
+        aggregates: Functions saving aggregates of the logs (e.g.
+            ``save_rollups``) in the same transaction, before the interned
+            values are swapped for their ids
+
+    Returns:
+        Number of logs written
+    """
+    if not logs:
+        return 0
+
+    connection = connections[router.db_for_write(RequestLog)]
+    if connection.in_atomic_block:
+        for save in aggregates:
+            save(logs)
+        _write_logs(logs, batch_size)
+        return len(logs)
+
+    aggregates = list(aggregates)
+    originals = [dict(log) for log in logs]
+    try:
+        with transaction.atomic(using=connection.alias):
+            for save in aggregates:
+                save(logs)
+            _write_logs(logs, batch_size)
+    except IntegrityError:
+        forget_known_rows()
+        with transaction.atomic(using=connection.alias):
+            for save in aggregates:
+                save(originals)
+            _write_logs(originals, batch_size)
+    return len(logs)
+
+
+async def _awrite_logs(logs: list[dict[str, Any]]) -> None:
+    ip_cache = get_ip_cache()
+    ip_set = ip_cache.missing(log["ip_id"] for log in logs if log.get("ip_id"))
+    if ip_set:
+        await IpAddress.objects.abulk_create(
+            _new_ip_addresses(ip_set), batch_size=IP_BATCH_SIZE, ignore_conflicts=True
+        )
+        await sync_to_async(transaction.on_commit)(lambda: ip_cache.add(ip_set))
+
+    await aresolve_interned(logs)
+    await RequestLog.objects.abulk_create([RequestLog(**log) for log in logs])
+
+
+async def awrite_logs(logs: list[dict[str, Any]]) -> int:
+    """
+    Async version of ``write_logs``.
+
+    Uses the ORM's async bulk methods so a whole batch costs a couple of
+    executor hops instead of two per log.
+
+    Args:
+        logs: Log dicts as produced by ``params_request``
+
+    Returns:
+        Number of logs written
+    """
+    if not logs:
+        return 0
+
+    originals = [dict(log) for log in logs]
+    try:
+        await _awrite_logs(logs)
+    except IntegrityError:
+        forget_known_rows()
+        await _awrite_logs(originals)
+    return len(logs)
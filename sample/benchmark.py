@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark of the per-request work of the logging middleware.
+
+Times building the log dict of a request (``params_request``) and packing it
+for the Redis buffer, in microseconds per request. ``legacy_params_request``
+reproduces the path the middleware took before the log extractor (re-encoding
+``request.GET`` and reading the settings on every request), so both can be
+compared on the same machine.
+
+Usage: python benchmark.py [--number N]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+import msgpack  # noqa: E402
+from django.contrib.auth.models import AnonymousUser  # noqa: E402
+from django.http import HttpResponse  # noqa: E402
+from django.test import RequestFactory, override_settings  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from request_track.middleware import params_request  # noqa: E402
+from request_track.settings import REQUEST_TRACK_SETTINGS  # noqa: E402
+from request_track.utils import (  # noqa: E402
+    get_ip_address,
+    get_request_size,
+    get_response_size,
+    get_route_pattern,
+)
+from request_track.wire import encode_log  # noqa: E402
+
+SETTINGS = {
+    "HEADERS_TO_LOG": ["accept", "accept-language", "sec-ch-ua-platform", "referer"],
+    "USE_IP_ADDRESS_MODEL": True,
+}
+
+
+def make_request():
+    return RequestFactory().get(
+        "/orders/42/",
+        {"page": "2", "sort": "-created", "q": "blue shoes"},
+        HTTP_USER_AGENT="Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/120.0 Safari/537.36",
+        HTTP_ACCEPT="text/html,application/xhtml+xml",
+        HTTP_ACCEPT_LANGUAGE="en-US,en;q=0.9",
+        HTTP_SEC_CH_UA_PLATFORM='"Linux"',
+        HTTP_X_FORWARDED_FOR="203.0.113.7, 10.0.0.1",
+    )
+
+
+def legacy_params_request(request, response, user, duration=None):
+    """Build the log dict the way the middleware did before the extractor."""
+    headers = {}
+    for header in REQUEST_TRACK_SETTINGS.get("HEADERS_TO_LOG", []):
+        value = request.META.get(f"HTTP_{header.upper().replace('-', '_')}")
+        if value:
+            headers[header] = value
+    log_params = {
+        "user_id": user.pk if user.is_authenticated else None,
+        "method": request.method,
+        "route": request.path,
+        "pattern": get_route_pattern(request),
+        "status_code": response.status_code,
+        "user_agent": request.META.get("HTTP_USER_AGENT", "")[:300],
+        "query_params": request.GET.urlencode(),
+        "headers": headers,
+        "app_name": getattr(request, "current_app", None),
+        "requested_at": timezone.now(),
+        "duration": duration,
+        "response_size": get_response_size(response),
+        "request_size": get_request_size(request),
+    }
+    ip = get_ip_address(request)
+    if REQUEST_TRACK_SETTINGS.get("USE_IP_ADDRESS_MODEL", True):
+        log_params["ip_id"] = ip
+    else:
+        log_params["ip_address"] = ip
+    return log_params
+
+
+def measure(stmt, number: int) -> float:
+    """Return the best time of 5 runs in microseconds per call."""
+    return min(timeit.repeat(stmt, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--number", type=int, default=20000)
+    number = parser.parse_args().number
+
+    request = make_request()
+    response = HttpResponse(b"x" * 512)
+    user = AnonymousUser()
+
+    def timings(build):
+        def extract():
+            # Drop the parsed query string, as every request comes with a fresh one
+            request.__dict__.pop("GET", None)
+            return build(request, response, user, 1500)
+
+        extract()
+        return (
+            measure(extract, number),
+            measure(lambda: msgpack.dumps(encode_log(extract())), number),
+        )
+
+    with override_settings(REQUEST_TRACK_SETTINGS=SETTINGS):
+        results = {
+            "legacy_params_request": timings(legacy_params_request),
+            "params_request": timings(params_request),
+        }
+
+    for name, (extract_time, pack_time) in results.items():
+        print(f"{name + ':':<33}{extract_time:6.2f} us/request")
+        print(f"{name + ' + packing:':<33}{pack_time:6.2f} us/request")
+
+
+if __name__ == "__main__":
+    main()